@@ -10,13 +10,32 @@ from transformers import pipeline
 
 
 # Importações corrigidas para LangChain e DeepSeek
-from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-from langchain_community.embeddings import HuggingFaceEmbeddings # Usado para embeddings
-from langchain_deepseek import ChatDeepSeek # Usar ChatDeepSeek para o LLM
 
+import html
 import json
+import os
+
+import associations
+import ingest
+import linkage
+import retrieval
+import shared_store
+import similarity
+import spatial
+import themes
+import warm_cache
+from data_pipeline import DEFAULT_MUNICIPIO, MUNICIPIOS, apply_filters, export_frame
+from waves import TRANSITIONS, compare_waves, link_report, link_waves, summarize_comparison
+from embeddings import embedding_name, get_embeddings
+from llm_backends import DEFAULT_LLM_BACKEND, get_llm, requires_api_key
+from column_index import ColumnIndex
+from context_builder import data_version
+from chat_history import ChatHistory, FigureCache, figure_key
+from prompt_budget import BudgetedQA
+from dtype_optimizer import count_yes, is_measure, yes_no_labels
+from tab_figures import TERRACOTA_PALETTE, tab_figure
+
 # Configuração inicial
 st.set_page_config(
     page_title="Dashboard de Produção de Mandioca - Juruti",
@@ -24,165 +43,258 @@ st.set_page_config(
     layout="wide",
 )
 
-# Carregar dados
-@st.cache_data
-def load_data():
-    # Substitua pelo caminho do seu arquivo
-    df = pd.read_csv('Backup_Juriti.csv', delimiter=',', encoding='utf-8')
-    
-    # Verificar e corrigir nomes de colunas
-    col_mapping = {
-        'Tamanho da Propriedade (ha)': 'Tamanho_Propriedade_ha',
-        'Tamanho da área produtiva (ha)': 'Tamanho_Area_Produtiva_ha',
-        'Tamanho da área plantada (ha)': 'Tamanho_Area_Plantada_ha',
-        'Qual a renda familiar absoluta/mês em R$?': 'Renda_Familiar',
-        'Qual(s) variedade(s) de MANDIOCA?': 'Variedades_Mandioca',
-        'Com quantos meses colhe a MANDIOCA?': 'Meses_Colheita_Mandioca',
-        'Já teve problema com pragas na mandioca/macaxeira???': 'Teve_Problema_Pragas',
-        'Se sim, quais produtos são comercializados?': 'Produtos_Comercializados',
-        'Onde é comercializado os produtos?': 'Local_Comercializacao',
-        'Qual o preço médio de farinha atualmente (kg)?': 'Preco_Farinha',
-        'Quais as dificuldades encontradas na COMERCIALIZAÇÃO da farinha e derivados?': 'Dificuldades_Comercializacao',
-        'Quais as principais dificuldades no cultivo mandioca/macaxeira ?': 'Dificuldades_Cultivo',
-        'Realiza adubação?': 'Adubacao',
-        'Quais as principais dificuldades no PROESSAMENTO da mandioca/macaxeira?': 'Dificuldades_Processamento',
-        'Recebe algum tipo de assistência técnica?': 'Assistencia_Tecnica',
-        'Qual tamanho da área destinada ao plantio de MANDIOCA (ha)?': 'Area_Mandioca_ha',
-        'Qual tamanho da área destinada ao plantio de MACAXEIRA (ha)?': 'Area_Macaxeira_ha',
-        'Comunidade':'Comunidade',
-        'Qual o preço médio de farinha atualmente (kg)?': 'Preco_Farinha',
-        'Quanto tempo demora o processo de produção de farinha e outros derivados (da colheita até venda)?':'Tempo_Producao_Dias'
-    }
+# Carregar dados: o questionário pré-processado vem do armazenamento
+# incremental (ingest.py), é publicado uma vez por nó e mapeado em memória por
+# todos os processos do app (ver shared_store.py); cache_resource evita uma
+# cópia por sessão. Só as partições do município e da onda escolhidos são
+# lidas, e a chave muda quando uma nova exportação deles é ingerida.
+@st.cache_resource(max_entries=4)
+def get_survey(data_key, municipio, onda):
+    return shared_store.shared_survey(municipios=[municipio], ondas=[onda])
+
+# Comparação entre duas ondas (waves.py), calculada uma vez por par; as chaves
+# dos dados de cada onda invalidam o resultado quando elas são reingeridas
+@st.cache_data(max_entries=16)
+def get_wave_comparison(key_antes, key_depois, municipio, onda_antes, onda_depois):
+    before = shared_store.shared_survey(municipios=[municipio], ondas=[onda_antes])
+    after = shared_store.shared_survey(municipios=[municipio], ondas=[onda_depois])
+    links = link_waves(before, after)
+    pairs = compare_waves(before, after, links)
+    return pairs, link_report(links, before, after)
+
+# Vínculos dos produtores das coordenadas e da rede com as entrevistas
+# (linkage.py), recalculados só quando os dados mudam
+@st.cache_data(max_entries=4)
+def get_link_table(data_key, municipio, onda):
+    coordenadas = MUNICIPIOS.get(municipio, {}).get('coordenadas') or ''
+    return linkage.load_link_table(get_survey(data_key, municipio, onda), coordinates_path=coordenadas)
+
+# Hexágonos do mapa com as médias dos indicadores (spatial.grid_layers), um
+# resultado por combinação de filtros: só as células vão para o navegador
+@st.cache_data(max_entries=32)
+def get_map_grid(data_key, municipio, onda, comunidades, genero, tipo_cultivo, idade_range):
+    mapa_municipio = MUNICIPIOS[municipio]
+    filtrado = apply_filters(get_survey(data_key, municipio, onda), list(comunidades), list(genero),
+                             list(tipo_cultivo), idade_range)
+    points = spatial.producer_points(pd.read_csv(mapa_municipio['coordenadas']), filtrado,
+                                     get_link_table(data_key, municipio, onda))
+    points = points[points['chave'].isin(ingest.interview_keys(filtrado))]
+    return spatial.grid_layers(points, ref_lat=mapa_municipio['centro'][0])
+
+# Associações entre todas as perguntas (associations.py), uma matriz por
+# combinação de filtros; o chat usa a dos dados sem filtro, que vem do
+# retrato em disco quando existe (warm_cache.py)
+@st.cache_resource(max_entries=16)
+def get_associations(data_key, municipio, onda, comunidades=(), genero=(), tipo_cultivo=(), idade_range=None):
+    df = get_survey(data_key, municipio, onda)
+    if not (comunidades or genero or tipo_cultivo or idade_range):
+        return warm_cache.snapshot('associacoes', data_key, municipio, onda, df)
+    filtrado = apply_filters(df, list(comunidades), list(genero), list(tipo_cultivo), idade_range)
+    return associations.AssociationMatrix(filtrado)
+
+# Vetores de respostas para a busca de produtores parecidos (similarity.py);
+# os filtros da barra lateral só restringem os vizinhos
+@st.cache_resource(max_entries=4)
+def get_producer_index(data_key, municipio, onda):
+    return warm_cache.snapshot('produtores', data_key, municipio, onda, get_survey(data_key, municipio, onda))
+
+# Modelo de embeddings, carregado uma vez por processo para o chat e os temas
+@st.cache_resource
+def get_embedding_model():
+    return get_embeddings()
+
+# Temas das respostas abertas (themes.py): os vetores das respostas ficam em
+# cache no disco, então dados novos só codificam as respostas novas
+@st.cache_resource
+def get_embedding_cache():
+    return themes.EmbeddingCache(get_embedding_model(), embedding_name())
+
+@st.cache_data(max_entries=32)
+def get_themes(data_key, municipio, onda, pergunta, n_temas):
+    return themes.column_themes(get_survey(data_key, municipio, onda), pergunta, get_embedding_cache(), k=n_temas)
+
+# Respostas do questionário mostradas no popup de cada propriedade do mapa
+CAMPOS_POPUP_MAPA = {
+    'Idade': 'Idade',
+    'Cultivo': 'Cultiva macaxeira, mandioca ou as duas?',
+    'Área plantada (ha)': 'Tamanho_Area_Plantada_ha',
+    'Renda familiar': 'Renda_Familiar',
+}
+
+def questionario_popup(coords_df, df, vinculos):
+    """Texto HTML com as respostas da entrevista vinculada a cada linha de coords_df (NaN sem vínculo)."""
+    vinculos = vinculos[vinculos['fonte'] == 'coordenadas']
+    respostas = df.set_axis(ingest.interview_keys(df).to_numpy())
+    respostas = respostas[~respostas.index.duplicated()].reindex(vinculos['chave'])
+    textos = []
+    for _, linha in respostas.iterrows():
+        campos = [f"<b>{html.escape(rotulo)}:</b> {html.escape(f'{linha[col]:g}' if isinstance(linha[col], float) else str(linha[col]))}"
+                  for rotulo, col in CAMPOS_POPUP_MAPA.items() if col in linha.index and pd.notna(linha[col])]
+        textos.append('<br>'.join(campos))
+    return pd.Series(textos, index=vinculos['registro'].to_numpy(), dtype=object).reindex(coords_df.index)
+
+# Propriedades do mapa com o popup do questionário, em JSON para o mapa.html
+# (LookupError se o município ainda não tem coordenadas)
+@st.cache_data(max_entries=4)
+def get_map_points(data_key, municipio, onda):
+    coordenadas = MUNICIPIOS.get(municipio, {}).get('coordenadas')
+    if not coordenadas:
+        raise LookupError(municipio)
+    coords_df = pd.read_csv(coordenadas)
+    # Produtor do mapa -> respostas da entrevista dele (linkage.py)
+    coords_df['Questionario'] = questionario_popup(coords_df, get_survey(data_key, municipio, onda),
+                                                   get_link_table(data_key, municipio, onda))
+    return coords_df.to_json(orient='records')
+
+# HTML do mapa (mapa.html), lido uma vez por versão do arquivo: a data de
+# modificação entra na chave
+@st.cache_data(max_entries=2)
+def get_map_template(mtime):
+    with open('mapa.html', 'r', encoding='utf-8') as f:
+        return f.read()
+
+# Rede de dificuldades (RedeDificuldades.json) em texto JSON para o JavaScript,
+# também por versão do arquivo
+@st.cache_data(max_entries=2)
+def get_network_json(mtime):
+    with open('RedeDificuldades.json', 'r', encoding='utf-8') as f:
+        return json.dumps(json.load(f))
+
+def filtros_padrao(df):
+    """Filtros da barra lateral com tudo selecionado: (comunidades, gêneros, cultivos, faixa etária)."""
+    comunidades = tuple(df['Comunidade'].unique())
+    generos = tuple(df['Sexo'].unique()) if 'Sexo' in df.columns else ()
+    cultivos = (tuple(df['Cultiva macaxeira, mandioca ou as duas?'].unique())
+                if 'Cultiva macaxeira, mandioca ou as duas?' in df.columns else ())
+    if 'Idade' in df.columns and not df['Idade'].isnull().all():
+        return comunidades, generos, cultivos, (int(df['Idade'].min()), int(df['Idade'].max()))
+    return comunidades, generos, cultivos, (18, 100)
+
+# Sidebar - o município vem antes dos demais filtros: ele define o que é lido
+st.sidebar.image("https://encrypted-tbn0.gstatic.com/images?q=tbn:ANd9GcQzENcdjez22ijsES4vSml4F-MkUDG88NNXhw&s", use_container_width=True)
+st.sidebar.title("Maniva Tapajós")
+st.sidebar.markdown("Use os filtros abaixo para explorar os dados")
+st.sidebar.header("Filtros")
+# Municípios e ondas armazenados, do manifesto (sem ler as partições)
+catalogo = ingest.partition_catalog()
+municipios_disponiveis = sorted(catalogo['municipio'].unique())
+municipio = st.sidebar.selectbox(
+    "Município:",
+    options=municipios_disponiveis,
+    index=municipios_disponiveis.index(DEFAULT_MUNICIPIO) if DEFAULT_MUNICIPIO in municipios_disponiveis else 0
+)
+ondas_disponiveis = sorted(catalogo.loc[catalogo['municipio'] == municipio, 'onda'].unique())
+# A onda mais recente por padrão
+onda = st.sidebar.selectbox("Onda da pesquisa:", options=ondas_disponiveis, index=len(ondas_disponiveis) - 1)
+
+# Seções do contexto e retriever do chat, por visão
+@st.cache_resource(max_entries=4)
+def get_retriever(data_key, municipio, onda):
+    # Gerar contexto(transformar o dataframe em string), em seções: uma por
+    # coluna, para todos e para cada comunidade (do retrato em disco quando
+    # existe, ver warm_cache.py)
+    context_sections = warm_cache.snapshot('secoes', data_key, municipio, onda, get_survey(data_key, municipio, onda))
     
-    # Renomear colunas
-    for original, new in col_mapping.items():
-        if original in df.columns:
-            df.rename(columns={original: new}, inplace=True)
+    # Configuração do embeddings, para entender as relações entre palavras e contextos
+    # (backend escolhido por MANIVA_EMBEDDINGS_BACKEND: "huggingface" ou "onnx-int8");
+    # sem o modelo instalado, o retriever usa só a busca lexical
+    try:
+        embeddings = get_embedding_model()
+    except ImportError:
+        embeddings = None
     
+    # Banco vetorial construído uma vez por nó e aberto via mmap pelos demais
+    # processos; poucas seções por pergunta: BM25 + vetores, com pré-filtro
+    # por comunidade (retrieval.py)
+    return retrieval.shared_retriever(context_sections, embeddings, embedding_name())
+
+# Aquecimento: na primeira execução do processo, antes de qualquer leitura dos
+# dados, uma thread de fundo constrói os caches de cada visão (a padrão
+# primeiro) com os mesmos getters, para que nenhum usuário espere uma
+# construção a frio (warm_cache.py). Com os retratos em disco de
+# `python warm_cache.py`, cada tarefa é só uma leitura.
+def tarefas_aquecimento(municipio, onda):
+    key = shared_store.survey_key(municipios=[municipio], ondas=[onda])
+    visao = f'{municipio}/{onda}'
+
+    def associacoes():
+        get_associations(key, municipio, onda)
+        get_associations(key, municipio, onda, *filtros_padrao(get_survey(key, municipio, onda)))
+
+    def mapa():
+        get_map_points(key, municipio, onda)
+        get_map_grid(key, municipio, onda, *filtros_padrao(get_survey(key, municipio, onda)))
+
+    def temas():
+        for pergunta in themes.OPEN_ENDED_COLUMNS:
+            if pergunta in get_survey(key, municipio, onda).columns:
+                get_themes(key, municipio, onda, pergunta, None)
+
+    return [(f'questionário {visao}', lambda: get_survey(key, municipio, onda)),
+            (f'mapa {visao}', mapa),
+            (f'associações {visao}', associacoes),
+            (f'produtores {visao}', lambda: get_producer_index(key, municipio, onda)),
+            (f'chat {visao}', lambda: get_retriever(key, municipio, onda)),
+            (f'temas {visao}', temas)]
 
-    return df
+@st.cache_resource
+def get_cache_warmer():
+    return warm_cache.CacheWarmer([tarefa for m, o in warm_cache.views(catalogo)
+                                   for tarefa in tarefas_aquecimento(m, o)]).start()
 
-df = load_data()
+cache_warmer = get_cache_warmer()
 
-# Pré-processamento
-def preprocess_data(df):
-    # Converter colunas numéricas
-    numeric_cols = [
-        'Tamanho_Propriedade_ha', 'Tamanho_Area_Produtiva_ha', 'Tamanho_Area_Plantada_ha',
-        'Idade', 'Meses_Colheita_Mandioca', 'Area_Mandioca_ha', 'Area_Macaxeira_ha',
-        'Preco_Farinha', 'Tempo_Producao_Dias'
-    ]
-    
-    for col in numeric_cols:
-            if col == 'Tempo_Producao_Dias':
+data_key = shared_store.survey_key(municipios=[municipio], ondas=[onda])
 
-                df[col] = df[col].str.extract(r'(\d+)').astype(float)
-            else:
+df = get_survey(data_key, municipio, onda)
 
-                df[col] = df[col].astype(str).str.replace(',', '.').apply(pd.to_numeric, errors='coerce')
-    
-    # Mapear renda familiar
-    if 'Renda_Familiar' in df.columns:
-        renda_map = {
-            'MENOR QUE UM SALÁRIO MÍNIMO': 1000,
-            '1 SALÁRIO MÍNIMO': 1630,
-            '1 A 2 SALÁRIOS MÍNIMOS': 3260,
-            '2 A 3 SALÁRIOS MÍNIMOS': 4890
-        }
-        df['Renda_Familiar_R$'] = df['Renda_Familiar'].map(renda_map)
-        df['Renda_Familiar_R$'] = pd.to_numeric(df['Renda_Familiar_R$'], errors='coerce')
-    
-    return df
+# Índice de colunas usado pelo planejador de gráficos do Maniv.IA, por visão
+@st.cache_resource(max_entries=4)
+def get_column_index(data_key, municipio, onda):
+    return ColumnIndex(get_survey(data_key, municipio, onda))
 
-df = preprocess_data(df)
+# Figuras do chat já renderizadas, compartilhadas entre sessões (ver chat_history.py)
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache()
+
+@st.cache_data(max_entries=4)
+def get_data_version(data_key, municipio, onda):
+    return data_version(get_survey(data_key, municipio, onda))
+
+def chat_figure(plot_config, df):
+    """Figura (dict do Plotly) de um plot_config, renderizada uma vez e servida do cache."""
+    key = figure_key(plot_config, get_data_version(data_key, municipio, onda))
+    return get_figure_cache().get_or_render(key, lambda: render_plot_from_config(plot_config, df))
         
 # Configuração do sistema RAG
 
 
 # preparar o terreno para a IA
-# Função para gerar contexto detalhado apenas com dados locais
-def generate_comprehensive_context(df):
-    """Gera contexto estruturado com todas as colunas e estatísticas relevantes"""
-    context_lines = []
-    
-    if df.empty:
-        return "Base de dados vazia."
-    
-    # Informações gerais
-    context_lines.append(f"Total de registros: {len(df)}")
-    context_lines.append(f"Colunas disponíveis ({len(df.columns)}): {', '.join(df.columns)}")
-    
-    # Processamento por coluna
-    for col in df.columns:
-        col_data = df[col].dropna()
-        
-        if col_data.empty:
-            context_lines.append(f"\nColuna: {col} - SEM DADOS")
-            continue
-            
-        # Tipo de dados
-        dtype = str(df[col].dtype)
-        context_lines.append(f"\nColuna: {col} - Tipo: {dtype}")
-        
-        # Dados numéricos
-        if pd.api.types.is_numeric_dtype(df[col]):
-            stats = {
-                'Média': col_data.mean(),
-                'Mediana': col_data.median(),
-                'Min': col_data.min(),
-                'Max': col_data.max(),
-                'Desvio Padrão': col_data.std()
-            }
-            for stat, value in stats.items():
-                context_lines.append(f"  {stat}: {value:.2f}")
-                
-        # Dados categóricos/texto
-        else:
-            # Contagem de valores únicos
-            unique_count = col_data.nunique()
-            context_lines.append(f"  Valores únicos: {unique_count}")
-            
-            # Amostra de valores
-            sample_size = min(10, unique_count)
-            sample = col_data.sample(sample_size).unique().tolist()
-            context_lines.append(f"  Amostra: {sample}")
-            
-            # Contagem de valores para poucas categorias
-            if unique_count <= 20:
-                top_values = col_data.value_counts().head(10)
-                for value, count in top_values.items():
-                    context_lines.append(f"  '{value}': {count} ocorrências")
-    
-    return "\n".join(context_lines)
+# (o contexto é gerado de forma determinística em context_builder.py)
 
 @st.cache_resource
-def setup_rag_system(df, api_key):
-    # Gerar contexto(transformar o dataframe em string)
-    local_context = generate_comprehensive_context(df)
-    
-    # Configuração do embeddings, para entender as relações entre palavras e contextos
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    
-    # Criar banco vetorial
-    vector_db = FAISS.from_texts([local_context], embeddings)
-    retriever = vector_db.as_retriever(search_kwargs={"k": 1})
+def setup_rag_system(data_key, municipio, onda, api_key):
+    retriever = get_retriever(data_key, municipio, onda)
     
     # Configurar as instruções para geração de respostas
+    # (as instruções vêm antes do contexto: o início igual em todas as perguntas
+    # é servido do cache de prompt da API, a preço menor)
     template = """
     Você é um especialista no Projeto Maniva Tapajós em Juruti, Pará.
     Sua função é responder perguntas com base EXCLUSIVAMENTE nos dados fornecidos no contexto.
 
-    Contexto:
-    {context}
-
-    Pergunta: {question}
-
     Instruções:
     - Responda de forma concisa e direta
     - Baseie-se APENAS nas informações do contexto
     - Se a informação não estiver no contexto, diga "Não tenho dados sobre isso"
     - Para perguntas numéricas, forneça valores exatos quando disponíveis
-    - Considere que o contexto contém todas as colunas do dataset
+    - O contexto traz só as seções dos dados mais relacionadas à pergunta
+
+    Contexto:
+    {context}
+
+    Pergunta: {question}
 
     Resposta:
     """
@@ -191,30 +303,30 @@ def setup_rag_system(df, api_key):
         input_variables=["context", "question"]
     )
     
-    # Inicializar modelo DeepSeek
-    model = ChatDeepSeek(
-        api_key=api_key,
-        model="deepseek-chat",
-        temperature=0.3,
-        max_tokens=1000
-    )
+    # Inicializar o LLM (DeepSeek por padrão; MANIVA_LLM_BACKEND=local usa o
+    # simulador de llm_standin.py)
+    model = get_llm(api_key=api_key)
     
-    # Criar cadeia RAG
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=model,
-        chain_type="stuff",
-        retriever=retriever,
-        chain_type_kwargs={"prompt": prompt},
-        return_source_documents=False
-    )
+    # Criar cadeia RAG (contexto cortado ao orçamento de tokens, com log de
+    # tokens e tempos por pergunta: prompt_budget.py)
+    qa_chain = BudgetedQA(retriever, model, prompt)
     
     return qa_chain
 
 def consultar_rag_sistema(qa_chain, query, df):
     try:
+        # "O que está associado a ...?" sai direto da matriz de associações; como
+        # o resto do chat (retriever, df), ela usa todos os dados da visão, sem
+        # os filtros da barra lateral
+        matriz = get_associations(data_key, municipio, onda)
+        resposta = associations.answer_question(query, matriz, get_column_index(data_key, municipio, onda))
+        if resposta:
+            return {"text": resposta["text"], "source": "Matriz de associações",
+                    "plot_config": resposta["plot_config"]}
+
         result = qa_chain({"query": query})
         
-        plot_config = generate_plot_config_based_on_query(query, df)
+        plot_config = generate_plot_config_based_on_query(query, df, get_column_index(data_key, municipio, onda), matriz)
         return {
             "text": result["result"],
             "source": "DeepSeek RAG System",
@@ -227,10 +339,12 @@ def consultar_rag_sistema(qa_chain, query, df):
             "plot_config": None
         }
 
-def generate_plot_config_based_on_query(query, df):
+def generate_plot_config_based_on_query(query, df, column_index=None, association_matrix=None):
     """
     Gera configurações de gráfico baseadas na pergunta e nos dados disponíveis de forma genérica.
     """
+    if column_index is None:
+        column_index = ColumnIndex(df)
     if df.empty:
         return None
     
@@ -243,38 +357,44 @@ def generate_plot_config_based_on_query(query, df):
     # Se IA gerar algo genérico como "não tenho dados", evite gráfico também
     if query.lower().strip() in ["não sei", "não tenho dados sobre isso"]:
         return None
-    # 1. Primeiro, verificar se a pergunta menciona alguma coluna específica
-    mentioned_columns = [col for col in df.columns if col.lower() in query_lower]
+    # 1. Primeiro, buscar no índice as colunas relacionadas à pergunta
+    # (nomes, sinônimos e valores de resposta), da mais para a menos relevante
+    mentioned_columns = [col for col, _ in column_index.search(query)]
+    if column_index.asks_for_groups(query):
+        # Em comparações ("idade entre homens e mulheres") a medida é numérica
+        mentioned_columns.sort(key=lambda col: col not in column_index.numeric)
     
     # 2. Se encontramos colunas mencionadas, tentar criar um gráfico relevante
     if mentioned_columns:
         for col in mentioned_columns:
             # Para colunas numéricas
-            if pd.api.types.is_numeric_dtype(df[col]):
-                plot_config = handle_numeric_column(col, df, query_lower)
+            if is_measure(df[col]):
+                plot_config = handle_numeric_column(col, df, query_lower, column_index)
                 if plot_config:
                     return plot_config
             
-            # Para colunas categóricas/texto
-            elif pd.api.types.is_string_dtype(df[col]):
+            # Para colunas categóricas/texto (inclui SIM/NÃO booleanas)
+            else:
                 plot_config = handle_text_column(col, df, query_lower)
                 if plot_config:
                     return plot_config
     
     # 3. Se não encontrou colunas mencionadas, tentar inferir pelo contexto da pergunta
-    return infer_plot_from_query_context(query_lower, df)
+    return infer_plot_from_query_context(query_lower, df, column_index, association_matrix)
 
-def handle_numeric_column(col, df, query_lower):
+def handle_numeric_column(col, df, query_lower, column_index=None):
     """
     Gera configurações de gráfico para colunas numéricas.
     """
+    if column_index is None:
+        column_index = ColumnIndex(df)
+
     # Verificar se a pergunta pede comparação entre grupos
-    if "comparar" in query_lower or "entre" in query_lower:
-        # Tentar encontrar uma coluna categórica para agrupar
-        categorical_cols = [c for c in df.columns if pd.api.types.is_string_dtype(df[c]) and c != col]
+    if "comparar" in query_lower or column_index.asks_for_groups(query_lower):
+        # Escolher a dimensão de agrupamento citada na pergunta ("por comunidade")
+        group_by = column_index.group_by_for(query_lower, target=col)
         
-        if categorical_cols:
-            group_by = categorical_cols[0]  # Pega a primeira coluna categórica
+        if group_by:
             return {
                 "type": "box",
                 "params": {
@@ -299,9 +419,10 @@ def handle_text_column(col, df, query_lower):
     """
     Gera configurações de gráfico para colunas de texto/categóricas.
     """
+    series = yes_no_labels(df[col])
     # Se a pergunta pede contagem ou frequência
     if "quantos" in query_lower or "frequência" in query_lower or "contagem" in query_lower:
-        top_values = df[col].value_counts().head(10)
+        top_values = series.value_counts().head(10)
         return {
             "type": "bar",
             "params": {
@@ -313,9 +434,9 @@ def handle_text_column(col, df, query_lower):
         }
     
     # Se a coluna parece ter múltiplos valores separados por vírgula
-    if df[col].str.contains(',').any():
+    if series.str.contains(',').any():
         try:
-            exploded = df[col].str.split(',').explode()
+            exploded = series.str.split(',').explode()
             top_values = exploded.value_counts().head(10)
             return {
                 "type": "bar",
@@ -330,8 +451,8 @@ def handle_text_column(col, df, query_lower):
             pass
     
     # Gráfico de pizza para categorias com poucos valores únicos
-    if df[col].nunique() <= 10:
-        value_counts = df[col].value_counts()
+    if series.nunique() <= 10:
+        value_counts = series.value_counts()
         return {
             "type": "pie",
             "params": {
@@ -343,28 +464,33 @@ def handle_text_column(col, df, query_lower):
     
     return None
 
-def infer_plot_from_query_context(query_lower, df):
+def infer_plot_from_query_context(query_lower, df, column_index=None, association_matrix=None):
     """
     Tenta inferir o gráfico apropriado baseado no contexto da pergunta.
     """
     # Perguntas sobre distribuição
     if "distribuição" in query_lower or "como estão distribuídos" in query_lower:
         # Encontrar a primeira coluna numérica
-        numeric_cols = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
+        numeric_cols = [col for col in df.columns if is_measure(df[col])]
         if numeric_cols:
-            return handle_numeric_column(numeric_cols[0], df, query_lower)
+            return handle_numeric_column(numeric_cols[0], df, query_lower, column_index)
     
     # Perguntas sobre relação entre variáveis
     elif "relação" in query_lower or "correlação" in query_lower or "associação" in query_lower:
-        numeric_cols = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
-        if len(numeric_cols) >= 2:
+        # Mapa de calor das perguntas com as associações mais fortes
+        if association_matrix is None:
+            association_matrix = associations.AssociationMatrix(df)
+        variables = association_matrix.top_variables(12)
+        if len(variables) >= 2:
+            matriz = association_matrix.matrix(variables)
             return {
-                "type": "scatter",
+                "type": "heatmap",
                 "params": {
-                    "x": numeric_cols[0],
-                    "y": numeric_cols[1],
-                    "title": f"Relação entre {numeric_cols[0]} e {numeric_cols[1]}",
-                    "labels": {numeric_cols[0]: numeric_cols[0], numeric_cols[1]: numeric_cols[1]}
+                    "z": matriz.round(2).to_numpy().tolist(),
+                    "x": variables,
+                    "y": variables,
+                    "title": "Perguntas mais associadas entre si",
+                    "labels": {"color": "Associação"}
                 }
             }
     
@@ -372,7 +498,7 @@ def infer_plot_from_query_context(query_lower, df):
     elif "tendência" in query_lower or "evolução" in query_lower or "ao longo do tempo" in query_lower:
         date_cols = [col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])]
         if date_cols:
-            numeric_cols = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
+            numeric_cols = [col for col in df.columns if is_measure(df[col])]
             if numeric_cols:
                 return {
                     "type": "line",
@@ -385,7 +511,7 @@ def infer_plot_from_query_context(query_lower, df):
                 }
     
     # Se não conseguir inferir, mostrar estatísticas das primeiras colunas numéricas
-    # numeric_cols = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
+    # numeric_cols = [col for col in df.columns if is_measure(df[col])]
     # if numeric_cols:
     #     return handle_numeric_column(numeric_cols[0], df, query_lower)
     
@@ -402,6 +528,8 @@ def render_plot_from_config(plot_config, df):
 
     plot_type = plot_config["type"]
     params = plot_config["params"]
+    # Booleanas aparecem como SIM/NÃO nos eixos e legendas
+    df = yes_no_labels(df)
 
     try:
         if plot_type == "histogram":
@@ -413,12 +541,17 @@ def render_plot_from_config(plot_config, df):
         elif plot_type == "bar":
             return px.bar(x=params["x"], y=params["y"], 
                          title=params.get("title"), 
-                         labels=params.get("labels"))
+                         labels=params.get("labels"),
+                         orientation=params.get("orientation"))
         elif plot_type == "pie":
             return px.pie(names=params["names"], values=params["values"], 
                          title=params.get("title"))
         elif plot_type == "line":
             return px.line(df, **params)
+        elif plot_type == "heatmap":
+            return px.imshow(params["z"], x=params["x"], y=params["y"], title=params.get("title"),
+                             labels=params.get("labels"), zmin=0, zmax=1, color_continuous_scale="YlOrRd",
+                             aspect="auto")
     except Exception as e:
         st.error(f"Erro ao renderizar gráfico: {str(e)}")
         return None
@@ -486,20 +619,15 @@ st.markdown("""
     }
 </style>
 """, unsafe_allow_html=True)
-# Sidebar - Filtros
-st.sidebar.image("https://encrypted-tbn0.gstatic.com/images?q=tbn:ANd9GcQzENcdjez22ijsES4vSml4F-MkUDG88NNXhw&s", use_container_width=True)
-st.sidebar.title("Maniva Tapajós")
-st.sidebar.markdown("Use os filtros abaixo para explorar os dados")
-st.sidebar.header("Filtros")
+# Sidebar - Filtros (tudo selecionado por padrão, os mesmos valores que o
+# aquecimento usa nas chaves dos caches)
+comunidades_padrao, generos_padrao, cultivos_padrao, (idade_min, idade_max) = filtros_padrao(df)
 comunidades = st.sidebar.multiselect(
     "Selecione as comunidades:",
-    options=df['Comunidade'].unique(),
-    default=df['Comunidade'].unique()
+    options=comunidades_padrao,
+    default=comunidades_padrao
 )
 
-idade_min = int(df['Idade'].min()) if 'Idade' in df.columns and not df['Idade'].isnull().all() else 18
-idade_max = int(df['Idade'].max()) if 'Idade' in df.columns and not df['Idade'].isnull().all() else 100
-
 idade_range = st.sidebar.slider(
     "Faixa etária:",
     min_value=idade_min,
@@ -510,8 +638,8 @@ idade_range = st.sidebar.slider(
 if 'Sexo' in df.columns:
     genero = st.sidebar.multiselect(
         "Gênero:",
-        options=df['Sexo'].unique(),
-        default=df['Sexo'].unique()
+        options=generos_padrao,
+        default=generos_padrao
     )
 else:
     genero = []
@@ -520,58 +648,47 @@ else:
 if 'Cultiva macaxeira, mandioca ou as duas?' in df.columns:
     tipo_cultivo = st.sidebar.multiselect(
         "Tipo de Cultivo:",
-        options=df['Cultiva macaxeira, mandioca ou as duas?'].unique(),
-        default=df['Cultiva macaxeira, mandioca ou as duas?'].unique()
+        options=cultivos_padrao,
+        default=cultivos_padrao
     )
 else:
     tipo_cultivo = []
 
-# Aplicar filtros
-filtered_df = df.copy().replace('N.A.',np.nan)
-if comunidades:
-    filtered_df = filtered_df[filtered_df['Comunidade'].isin(comunidades)]
-if genero and 'Sexo' in filtered_df.columns:
-    filtered_df = filtered_df[filtered_df['Sexo'].isin(genero)]
-if tipo_cultivo and 'Cultiva macaxeira, mandioca ou as duas?' in filtered_df.columns:
-    filtered_df = filtered_df[filtered_df['Cultiva macaxeira, mandioca ou as duas?'].isin(tipo_cultivo)]
-if 'Idade' in filtered_df.columns:
-    filtered_df = filtered_df[
-        filtered_df['Idade'].between(idade_range[0], idade_range[1])
-    ]
+# Aplicar filtros (a mesma função atende a API de agregados, ver data_api.py)
+filtered_df = apply_filters(df, comunidades, genero, tipo_cultivo, idade_range)
 
 # --- Adição para carregar e injetar o JSON ---
 try:
-    with open('RedeDificuldades.json', 'r', encoding='utf-8') as f:
-        rede_dificuldades_json_data = json.load(f)
-    # Converter para string JSON para injetar no JavaScript
-    rede_dificuldades_json_string = json.dumps(rede_dificuldades_json_data)
+    # Lido (e convertido para string JSON) uma vez por versão do arquivo; o
+    # JavaScript da rede o recebe em get_network_html
+    rede_mtime = os.path.getmtime('RedeDificuldades.json')
+    get_network_json(rede_mtime)
 except FileNotFoundError:
     st.error("Erro: O arquivo 'RedeDificuldades.json' não foi encontrado. Certifique-se de que ele está na mesma pasta que o 'teste.py'.")
-    rede_dificuldades_json_string = "[]" # Injeta um array vazio para evitar erros
+    rede_mtime = None # Injeta um array vazio para evitar erros
 except Exception as e:
     st.error(f"Erro ao carregar 'RedeDificuldades.json': {e}")
-    rede_dificuldades_json_string = "[]"
+    rede_mtime = None
     
     
 # Layout principal
-st.title("🌱 Impacto do Projeto Maniva Tapajós em Juruti")
-st.markdown("Este painel analisa os dados coletados de produtores de mandioca e macaxeira na região de Juruti, "
+st.title(f"🌱 Impacto do Projeto Maniva Tapajós em {municipio}")
+st.markdown(f"Este painel analisa os dados coletados de produtores de mandioca e macaxeira na região de {municipio}, "
             "focando em métricas que refletem o impacto de iniciativas de desenvolvimento como o Projeto Maniva Tapajós.")
 
 # --- Inserção do Mapa Interativo ---
 st.title("🗺️ Mapa Interativo das Propriedades")
 st.markdown("Navegue pelo mapa para visualizar a distribuição das propriedades, comunidades e áreas de plantio. Clique em uma comunidade na legenda para dar zoom na área.")
 
-# Carregar dados das coordenadas e o HTML do mapa
+# Carregar dados das coordenadas e o HTML do mapa (do município escolhido, ver
+# data_pipeline.MUNICIPIOS)
+mapa_municipio = MUNICIPIOS.get(municipio, {})
 try:
-    # Carrega os dados do CSV que o mapa utiliza
-    coords_df = pd.read_csv('Coordenadas_Separadas.csv')
-    # Converte os dados para o formato JSON, que pode ser injetado no HTML
-    coords_json = coords_df.to_json(orient='records')
+    # Dados do CSV que o mapa utiliza, já em JSON para injetar no HTML
+    coords_json = get_map_points(data_key, municipio, onda)
 
-    # Carrega o conteúdo do arquivo HTML do mapa
-    with open('mapa.html', 'r', encoding='utf-8') as f:
-        mapa_html = f.read()
+    # Carrega o conteúdo do arquivo HTML do mapa (em cache, ver get_map_template)
+    mapa_html = get_map_template(os.path.getmtime('mapa.html'))
     
     # Injeta os dados do CSV diretamente no código HTML.
     # Isso torna o componente do mapa autossuficiente e mais robusto.
@@ -579,10 +696,24 @@ try:
         'const data = await d3.csv("Coordenadas_Separadas.csv", d3.autoType);',
         f'const data = JSON.parse(`{coords_json}`);'
     )
+    # Hexágonos dos indicadores, já filtrados (ver get_map_grid)
+    grade = get_map_grid(data_key, municipio, onda, tuple(comunidades), tuple(genero), tuple(tipo_cultivo),
+                         tuple(idade_range))
+    grade_json = json.dumps(grade).replace('</', '<\\/')
+    mapa_html = mapa_html.replace(
+        'const gridLayers = { indicadores: [], resolucoes: [] };',
+        f'const gridLayers = {grade_json};'
+    )
+    # Centraliza o mapa (e o botão de voltar à visão geral) no município
+    latitude, longitude = mapa_municipio['centro']
+    mapa_html = mapa_html.replace('setView([-2.37, -56.05], 11.3)',
+                                  f"setView([{latitude}, {longitude}], {mapa_municipio['zoom']})")
     
     # Renderiza o mapa no Streamlit
     components.html(mapa_html, height=720, scrolling=False)
 
+except LookupError:
+    st.info(f"Ainda não há coordenadas das propriedades de {municipio} para o mapa.")
 except FileNotFoundError as e:
     st.error(f"Erro ao carregar arquivo necessário para o mapa: {e.filename}. Certifique-se que 'mapa.html' e 'Coordenadas_Separadas.csv' estão na pasta correta.")
 except Exception as e:
@@ -621,7 +752,7 @@ with col4:
 
 with col5:
     if 'É associado a alguma entidade?' in filtered_df.columns:
-        associados = filtered_df['É associado a alguma entidade?'].value_counts().get('SIM', 0)
+        associados = count_yes(filtered_df['É associado a alguma entidade?'])
         percentual = associados/len(filtered_df)*100 if len(filtered_df) > 0 else 0
         st.metric("Associados", f"{associados} ({percentual:.0f}%)")
     else:
@@ -691,27 +822,12 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-maniv_ai_tab, tab1, tab2, tab3, tab4, tab5 = st.tabs([
+maniv_ai_tab, tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9 = st.tabs([
     "Maniv.IA","👤 Perfil", "🌱 Cultivo", "💰 Comercialização", 
-    "⚠️ Desafios", "📊 Dados Completos"
+    "⚠️ Desafios", "📊 Dados Completos", "📈 Impacto", "🔗 Associações", "🤝 Produtores Parecidos", "💬 Temas"
 ])
 
 
-
-TERRACOTA_PALETTE = [
-    "#A52A2A",
-    "#667755",
-    "#8D6E63",  # Marrom terroso
-    "#A1887F",  # Marrom claro
-    "#CCCCAA",  # Bege
-    "#5D4037",  # Marrom escuro
-    "#795548",  # Marrom chocolate
-    "#BCAAA4",  # Rosa terroso
-    "#4E342E",  # Marrom quase preto
-    "#3E2723",  # Terracota escuro
-    "#6D4C41",  # Terracota
-]
-
 # Adicione no início do seu código
 import os
 import time
@@ -773,17 +889,25 @@ with maniv_ai_tab:
         </div>
     """, unsafe_allow_html=True)
 
-    st.write("Pergunte sobre os dados do Projeto Maniva Tapajós em Juruti, Pará. O chatbot usará informações da base de dados fornecida para responder.")
+    st.write(f"Pergunte sobre os dados do Projeto Maniva Tapajós em {municipio}, Pará. O chatbot usará informações da base de dados fornecida para responder.")
 
-    # Input para a API Key do DeepSeek
-    deepseek_api_key = st.text_input("Insira sua DeepSeek API Key", type="password", key="deepseek_api_key_input")
+    # Input para a API Key do DeepSeek (backends locais não precisam de chave)
+    api_key_required = requires_api_key()
+    if api_key_required:
+        deepseek_api_key = st.text_input("Insira sua DeepSeek API Key", type="password", key="deepseek_api_key_input")
+    else:
+        deepseek_api_key = None
+        st.caption(f"Usando o backend de LLM '{DEFAULT_LLM_BACKEND}' (sem API Key).")
 
     # Inicializar o sistema RAG apenas se a API Key for fornecida e não vazia
     qa_chain = None
-    if deepseek_api_key:
+    if cache_warmer.busy(f'chat {municipio}/{onda}'):
+        # Sem esperar o modelo de embeddings e o índice: o próximo rerun já os encontra prontos
+        st.info("O Maniv.IA ainda está sendo preparado em segundo plano. Tente de novo em alguns instantes.")
+    elif deepseek_api_key or not api_key_required:
         with st.spinner("Configurando sistema RAG..."):
             try:
-                qa_chain = setup_rag_system(df, deepseek_api_key)
+                qa_chain = setup_rag_system(data_key, municipio, onda, deepseek_api_key)
                 st.success("Sistema RAG configurado com sucesso!")
             except Exception as e:
                 st.error(f"Erro ao configurar o sistema RAG. Verifique sua API Key e conexão: {e}")
@@ -792,24 +916,21 @@ with maniv_ai_tab:
 
     # Inicializar histórico de chat
     if "web_chat_history" not in st.session_state:
-        st.session_state.web_chat_history = [
-            {"role": "assistant", "content": "Olá! Sou o Maniv.IA, seu assistente para o Projeto Maniva Tapajós. Como posso ajudar com os dados hoje?"}
-        ]
-
-        # Exibir histórico
-        for msg in st.session_state.web_chat_history:
-            # Garante que 'msg' é um dicionário e possui a chave 'role' antes de tentar acessá-la
-            if isinstance(msg, dict) and "role" in msg:
-                if msg["role"] == "assistant":
-                    with st.chat_message("assistant"):
-                        st.markdown(msg["content"])
-                        if "plot_config" in msg and msg["plot_config"]:
-                            fig = render_plot_from_config(msg["plot_config"], df)
-                            if fig:
-                                st.plotly_chart(fig, use_container_width=True)
-                elif msg["role"] == "user":
-                    with st.chat_message("user"):
-                        st.markdown(msg["content"])
+        st.session_state.web_chat_history = ChatHistory(
+            greeting="Olá! Sou o Maniv.IA, seu assistente para o Projeto Maniva Tapajós. Como posso ajudar com os dados hoje?"
+        )
+
+    # Exibir histórico (a cada rerun; os gráficos vêm do cache de figuras)
+    history_summary = st.session_state.web_chat_history.summary()
+    if history_summary:
+        st.caption(history_summary)
+    for msg in st.session_state.web_chat_history:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+            if msg.get("plot_config"):
+                figure = chat_figure(msg["plot_config"], df)
+                if figure:
+                    st.plotly_chart(figure, use_container_width=True, key=f"chat_fig_{msg['id']}")
 
 
     # Input container
@@ -818,7 +939,7 @@ with maniv_ai_tab:
         submitted = st.form_submit_button("Enviar")
 
         if submitted and prompt:
-            if not deepseek_api_key:
+            if api_key_required and not deepseek_api_key:
                 st.warning("Por favor, insira sua DeepSeek API Key para conversar com o chatbot.")
             elif not qa_chain:
                 st.warning("O sistema RAG ainda não foi configurado ou houve um erro. Por favor, verifique a API Key.")
@@ -829,13 +950,17 @@ with maniv_ai_tab:
 
                 with st.spinner("Processando..."):
                     response = consultar_rag_sistema(qa_chain, prompt, df)
-                    st.markdown(response["text"])
-                    st.session_state.web_chat_history.append(response)
-                    
-                    if response.get("plot_config"):
-                        fig = render_plot_from_config(response["plot_config"], df)
-                        if fig:
-                            st.plotly_chart(fig, use_container_width=True)
+                    message = {"role": "assistant", "content": response["text"],
+                               "plot_config": response.get("plot_config")}
+                    st.session_state.web_chat_history.append(message)
+                    # Usa a especificação já compactada, a mesma chave dos reruns seguintes
+                    message = st.session_state.web_chat_history.messages[-1]
+                    with st.chat_message("assistant"):
+                        st.markdown(message["content"])
+                        if message.get("plot_config"):
+                            figure = chat_figure(message["plot_config"], df)
+                            if figure:
+                                st.plotly_chart(figure, use_container_width=True, key=f"chat_fig_{message['id']}")
 
                     
     
@@ -843,7 +968,7 @@ with tab1:
     st.subheader("Perfil dos Produtores")
     
     if 'Possui Cadastro Ambiental Rural (CAR)?' in filtered_df.columns:
-        car_count = filtered_df['Possui Cadastro Ambiental Rural (CAR)?'].value_counts()
+        car_count = yes_no_labels(filtered_df['Possui Cadastro Ambiental Rural (CAR)?']).value_counts()
         fig = px.bar(car_count,
                      title="Registro de CAR Entre os Produtores",
                      labels={'index': 'Registro de CAR', 'value':'Contagem'},
@@ -915,7 +1040,7 @@ with tab1:
             st.warning("Dados de idade não disponíveis")
         
         if 'É associado a alguma entidade?' in filtered_df.columns:
-            associacao_counts = filtered_df['É associado a alguma entidade?'].value_counts()
+            associacao_counts = yes_no_labels(filtered_df['É associado a alguma entidade?']).value_counts()
             fig = px.pie(
                 associacao_counts,
                 names=associacao_counts.index,
@@ -961,8 +1086,7 @@ with tab2:
         
         # Layout modificado com classe
         st.markdown('<div class="rank-column" style="display:flex; gap:20px;">', unsafe_allow_html=True)
-        # Cálculo da área total
-        filtered_df['Area_Total_ha'] = filtered_df['Area_Mandioca_ha'] + filtered_df['Area_Macaxeira_ha']
+        # Area_Total_ha já vem calculada na ingestão (derived_metrics.py)
         
         st.header('Rank dos Sítios por Área Plantada')
         
@@ -1087,9 +1211,7 @@ with tab2:
         else:
             st.warning("Dados de área plantada específica não disponíveis")
     with col_total_media:
-        if 'Area_Mandioca_ha' in filtered_df.columns and 'Area_Macaxeira_ha' in filtered_df.columns:
-            # Criar coluna de área total para o tamanho das bolhas
-            filtered_df['Area_Total_ha'] = filtered_df['Area_Mandioca_ha'] + filtered_df['Area_Macaxeira_ha']
+        if 'Area_Total_ha' in filtered_df.columns:
             totaldf =filtered_df['Area_Total_ha']
             total_media_formata = totaldf.mean()
             media_formatada_total = f'{total_media_formata.mean():.3f}'
@@ -1104,41 +1226,27 @@ with tab2:
     st.subheader("Variedades")
     col1, col2 = st.columns(2, gap="large")
     
+    # Os mesmos gráficos dos relatórios por comunidade (tab_figures.py)
     with col1:
-        if 'Variedades_Mandioca' in filtered_df.columns:
-            try:
-                mandioca_variedades = filtered_df['Variedades_Mandioca'].str.split(',', expand=True).stack().value_counts()
-                fig = px.bar(
-                    mandioca_variedades.head(10),
-                    title='Variedades de Mandioca Mais Cultivadas',
-                    labels={'index': 'Variedade', 'value': 'Contagem'},
-                    color_discrete_sequence=[TERRACOTA_PALETTE[3]]  # Nova cor
-                )
-                st.plotly_chart(fig, use_container_width=True)
-            except:
-                st.warning("Erro ao processar variedades de mandioca")
+        fig = tab_figure(filtered_df, 'variedades_mandioca')
+        if fig is not None:
+            st.plotly_chart(fig, use_container_width=True)
         else:
             st.warning("Dados de variedades de mandioca não disponíveis")
             
     with col2:
-        if 'Qual(s) variedade(s) de MACAXEIRA?' in filtered_df.columns:
-            try:
-                macaxeira_variedades = filtered_df['Qual(s) variedade(s) de MACAXEIRA?'].str.split(',', expand=True).stack().value_counts()
-                fig = px.bar(
-                    macaxeira_variedades.head(10),
-                    title='Variedades de Macaxeira Mais Cultivadas',
-                    labels={'index': 'Variedade', 'value': 'Contagem'},
-                    color_discrete_sequence=[TERRACOTA_PALETTE[0]]  # Nova cor
-                )
-                st.plotly_chart(fig, use_container_width=True)
-            except:
-                st.warning("Erro ao processar variedades de macaxeira")
+        fig = tab_figure(filtered_df, 'variedades_macaxeira')
+        if fig is not None:
+            st.plotly_chart(fig, use_container_width=True)
         else:
             st.warning("Dados de variedades de macaxeira não disponíveis")
 
-with tab3:
-    st.subheader("Rede de Dificuldades")
-    network_difs_html = f"""
+# Página da rede de dificuldades com o JSON embutido, montada uma vez por
+# versão do RedeDificuldades.json (None: arquivo ausente ou inválido, rede vazia)
+@st.cache_data(max_entries=2)
+def get_network_html(rede_mtime):
+    rede_dificuldades_json_string = get_network_json(rede_mtime) if rede_mtime is not None else "[]"
+    return f"""
     <!DOCTYPE html>
     <html>
 
@@ -1514,20 +1622,14 @@ with tab3:
 
     </html>
     """
-    components.html(html=network_difs_html, height=700)
 
-    if 'Produtos_Comercializados' in filtered_df.columns:
-            try:
-                produtos = filtered_df['Produtos_Comercializados'].str.split(', ', expand=True).stack().value_counts()
-                fig = px.bar(
-                    produtos,
-                    title='Produtos Derivados Comercializados',
-                    labels={'index': 'Produto', 'value': 'Contagem'},
-                    color_discrete_sequence=TERRACOTA_PALETTE  # Nova cor
-                )
-                st.plotly_chart(fig, use_container_width=True)
-            except:
-                st.warning("Erro ao processar produtos comercializados")
+with tab3:
+    st.subheader("Rede de Dificuldades")
+    components.html(html=get_network_html(rede_mtime), height=700)
+
+    fig = tab_figure(filtered_df, 'produtos')
+    if fig is not None:
+            st.plotly_chart(fig, use_container_width=True)
     else:
             st.warning("Dados de produtos comercializados não disponíveis")
         
@@ -1566,51 +1668,27 @@ with tab3:
 with tab4:
     st.subheader("Dificuldades no Cultivo")
     
-    if 'Dificuldades_Cultivo' in filtered_df.columns:
-        try:
-            cultivo_dificuldades = filtered_df['Dificuldades_Cultivo'].str.split(',', expand=True).stack().value_counts()
-            fig = px.bar(
-                cultivo_dificuldades,
-                title='Dificuldades no Cultivo',
-                labels={'index': 'Dificuldade', 'value': 'Contagem'},
-                color_discrete_sequence=[TERRACOTA_PALETTE[1]]  # Nova cor
-            )
-            st.plotly_chart(fig, use_container_width=True)
-        except:
-            st.warning("Erro ao processar dificuldades no cultivo")
+    fig = tab_figure(filtered_df, 'dificuldades_cultivo')
+    if fig is not None:
+        st.plotly_chart(fig, use_container_width=True)
     else:
         st.warning("Dados de dificuldades no cultivo não disponíveis")
     
     
-    if 'Dificuldades_Processamento' in filtered_df.columns:
-        try:
-            processamento_dificuldades = filtered_df['Dificuldades_Processamento'].str.split(',', expand=True).stack().value_counts()
-            fig = px.bar(
-                processamento_dificuldades,
-                title='Dificuldades no Processamento',
-                labels={'index': 'Dificuldade', 'value': 'Contagem'},
-                color_discrete_sequence=[TERRACOTA_PALETTE[5]]  # Nova cor
-            )
-            st.plotly_chart(fig, use_container_width=True)
-        except:
-            st.warning("Erro ao processar dificuldades no processamento")
+    fig = tab_figure(filtered_df, 'dificuldades_processamento')
+    if fig is not None:
+        st.plotly_chart(fig, use_container_width=True)
     else:
         st.warning("Dados de dificuldades no processamento não disponíveis")
         
         
-    if 'Se sim, quais pragas?' in filtered_df:
-        pragas = filtered_df['Se sim, quais pragas?'].str.replace(', ',',').str.replace(' E ',',').str.replace('LARGATA','LAGARTA').str.upper().str.split(',').explode().str.strip().value_counts()
-        fig = px.bar(
-            pragas,
-            title='Incidência de Pragas',
-            labels={'index': 'Pragas', 'value': 'Contagem'},
-            color_discrete_sequence=TERRACOTA_PALETTE)
+    fig = tab_figure(filtered_df, 'pragas')
+    if fig is not None:
         st.plotly_chart(fig,use_container_width=True)
 with tab5:
     
-    start_col = 1  # Skip first column (index 0)
-    end_col = -8   # Skip last 8 columns
-    filtered_df_to_show = filtered_df.iloc[:, start_col:end_col]
+    # Esconde a coluna Família, os metadados da coleta e as colunas derivadas
+    filtered_df_to_show = export_frame(filtered_df)
     st.subheader("Dados Completos")
     st.dataframe(filtered_df_to_show, height=600)
     
@@ -1625,6 +1703,177 @@ with tab5:
         mime='text/csv'
     )
 
+with tab6:
+    st.subheader("Impacto entre Ondas da Pesquisa")
+    if len(ondas_disponiveis) < 2:
+        st.info(f"Só há uma onda da pesquisa ingerida para {municipio}. "
+                "Ingira a próxima rodada com `python ingest.py exportacao.csv --onda <nome>` para comparar.")
+    else:
+        col1, col2 = st.columns(2)
+        with col1:
+            onda_antes = st.selectbox("Onda inicial:", options=ondas_disponiveis, index=len(ondas_disponiveis) - 2)
+        with col2:
+            onda_depois = st.selectbox("Onda final:", options=ondas_disponiveis, index=len(ondas_disponiveis) - 1)
+
+        if onda_antes == onda_depois:
+            st.warning("Escolha duas ondas diferentes.")
+        else:
+            pairs, vinculos = get_wave_comparison(
+                shared_store.survey_key(municipios=[municipio], ondas=[onda_antes]),
+                shared_store.survey_key(municipios=[municipio], ondas=[onda_depois]),
+                municipio, onda_antes, onda_depois)
+            # Os filtros da barra lateral valem para as comunidades comparadas
+            if comunidades:
+                pairs = pairs[pairs['Comunidade'].isin(comunidades)]
+
+            st.caption(f"{len(pairs)} produtores acompanhados nas duas ondas "
+                       f"({vinculos['por_chave']} pela chave da entrevista, {vinculos['por_nome']} pelo nome); "
+                       f"{vinculos['so_antes']} só na onda {onda_antes} e {vinculos['so_depois']} só na onda {onda_depois}. "
+                       f"{vinculos['chave_divergente']} pares com a mesma chave e nomes diferentes não foram considerados a mesma pessoa.")
+            resumo = summarize_comparison(pairs)
+
+            # Cartões: médias das medidas e % de adoção das práticas, com a variação
+            cols = st.columns(4)
+            for i, row in enumerate(resumo.itertuples()):
+                with cols[i % 4]:
+                    if row.tipo == 'pratica':
+                        st.metric(f"{row.indicador} (%)", f"{row.depois:.0f}%", f"{row.variacao:+.0f} p.p.",
+                                  delta_color='inverse' if 'pragas' in row.indicador else 'normal')
+                    else:
+                        st.metric(row.indicador, f"{row.depois:,.2f}", f"{row.variacao:+,.2f}")
+
+            praticas = [name for name in resumo.loc[resumo['tipo'] == 'pratica', 'indicador']]
+            transicoes = pd.concat(
+                [pairs[f'{name} | transicao'].value_counts().rename_axis('Transição').reset_index(name='Produtores')
+                 .assign(Indicador=name) for name in praticas],
+                ignore_index=True)
+            fig = px.bar(transicoes[transicoes['Transição'] != TRANSITIONS[-1]],
+                         x='Produtores', y='Indicador', color='Transição', orientation='h',
+                         title='Mudança de práticas entre as ondas',
+                         category_orders={'Transição': list(TRANSITIONS)},
+                         color_discrete_sequence=TERRACOTA_PALETTE)
+            st.plotly_chart(fig, use_container_width=True)
+
+            por_comunidade = summarize_comparison(pairs, by='Comunidade')
+            medidas = por_comunidade[por_comunidade['tipo'] != 'pratica']
+            fig = px.bar(medidas, x='Comunidade', y='variacao', color='Comunidade', facet_col='indicador',
+                         facet_col_wrap=2, title='Variação média por comunidade',
+                         labels={'variacao': 'Variação'}, color_discrete_sequence=TERRACOTA_PALETTE)
+            fig.update_yaxes(matches=None)
+            fig.for_each_annotation(lambda a: a.update(text=a.text.split('=')[-1]))
+            st.plotly_chart(fig, use_container_width=True)
+
+            with st.expander("Produtores acompanhados"):
+                st.dataframe(pairs, height=400)
+
+with tab7:
+    st.subheader("Associações entre as Perguntas")
+    matriz_associacoes = get_associations(data_key, municipio, onda, tuple(comunidades), tuple(genero),
+                                          tuple(tipo_cultivo), tuple(idade_range))
+    st.caption(f"{matriz_associacoes.n} produtores, {len(matriz_associacoes.variables)} perguntas comparadas "
+               "(V de Cramér entre categóricas, ômega (eta corrigido) entre categórica e medida, correlação de Pearson entre medidas). "
+               "Associação não quer dizer causa.")
+
+    if len(matriz_associacoes.variables) < 2:
+        st.info("Não há perguntas com variação suficiente nos dados filtrados.")
+    else:
+        n_perguntas = st.slider("Perguntas no mapa de calor:", min_value=5, max_value=40, value=15)
+        variaveis = matriz_associacoes.top_variables(n_perguntas)
+        fig = px.imshow(matriz_associacoes.matrix(variaveis).round(2), zmin=0, zmax=1, aspect="auto",
+                        color_continuous_scale="YlOrRd", title="Perguntas mais associadas entre si",
+                        labels={"color": "Associação"})
+        fig.update_layout(height=300 + 25 * len(variaveis))
+        st.plotly_chart(fig, use_container_width=True)
+
+        st.markdown("**Pares mais associados**")
+        st.dataframe(matriz_associacoes.strongest(k=30), height=400)
+
+        st.markdown("**O que anda junto de uma resposta**")
+        col1, col2 = st.columns(2)
+        niveis = matriz_associacoes.levels
+        with col1:
+            pergunta = st.selectbox("Pergunta:", options=list(dict.fromkeys(niveis['variavel'])))
+        with col2:
+            resposta = st.selectbox("Resposta:", options=list(niveis.loc[niveis['variavel'] == pergunta, 'resposta']))
+        relacionadas = matriz_associacoes.related(pergunta, resposta, k=15)
+        if relacionadas.empty:
+            st.info("Nenhuma resposta associada a essa nos dados filtrados.")
+        else:
+            rotulos = [f"{row.variavel} = {row.resposta}" if row.resposta else row.variavel
+                       for row in relacionadas.itertuples()]
+            fig = px.bar(relacionadas.assign(rotulo=rotulos), x='valor', y='rotulo', orientation='h',
+                         title=f"Associação com {pergunta} = {resposta}",
+                         labels={'valor': 'phi / ponto-bisserial', 'rotulo': ''},
+                         color_discrete_sequence=TERRACOTA_PALETTE)
+            fig.update_yaxes(autorange='reversed')
+            st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(relacionadas)
+
+with tab8:
+    st.subheader("Produtores Parecidos")
+    st.caption("Produtores com práticas, dificuldades e perfil mais parecidos com os de um produtor, "
+               "para indicar trocas de experiência. O resultado escolhido fica fora da comparação e "
+               "filtra só os vizinhos que se saem melhor nele.")
+    indice_produtores = get_producer_index(data_key, municipio, onda)
+    chaves = indice_produtores.keys
+    nomes = df['Nome produtor (entrevistado)'].astype('string').fillna('(sem nome)') + ' — ' + \
+        df['Comunidade'].astype('string').fillna('')
+    opcoes = dict(zip(chaves[~chaves.duplicated()], nomes[~chaves.duplicated()]))
+
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        produtor = st.selectbox("Produtor:", options=list(opcoes), format_func=opcoes.get)
+    with col2:
+        resultado = st.selectbox("Com resultado melhor em:", options=[None, *similarity.OUTCOMES],
+                                 format_func=lambda r: "Qualquer resultado" if r is None else similarity.OUTCOMES[r][0])
+    with col3:
+        n_vizinhos = st.number_input("Quantos:", min_value=1, max_value=50, value=10)
+
+    # Vizinhos só entre os produtores dos filtros da barra lateral
+    vizinhos = indice_produtores.similar(produtor, k=int(n_vizinhos), outcome=resultado,
+                                         candidates=df.index.isin(filtered_df.index))
+    if vizinhos.empty:
+        st.info("Nenhum produtor atende aos filtros escolhidos.")
+    else:
+        st.dataframe(vizinhos.drop(columns=['chave', 'distancia']), hide_index=True)
+        vizinho = st.selectbox("Comparar respostas com:", options=list(vizinhos['chave']), format_func=opcoes.get)
+        diferencas = indice_produtores.differences(produtor, vizinho)
+        st.markdown(f"**{len(diferencas)} de {len(indice_produtores.questions)} perguntas com respostas diferentes**")
+        st.dataframe(diferencas.rename(columns={'pergunta': 'Pergunta', 'produtor': 'Produtor escolhido',
+                                                'vizinho': 'Vizinho'}), hide_index=True, height=400)
+
+with tab9:
+    st.subheader("Temas das Respostas Abertas")
+    perguntas_abertas = [col for col in themes.OPEN_ENDED_COLUMNS if col in df.columns]
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        pergunta_aberta = st.selectbox("Pergunta:", options=perguntas_abertas)
+    with col2:
+        n_temas = st.number_input("Temas (0 = automático):", min_value=0, max_value=themes.MAX_THEMES, value=0)
+
+    try:
+        temas = get_themes(data_key, municipio, onda, pergunta_aberta, int(n_temas) or None)
+    except ImportError as e:
+        temas = None
+        st.warning(f"O modelo de embeddings não está disponível: {e}")
+
+    if temas is not None:
+        # Os temas valem para todas as respostas; a contagem segue os filtros
+        resumo_temas = themes.theme_summary(temas, filtered_df[pergunta_aberta])
+        if resumo_temas.empty:
+            st.info("Nenhum produtor dos filtros respondeu a essa pergunta.")
+        else:
+            fig = px.bar(resumo_temas, x='produtores', y='rotulo', orientation='h',
+                         title=f"Temas de \"{pergunta_aberta}\"",
+                         labels={'produtores': 'Produtores', 'rotulo': 'Tema'},
+                         hover_data={'exemplos': True}, color_discrete_sequence=TERRACOTA_PALETTE)
+            fig.update_yaxes(autorange='reversed')
+            st.plotly_chart(fig, use_container_width=True)
+            for tema in resumo_temas.itertuples():
+                with st.expander(f"{tema.rotulo} — {tema.produtores} produtores"):
+                    respostas = temas[temas['tema'] == tema.tema].sort_values('similaridade', ascending=False)
+                    st.dataframe(respostas[['resposta', 'produtores', 'similaridade']], hide_index=True)
+
 # Rodapé
 st.markdown("---")
-st.caption("Dashboard de Produção de Mandioca e Macaxeira em Juruti - Dados coletados em 2025 | Maniva Tapajós | LABCRIA")
\ No newline at end of file
+st.caption(f"Dashboard de Produção de Mandioca e Macaxeira em {municipio} - Dados da onda {onda} | Maniva Tapajós | LABCRIA")
\ No newline at end of file
@@ -0,0 +1,528 @@
+# Associações entre todas as perguntas do questionário.
+#
+# Uso:
+#     python associations.py [--municipio Juruti] [--top 20]
+#     python associations.py --pergunta "Considera sua produção?" --resposta BOA
+#
+# Cada pergunta vira uma variável:
+#   - categóricas e SIM/NÃO: um nível por resposta (respostas com menos de
+#     MIN_LEVEL_COUNT produtores contam como sem resposta);
+#   - múltipla escolha (canonicalization.MULTI_SELECT_COLUMNS): cada item
+#     frequente vira uma variável SIM/NÃO ("Dificuldades_Cultivo: PRAGAS"),
+#     só para quem respondeu a pergunta;
+#   - medidas numéricas.
+# O one-hot fica esparso (pares linha, nível) e AssociationMatrix calcula de
+# uma vez, por produtos de matrizes em blocos de linhas, as tabelas de
+# contingência de todos os pares de perguntas (X'X) e as somas das medidas por
+# nível (X'Y). Com a matriz G nível -> variável, as estatísticas de todos os
+# pares também saem de produtos de matrizes:
+#   - categórica x categórica: qui-quadrado, p-valor e V de Cramér (com
+#     correção de viés);
+#   - categórica x numérica: ômega, a razão de correlação (eta) com correção
+#     de viés (ômega² da ANOVA de um fator), só com pelo menos
+#     MIN_PER_LEVEL produtores por nível: o eta simples cresce com o número de
+#     níveis mesmo sem associação nenhuma;
+#   - numérica x numérica: correlação de Pearson, com o p-valor do teste t,
+#     só com pelo menos MIN_PAIRS produtores com as duas medidas (com 3
+#     produtores r = ±1 sai do acaso).
+# Cada par usa só os produtores que responderam às duas perguntas. Colunas
+# derivadas umas das outras (field_parsers, derived_metrics) não são
+# comparadas entre si.
+# related usa a mesma X'X para dizer quais respostas andam junto de uma
+# resposta específica (coeficiente phi); answer_question responde no chat
+# perguntas como "o que está associado à produção BOA?" sem passar pelo LLM.
+
+import argparse
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+from canonicalization import EXCLUDED_COLUMNS, MULTI_SELECT_COLUMNS, fold_accents
+from data_pipeline import COLUNA_MUNICIPIO, COLUNA_ONDA, HIDDEN_COLUMNS
+from derived_metrics import DERIVED_METRICS
+from dtype_optimizer import NO, YES, is_measure
+from field_parsers import TYPED_FIELDS, TYPED_FIELDS_MULTI
+
+# Perguntas com mais respostas distintas que isso são texto livre
+MAX_LEVELS = 12
+MIN_LEVEL_COUNT = 2
+# Produtores por nível exigidos no par categórica x medida
+MIN_PER_LEVEL = 5
+# Produtores com as duas medidas exigidos no par numérica x numérica
+MIN_PAIRS = 10
+# Linhas por bloco no produto X'X (limita a memória do one-hot denso)
+ROW_BLOCK = 4096
+# Separa variável e item nas perguntas de múltipla escolha
+ITEM_SEPARATOR = ': '
+
+MEASURES = {'categorica': 'V de Cramér', 'mista': 'ômega', 'numerica': 'r de Pearson'}
+
+# Palavras que indicam pergunta sobre associação no chat
+ASSOCIATION_WORDS = ('associad', 'associa', 'relacao', 'relacionad', 'correlac', 'influenc', 'depende',
+                     'anda junto', 'tem a ver')
+IGNORED_COLUMNS = set(HIDDEN_COLUMNS) | EXCLUDED_COLUMNS | {COLUNA_MUNICIPIO, COLUNA_ONDA}
+
+
+def column_sources():
+    """Coluna -> colunas brutas de onde ela é calculada (field_parsers e derived_metrics)."""
+    sources = {}
+    for target, (source, _) in TYPED_FIELDS.items():
+        for name in TYPED_FIELDS_MULTI.get(target, {target: target}).values():
+            sources[name] = {source}
+
+    def resolve(name):
+        if name in DERIVED_METRICS:
+            return set().union(*(resolve(dep) for dep in DERIVED_METRICS[name][0]))
+        return sources.get(name, {name})
+
+    return {**sources, **{name: resolve(name) for name in DERIVED_METRICS}}
+
+
+def chi2_sf(x, dof):
+    """P(X > x) da qui-quadrado (vetorizada; forma fechada para graus inteiros)."""
+    x, dof = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(dof, dtype=float))
+    half = np.where(np.isfinite(x), np.maximum(x, 0) / 2, 0.0)
+    result = np.full(x.shape, np.nan)
+    # Qui-quadrado infinito (associação perfeita com contagem esperada zero): p = 0
+    result[np.isposinf(x) & (dof >= 1)] = 0.0
+    ok = np.isfinite(x) & (dof >= 1)
+    log_half = np.log(np.where(half > 0, half, 1.0))
+    even, odd = ok & (dof % 2 == 0), ok & (dof % 2 == 1)
+    # Par: e^-h * soma_{i < k/2} h^i / i!; ímpar: erfc(sqrt(h)) + e^-h * soma h^(i-1/2) / Γ(i+1/2)
+    total = np.zeros(x.shape)
+    for i in range(int(dof[ok].max()) // 2 + 1 if ok.any() else 0):
+        term_even = np.exp(i * log_half - half - math.lgamma(i + 1))
+        term_odd = np.exp((i - 0.5) * log_half - half - math.lgamma(i + 0.5)) if i >= 1 else 0.0
+        total += np.where(even & (i < dof / 2), term_even, 0.0)
+        total += np.where(odd & (i >= 1) & (i <= (dof - 1) / 2) & (half > 0), term_odd, 0.0)
+    erfc = np.vectorize(math.erfc, otypes=[float])
+    result[even] = total[even]
+    result[odd] = erfc(np.sqrt(half[odd])) + total[odd]
+    return np.clip(result, 0.0, 1.0)
+
+
+def t_sf_two_sided(t, dof):
+    """P(|T| > |t|) da t de Student (vetorizada; forma fechada para graus inteiros)."""
+    t, dof = np.broadcast_arrays(np.asarray(t, dtype=float), np.asarray(dof, dtype=float))
+    result = np.full(t.shape, np.nan)
+    ok = ~np.isnan(t) & (dof >= 1)
+    theta = np.arctan(np.abs(np.where(ok, t, 0.0)) / np.sqrt(np.where(ok, dof, 1.0)))
+    sin, cos = np.sin(theta), np.cos(theta)
+    even, odd = ok & (dof % 2 == 0), ok & (dof % 2 == 1)
+    # Com θ = atan(|t|/√k), P(|T| < |t|) é, para k par, sen θ * soma_{i < k/2} c_i cos^2i θ com
+    # c_i = 1·3···(2i-1) / 2·4···2i; para k ímpar, (2/π)(θ + sen θ cos θ * soma_{i < (k-1)/2} d_i cos^2i θ)
+    # com d_i = 2·4···2i / 3·5···(2i+1)
+    term_even, term_odd = np.ones(t.shape), np.ones(t.shape)
+    total_even, total_odd = np.zeros(t.shape), np.zeros(t.shape)
+    for i in range(int(dof[ok].max()) // 2 + 1 if ok.any() else 0):
+        if i:
+            term_even = term_even * cos ** 2 * (2 * i - 1) / (2 * i)
+            term_odd = term_odd * cos ** 2 * (2 * i) / (2 * i + 1)
+        total_even += np.where(even & (i < dof / 2), term_even, 0.0)
+        total_odd += np.where(odd & (i < (dof - 1) / 2), term_odd, 0.0)
+    result[even] = 1 - sin[even] * total_even[even]
+    result[odd] = 1 - 2 / np.pi * (theta[odd] + sin[odd] * cos[odd] * total_odd[odd])
+    return np.clip(result, 0.0, 1.0)
+
+
+def _yes_no(series):
+    """SIM/NÃO como texto (booleanos inclusive)."""
+    if pd.api.types.is_bool_dtype(series):
+        return series.astype('boolean').map({True: YES, False: NO}).astype('string')
+    return series.astype('string').str.strip()
+
+
+def categorical_variables(df):
+    """Perguntas fechadas: ({variável: (coluna de origem, respostas em texto)}, {coluna sem variação: resposta dominante})."""
+    variables, constant = {}, {}
+    for col in df.columns:
+        if col in IGNORED_COLUMNS or is_measure(df[col]):
+            continue
+        if col in MULTI_SELECT_COLUMNS:
+            answered = df[col].astype('string').str.strip().replace('', pd.NA)
+            codes, uniques = pd.factorize(answered)
+            # Os itens saem das respostas distintas, que se repetem muito entre produtores
+            items = pd.Series(uniques, dtype='string').str.split(MULTI_SELECT_COLUMNS[col], regex=True).explode()
+            items = pd.DataFrame({'resposta': items.index, 'item': items.str.strip().to_numpy()})
+            items = items[items['item'] != ''].drop_duplicates()
+            items['n'] = np.bincount(codes[codes >= 0], minlength=len(uniques))[items['resposta']]
+            n_answered = int((codes >= 0).sum())
+            counts = items.groupby('item', sort=False)['n'].sum().sort_values(ascending=False, kind='stable')
+            for item, count in counts.items():
+                if count < MIN_LEVEL_COUNT or n_answered - count < MIN_LEVEL_COUNT:
+                    continue
+                has_item = np.isin(codes, items.loc[items['item'] == item, 'resposta'].to_numpy()).astype(np.int8)
+                has_item = pd.Categorical.from_codes(np.where(codes >= 0, has_item, -1), categories=[NO, YES])
+                variables[f'{col}{ITEM_SEPARATOR}{item}'] = (col, pd.Series(has_item, index=df.index))
+            continue
+        answers = _yes_no(df[col])
+        counts = answers.value_counts()
+        frequent = counts.index[counts >= MIN_LEVEL_COUNT]
+        if len(counts) > MAX_LEVELS:
+            continue
+        if len(frequent) < 2:
+            if len(counts):
+                constant[col] = f'{counts.index[0]} ({counts.iloc[0]} de {counts.sum()})'
+            continue
+        variables[col] = (col, answers.where(answers.isin(frequent)))
+    return variables, constant
+
+
+class AssociationMatrix:
+    """Associações entre todos os pares de perguntas de um DataFrame do questionário."""
+
+    def __init__(self, df, row_block=ROW_BLOCK):
+        self.n = len(df)
+        categorical, self.constant = categorical_variables(df)
+        numeric = [col for col in df.columns if col not in IGNORED_COLUMNS and is_measure(df[col])
+                   and df[col].notna().sum() >= MIN_LEVEL_COUNT and df[col].nunique() > 1]
+
+        # Níveis: uma linha por (variável, resposta), agrupados por variável
+        rows, level_ids, levels = [], [], []
+        for variable, (_, answers) in categorical.items():
+            codes, uniques = pd.factorize(answers, sort=True)
+            present = np.flatnonzero(codes >= 0)
+            rows.append(present)
+            level_ids.append(codes[present] + len(levels))
+            levels.extend((variable, str(value)) for value in uniques)
+        self.levels = pd.DataFrame(levels, columns=['variavel', 'resposta'])
+        self.categorical = list(categorical)
+        self.numeric = numeric
+        self.variables = self.categorical + numeric
+        self._level_variable = pd.Categorical(self.levels['variavel'], categories=self.categorical).codes
+        # Pergunta de origem de cada variável e as colunas brutas de que ela depende
+        self._question = [categorical[v][0] if v in categorical else v for v in self.variables]
+        sources = column_sources()
+        self._roots = [sources.get(question, {question}) for question in self._question]
+
+        n_levels = len(self.levels)
+        rows = np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+        level_ids = np.concatenate(level_ids) if level_ids else np.array([], dtype=np.int64)
+        values = df[numeric].astype(float).to_numpy() if numeric else np.zeros((self.n, 0))
+        mask = ~np.isnan(values)
+        filled = np.where(mask, values, 0.0)
+
+        # X'X, X'M, X'Y, X'Y² e os produtos entre as medidas, em blocos de linhas
+        self.cooccurrence = np.zeros((n_levels, n_levels))
+        self._level_count = np.zeros((n_levels, len(numeric)))
+        self._level_sum = np.zeros((n_levels, len(numeric)))
+        self._level_sumsq = np.zeros((n_levels, len(numeric)))
+        order = np.argsort(rows, kind='stable')
+        rows, level_ids = rows[order], level_ids[order]
+        for start in range(0, max(self.n, 1), row_block):
+            stop = min(start + row_block, self.n)
+            lo, hi = np.searchsorted(rows, [start, stop])
+            block = np.zeros((stop - start, n_levels))
+            block[rows[lo:hi] - start, level_ids[lo:hi]] = 1.0
+            self.cooccurrence += block.T @ block
+            self._level_count += block.T @ mask[start:stop]
+            self._level_sum += block.T @ filled[start:stop]
+            self._level_sumsq += block.T @ filled[start:stop] ** 2
+        self._pair_count = mask.T.astype(float) @ mask
+        self._cross_sum = filled.T @ filled
+        self._sum_given = filled.T @ mask            # [i, j]: soma de i onde j respondeu
+        self._sumsq_given = (filled ** 2).T @ mask
+
+        self.table = self._pair_table()
+
+    def _excluded(self, a, b):
+        """Pares que não se comparam: colunas calculadas umas das outras (ou a mesma).
+
+        Itens diferentes da mesma pergunta de múltipla escolha se comparam.
+        """
+        if a != b and self._question[a] == self._question[b] and self._question[a] in MULTI_SELECT_COLUMNS:
+            return False
+        return bool(self._roots[a] & self._roots[b])
+
+    def level_index(self, variable, answer):
+        """Posição do nível (variável, resposta) em self.levels; KeyError se não existir."""
+        matches = np.flatnonzero((self.levels['variavel'] == variable).to_numpy()
+                                 & (self.levels['resposta'].map(fold_accents) == fold_accents(str(answer))).to_numpy())
+        if not len(matches):
+            raise KeyError(f'{variable} = {answer}')
+        return int(matches[0])
+
+    def _categorical_pairs(self):
+        """qui2, gl, n e V de Cramér de todos os pares de variáveis categóricas (matrizes V x V)."""
+        counts = self.cooccurrence
+        groups = np.zeros((len(self.levels), len(self.categorical)))
+        groups[np.arange(len(self.levels)), self._level_variable] = 1.0
+        # Totais de cada nível entre quem respondeu à outra variável do par
+        row_totals = counts @ groups                       # [nível i, variável b]
+        col_totals = groups.T @ counts                     # [variável a, nível j]
+        n = groups.T @ counts @ groups
+        expected = row_totals[:, self._level_variable] * col_totals[self._level_variable, :]
+        pair_n = n[self._level_variable][:, self._level_variable]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            expected = np.where(pair_n > 0, expected / pair_n, 0.0)
+            contributions = np.where(expected > 0, (counts - expected) ** 2 / expected, 0.0)
+        chi2 = groups.T @ contributions @ groups
+        levels_seen = groups.T @ (row_totals > 0)          # [a, b]: níveis de a com alguém que respondeu b
+        dof = (levels_seen - 1) * (levels_seen.T - 1)
+        # V de Cramér com a correção de viés de Bergsma: com poucos produtores
+        # por par o V simples infla (fica perto de 1 só pelo acaso)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            phi2 = np.maximum(chi2 / n - dof / (n - 1), 0)
+            rows_corrected = levels_seen - (levels_seen - 1) ** 2 / (n - 1)
+            cramer = np.sqrt(phi2 / (np.minimum(rows_corrected, rows_corrected.T) - 1))
+        return chi2, dof, n, np.where(np.isfinite(cramer) & (dof > 0), cramer, np.nan)
+
+    def _mixed_pairs(self):
+        """ômega e n de todos os pares (variável categórica, medida) (matrizes V x K)."""
+        groups = np.zeros((len(self.levels), len(self.categorical)))
+        groups[np.arange(len(self.levels)), self._level_variable] = 1.0
+        n = groups.T @ self._level_count
+        total = groups.T @ self._level_sum
+        total_sq = groups.T @ self._level_sumsq
+        # Níveis com alguém que respondeu à medida
+        levels_seen = groups.T @ (self._level_count > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            between = groups.T @ np.where(self._level_count > 0, self._level_sum ** 2 / self._level_count, 0.0)
+            mean_sq = total ** 2 / n
+            ss_between, ss_total = between - mean_sq, total_sq - mean_sq
+            ms_within = (ss_total - ss_between) / (n - levels_seen)
+            omega2 = (ss_between - (levels_seen - 1) * ms_within) / (ss_total + ms_within)
+            omega = np.sqrt(np.clip(omega2, 0, 1))
+        valid = np.isfinite(omega) & (levels_seen > 1) & (n >= MIN_PER_LEVEL * levels_seen)
+        return n, np.where(valid, omega, np.nan)
+
+    def _numeric_pairs(self):
+        """r de Pearson, p-valor e n de todos os pares de medidas (matrizes K x K, casos completos por par)."""
+        n = self._pair_count
+        sum_x, sum_y = self._sum_given, self._sum_given.T
+        sumsq_x, sumsq_y = self._sumsq_given, self._sumsq_given.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = (n * self._cross_sum - sum_x * sum_y) / np.sqrt((n * sumsq_x - sum_x ** 2) * (n * sumsq_y - sum_y ** 2))
+            r = np.where(np.isfinite(r) & (n >= MIN_PAIRS), np.clip(r, -1, 1), np.nan)
+            t = r * np.sqrt((n - 2) / (1 - r ** 2))
+        return n, r, t_sf_two_sided(t, n - 2)
+
+    def _pair_table(self):
+        """Uma linha por par de variáveis: variavel_a, variavel_b, medida, valor, n, qui2, gl, p_valor."""
+        n_cat = len(self.categorical)
+        chi2, dof, cat_n, cramer = self._categorical_pairs()
+        mixed_n, omega = self._mixed_pairs()
+        num_n, pearson, pearson_p = self._numeric_pairs()
+        frames = []
+        a, b = np.triu_indices(n_cat, k=1)
+        frames.append(pd.DataFrame({'a': a, 'b': b, 'medida': MEASURES['categorica'], 'valor': cramer[a, b],
+                                    'n': cat_n[a, b], 'qui2': chi2[a, b], 'gl': dof[a, b]}))
+        a, k = np.meshgrid(np.arange(n_cat), np.arange(len(self.numeric)), indexing='ij')
+        frames.append(pd.DataFrame({'a': a.ravel(), 'b': k.ravel() + n_cat, 'medida': MEASURES['mista'],
+                                    'valor': omega.ravel(), 'n': mixed_n.ravel()}))
+        i, j = np.triu_indices(len(self.numeric), k=1)
+        frames.append(pd.DataFrame({'a': i + n_cat, 'b': j + n_cat, 'medida': MEASURES['numerica'],
+                                    'valor': pearson[i, j], 'n': num_n[i, j], 'p_valor': pearson_p[i, j]}))
+        table = pd.concat(frames, ignore_index=True)
+        keep = [not self._excluded(x, y) for x, y in zip(table['a'], table['b'])]
+        table = table[np.array(keep, dtype=bool) & table['valor'].notna()]
+        table = table.assign(
+            variavel_a=np.array(self.variables, dtype=object)[table['a']],
+            variavel_b=np.array(self.variables, dtype=object)[table['b']],
+            n=table['n'].astype(int),
+            p_valor=table['p_valor'].where(table['qui2'].isna(), chi2_sf(table['qui2'], table['gl'])),
+        )
+        table = table.reindex(table['valor'].abs().sort_values(ascending=False).index)
+        return table[['variavel_a', 'variavel_b', 'medida', 'valor', 'n', 'qui2', 'gl', 'p_valor']].reset_index(drop=True)
+
+    def strongest(self, variable=None, k=10, min_n=MIN_LEVEL_COUNT * 2):
+        """Pares mais associados (com `variable`, se dada), do mais forte para o mais fraco."""
+        table = self.table[self.table['n'] >= min_n]
+        if variable is not None:
+            table = table[(table['variavel_a'] == variable) | (table['variavel_b'] == variable)]
+        return table.head(k).reset_index(drop=True)
+
+    def matrix(self, variables=None):
+        """Matriz simétrica variável x variável com |valor| de cada par (NaN nos pares não comparados)."""
+        variables = list(variables) if variables is not None else self.variables
+        both = pd.concat([self.table, self.table.rename(columns={'variavel_a': 'variavel_b', 'variavel_b': 'variavel_a'})])
+        both = both[both['variavel_a'].isin(variables) & both['variavel_b'].isin(variables)]
+        wide = both.pivot_table(index='variavel_a', columns='variavel_b', values='valor', aggfunc='first').abs()
+        wide = wide.reindex(index=variables, columns=variables)
+        for variable in variables:
+            wide.loc[variable, variable] = 1.0
+        return wide
+
+    def top_variables(self, k=20, min_n=MIN_LEVEL_COUNT * 2):
+        """As k variáveis que aparecem nos pares mais fortes (para o mapa de calor)."""
+        table = self.table[self.table['n'] >= min_n]
+        ordered = pd.unique(table[['variavel_a', 'variavel_b']].to_numpy().ravel())
+        return list(ordered[:k])
+
+    def related(self, variable, answer, k=10, min_count=MIN_LEVEL_COUNT):
+        """O que anda junto da resposta `answer` de `variable`.
+
+        DataFrame (variavel, resposta, medida, valor, com, sem, n): para respostas
+        de outras perguntas, phi e % dos que têm / não têm a resposta-alvo; para
+        medidas, ponto-bisserial e a média entre os que têm / não têm.
+        """
+        target = self.level_index(variable, answer)
+        target_variable = self.variables.index(variable)
+        counts = self.cooccurrence
+        groups = np.zeros((len(self.levels), len(self.categorical)))
+        groups[np.arange(len(self.levels)), self._level_variable] = 1.0
+        # Para cada nível j: alvo entre quem respondeu j's pergunta, j entre quem respondeu a do alvo
+        with_target = (counts[target] @ groups)[self._level_variable]
+        level_total = (groups[:, self._level_variable[target]] @ counts)
+        n = (groups.T @ counts @ groups)[self._level_variable[target]][self._level_variable]
+        both = counts[target]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            phi = (n * both - with_target * level_total) / np.sqrt(
+                with_target * (n - with_target) * level_total * (n - level_total))
+            pct_with = both / with_target * 100
+            pct_without = (level_total - both) / (n - with_target) * 100
+        other = np.array([not self._excluded(target_variable, v) for v in self._level_variable], dtype=bool)
+        levels = pd.DataFrame({
+            'variavel': self.levels['variavel'], 'resposta': self.levels['resposta'], 'medida': 'phi',
+            'valor': phi, 'com': pct_with, 'sem': pct_without, 'n': n.astype(int),
+        })[other & (both >= min_count) & np.isfinite(phi)]
+
+        # Medidas: média de quem tem a resposta-alvo contra a dos demais da mesma pergunta
+        target_groups = groups[:, self._level_variable[target]]
+        n_in, sum_in = self._level_count[target], self._level_sum[target]
+        n_all, sum_all = target_groups @ self._level_count, target_groups @ self._level_sum
+        sumsq_all = target_groups @ self._level_sumsq
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_in, mean_out = sum_in / n_in, (sum_all - sum_in) / (n_all - n_in)
+            std = np.sqrt(sumsq_all / n_all - (sum_all / n_all) ** 2)
+            share = n_in / n_all
+            point_biserial = (mean_in - mean_out) * np.sqrt(share * (1 - share)) / std
+        keep = np.array([not self._excluded(target_variable, len(self.categorical) + i)
+                         for i in range(len(self.numeric))], dtype=bool)
+        measures = pd.DataFrame({
+            'variavel': self.numeric, 'resposta': '', 'medida': 'ponto-bisserial', 'valor': point_biserial,
+            'com': mean_in, 'sem': mean_out, 'n': n_all.astype(int),
+        })[keep & (n_in >= min_count) & (n_all - n_in >= min_count) & np.isfinite(point_biserial)]
+        result = pd.concat([levels, measures], ignore_index=True)
+        result = result[result['valor'] > 0] if len(result) else result
+        return result.sort_values('valor', ascending=False, ignore_index=True).head(k)
+
+    def find_answer(self, question, column_index=None):
+        """(variável, resposta) citada na pergunta ("produção BOA"), ou None.
+
+        Entre respostas iguais de perguntas diferentes (SIM, BOA...), vence a
+        pergunta que o column_index considera mais relevante; SIM/NÃO só valem
+        para uma pergunta (ou item) citada.
+        """
+        folded = f' {fold_accents(question)} '
+        mentioned = [col for col, _ in column_index.search(question, k=20)] if column_index is not None else []
+        yes_no = (fold_accents(YES), fold_accents(NO))
+        candidates = []
+        for position, (variable, answer) in enumerate(zip(self.levels['variavel'], self.levels['resposta'])):
+            answer_folded = fold_accents(answer)
+            if len(answer_folded) < 2 or not re.search(rf'(?<!\w){re.escape(answer_folded)}(?!\w)', folded):
+                continue
+            question_col = self._question[self.variables.index(variable)]
+            item = fold_accents(variable.split(ITEM_SEPARATOR, 1)[1]) if ITEM_SEPARATOR in variable else ''
+            rank = mentioned.index(question_col) if question_col in mentioned else len(mentioned)
+            mentions_item = bool(item) and item in folded
+            if answer_folded in yes_no and not mentions_item and (item or rank == len(mentioned)):
+                continue
+            candidates.append((not mentions_item, rank, -len(answer_folded), -self.cooccurrence[position, position],
+                               variable, answer))
+        if not candidates:
+            return None
+        *_, variable, answer = min(candidates)
+        return variable, answer
+
+
+def is_association_question(question):
+    folded = fold_accents(question).lower()
+    return any(word in folded for word in ASSOCIATION_WORDS)
+
+
+def _topic(question):
+    """A pergunta sem as palavras de associação ("associado" não é a coluna "É associado...?")."""
+    words = fold_accents(question).lower()
+    for phrase in (word for word in ASSOCIATION_WORDS if ' ' in word):
+        words = words.replace(phrase, ' ')
+    stems = tuple(word for word in ASSOCIATION_WORDS if ' ' not in word)
+    return ' '.join(word for word in words.split() if not word.startswith(stems))
+
+
+def _describe(row):
+    if row['medida'] == 'phi':
+        return (f"- **{row['variavel']} = {row['resposta']}**: {row['com']:.0f}% de quem tem a resposta "
+                f"vs {row['sem']:.0f}% dos demais (phi {row['valor']:.2f})")
+    return (f"- **{row['variavel']}**: média {row['com']:.2f} vs {row['sem']:.2f} dos demais "
+            f"(ponto-bisserial {row['valor']:.2f})")
+
+
+def answer_question(question, matrix, column_index=None, k=8):
+    """Resposta do chat (texto e plot_config) para perguntas de associação, ou None."""
+    if not is_association_question(question):
+        return None
+    topic = _topic(question)
+    found = matrix.find_answer(topic, column_index)
+    if found:
+        variable, answer = found
+        related = matrix.related(variable, answer, k=k)
+        if related.empty:
+            return {'text': f'Não encontrei respostas associadas a **{variable} = {answer}** '
+                            f'entre os {matrix.n} produtores.',
+                    'plot_config': None}
+        position = matrix.level_index(variable, answer)
+        count = int(matrix.cooccurrence[position, position])
+        lines = [f'**O que anda junto de "{variable}" = {answer}** ({count} de {matrix.n} produtores):', '']
+        lines += [_describe(row) for _, row in related.iterrows()]
+        labels = [f"{row['variavel']} = {row['resposta']}" if row['resposta'] else row['variavel']
+                  for _, row in related.iterrows()]
+        plot_config = {'type': 'bar', 'params': {
+            'x': related['valor'].round(3).tolist()[::-1], 'y': labels[::-1], 'orientation': 'h',
+            'title': f'Associação com {variable} = {answer}', 'labels': {'x': 'phi / ponto-bisserial', 'y': ''}}}
+    else:
+        mentioned = [col for col, _ in column_index.search(topic, k=10)] if column_index is not None else []
+        variable = next((col for col in mentioned if col in matrix.variables or col in matrix.constant), None)
+        if variable is None:
+            return None
+        if variable in matrix.constant:
+            return {'text': f'Em "{variable}" quase todos deram a mesma resposta: {matrix.constant[variable]}. '
+                            'Sem variação entre os produtores, não dá para medir o que está associado a ela.',
+                    'plot_config': None}
+        strongest = matrix.strongest(variable, k=k)
+        if strongest.empty:
+            return None
+        lines = [f'**Perguntas mais associadas a "{variable}"** ({matrix.n} produtores):', '']
+        others = np.where(strongest['variavel_a'] == variable, strongest['variavel_b'], strongest['variavel_a'])
+        for other, (_, row) in zip(others, strongest.iterrows()):
+            p_value = f", p = {row['p_valor']:.3f}" if pd.notna(row['p_valor']) else ''
+            lines.append(f"- **{other}**: {row['medida']} {row['valor']:.2f} (n = {row['n']}{p_value})")
+        labels = list(others)
+        plot_config = {'type': 'bar', 'params': {
+            'x': strongest['valor'].abs().round(3).tolist()[::-1], 'y': labels[::-1], 'orientation': 'h',
+            'title': f'Associação com {variable}', 'labels': {'x': 'Força da associação', 'y': ''}}}
+    lines += ['', '_Associação não quer dizer causa; com poucos produtores, trate como pista._']
+    return {'text': '\n'.join(lines), 'plot_config': plot_config}
+
+
+def main():
+    import time
+
+    import ingest
+    from data_pipeline import DEFAULT_MUNICIPIO, apply_filters
+
+    parser = argparse.ArgumentParser(description='Associações entre as perguntas do questionário.')
+    parser.add_argument('--municipio', default=DEFAULT_MUNICIPIO)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--pergunta', default=None, help='pergunta (coluna) da resposta-alvo')
+    parser.add_argument('--resposta', default=None, help='resposta-alvo, ex.: BOA')
+    args = parser.parse_args()
+
+    df = apply_filters(ingest.load_store(municipios=[args.municipio],
+                                         ondas=[ingest.municipality_waves(args.municipio)[-1]]))
+    start = time.perf_counter()
+    matrix = AssociationMatrix(df)
+    elapsed = time.perf_counter() - start
+    print(f'{len(matrix.variables)} variáveis ({len(matrix.levels)} níveis, {len(matrix.numeric)} medidas), '
+          f'{len(matrix.table)} pares em {elapsed:.2f}s')
+    with pd.option_context('display.width', 200, 'display.max_colwidth', 60):
+        if args.pergunta and args.resposta:
+            print(matrix.related(args.pergunta, args.resposta, k=args.top).to_string(index=False))
+        else:
+            print(matrix.strongest(args.pergunta, k=args.top).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
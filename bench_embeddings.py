@@ -0,0 +1,124 @@
+# Comparação dos backends de embedding sobre os trechos de contexto do questionário.
+#
+# Uso:
+#     python bench_embeddings.py [--backends huggingface onnx-int8] [--k 5] [--repeat 20]
+#
+# Cada backend roda em um processo separado, para que a memória medida (pico de
+# RSS) seja só dele. Para cada um são medidos: tempo de carga do modelo,
+# throughput de codificação dos trechos, latência de consulta (p50/p95) e pico
+# de memória. A concordância de recuperação é a fração dos top-k trechos de cada
+# pergunta que coincide com os do primeiro backend da lista (a referência).
+
+import argparse
+import multiprocessing as mp
+import resource
+import time
+
+import numpy as np
+
+from context_builder import generate_context_sections
+from data_pipeline import load_survey
+from embeddings import BACKENDS, get_embeddings
+
+
+QUERIES = [
+    'Quais as principais pragas da mandioca?',
+    'Qual o preço médio da farinha?',
+    'Quantos produtores recebem assistência técnica?',
+    'Quais variedades de macaxeira são cultivadas?',
+    'Quais as dificuldades na comercialização da farinha?',
+    'Qual a renda familiar dos produtores?',
+    'Como é feito o escoamento da produção?',
+    'Quantas pessoas trabalham no cultivo?',
+    'Os produtores fazem calagem ou adubação?',
+    'Em quais meses o preço da farinha é mais baixo?',
+]
+
+
+def _peak_rss_mb():
+    # ru_maxrss está em KB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_backend(backend, chunks, queries, repeat, results):
+    start = time.perf_counter()
+    model = get_embeddings(backend)
+    load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    doc_vectors = np.asarray(model.embed_documents(chunks), dtype=np.float32)
+    encode_s = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            model.embed_query(query)
+            latencies.append(time.perf_counter() - start)
+    query_vectors = np.asarray([model.embed_query(q) for q in queries], dtype=np.float32)
+
+    results[backend] = {
+        'load_s': load_s,
+        'docs_per_s': len(chunks) / encode_s if encode_s else float('inf'),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'peak_rss_mb': _peak_rss_mb(),
+        'doc_vectors': doc_vectors,
+        'query_vectors': query_vectors,
+    }
+
+
+def top_k(doc_vectors, query_vectors, k):
+    """Índices dos k trechos mais similares (produto interno) para cada pergunta."""
+    scores = query_vectors @ doc_vectors.T
+    return np.argsort(-scores, axis=1, kind='stable')[:, :k]
+
+
+def agreement(reference, other):
+    """Fração média de trechos em comum entre dois conjuntos top-k."""
+    k = reference.shape[1]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(reference, other)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compara os backends de embedding do Maniv.IA.')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    chunks = [section['text'] for section in generate_context_sections(load_survey())]
+    print(f'{len(chunks)} trechos de contexto, {len(QUERIES)} perguntas\n')
+
+    ctx = mp.get_context('spawn')
+    manager = ctx.Manager()
+    results = manager.dict()
+    for backend in args.backends:
+        proc = ctx.Process(target=_run_backend, args=(backend, chunks, QUERIES, args.repeat, results))
+        proc.start()
+        proc.join()
+        if proc.exitcode != 0:
+            print(f'{backend}: falhou (código {proc.exitcode})')
+    results = dict(results)
+    if not results:
+        return
+
+    reference_name = next(b for b in args.backends if b in results)
+    reference = results[reference_name]
+    reference_top = top_k(reference['doc_vectors'], reference['query_vectors'], args.k)
+
+    header = f"{'backend':<12}{'carga (s)':>10}{'docs/s':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}{'RSS (MB)':>10}{f'acordo@{args.k}':>11}"
+    print(header)
+    print('-' * len(header))
+    for backend in args.backends:
+        if backend not in results:
+            continue
+        r = results[backend]
+        agree = agreement(reference_top, top_k(r['doc_vectors'], r['query_vectors'], args.k))
+        print(f"{backend:<12}{r['load_s']:>10.2f}{r['docs_per_s']:>10.1f}{r['p50_ms']:>10.2f}"
+              f"{r['p95_ms']:>10.2f}{r['peak_rss_mb']:>10.0f}{agree:>11.2f}")
+    print(f'\nReferência para a concordância: {reference_name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+# Canonicalização das respostas em texto livre do questionário.
+#
+# As respostas chegam com erros de digitação ("LARGATA", "GARFANHOTO",
+# "ESCOAMNETO"), espaços sobrando ("SIM ", "NÃO ") e caixa misturada
+# ("Largata", "LAGARTA"). Este módulo:
+#   1. limpa espaços e aplica apelidos conhecidos ("SM" -> "SIM");
+#   2. compara, sem acentos, cada palavra com um vocabulário curado usando
+#      similaridade de bigramas em lote (produto de matrizes) e confirma o
+#      melhor candidato com difflib; só vale troca com cara de erro de
+#      digitação (mesmo tamanho +-1, até MAX_EDITS edições, mesmo fim de
+#      palavra: "CAPINAR" não vira "CAPINA") e só nas colunas de múltipla
+#      escolha e nas de poucos valores distintos (texto livre fica como veio);
+#   3. agrupa variantes que só diferem em caixa/acentos e escolhe a grafia
+#      mais frequente como forma canônica;
+#   4. guarda o mapeamento valor bruto -> valor canônico em um cache JSON,
+#      de modo que só valores nunca vistos passam pelo casamento aproximado.
+#      O cache guarda o hash do vocabulário, dos apelidos e dos limiares
+#      (vocabulary_hash); se algum mudar, o cache é descartado e refeito.
+
+import difflib
+import hashlib
+import json
+import os
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+import pandas as pd
+
+
+CACHE_PATH = os.path.join('.cache', 'canonical_map.json')
+
+# Palavras de referência (forma canônica, com acentos). Só palavras com pelo
+# menos MIN_WORD_LEN letras são corrigidas.
+VOCABULARIO = [
+    'LAGARTA', 'GAFANHOTO', 'FORMIGA', 'CORTADEIRA', 'BROCA', 'MANIVA', 'PRAGAS',
+    'ESCOAMENTO', 'OPORTUNIDADE', 'ESPECIALIZADAS', 'DIFICULDADE', 'DIFICULDADES',
+    'COMERCIALIZAÇÃO', 'PROCESSAMENTO', 'ASSISTÊNCIA', 'TÉCNICA', 'COLHEITA',
+    'TRANSPORTE', 'TORRAÇÃO', 'DESCASCA', 'FARINHA', 'TAPIOCA', 'TUCUPI',
+    'MANDIOCA', 'MACAXEIRA', 'ATRAVESSADOR', 'CONSUMIDOR', 'COMERCIANTES',
+    'PREPARO', 'MAQUINÁRIO', 'CAPINA', 'ROÇAGEM', 'ADUBAÇÃO', 'ORGÂNICA',
+    'MECANIZAÇÃO', 'SUBSISTÊNCIA', 'PRODUÇÃO', 'PRODUTIVIDADE', 'COMPRADOR',
+    'IMPORTÂNCIA', 'RENTABILIDADE', 'TRABALHADOR', 'DESGASTE', 'FÍSICO',
+    'PRÓPRIA', 'PRÓPRIO', 'COMUNIDADE', 'MUNICÍPIO', 'DESCARTE', 'DESCARTA',
+    'MECANIZADA',
+]
+
+# Respostas inteiras com grafia alternativa conhecida
+APELIDOS = {
+    'SM': 'SIM',
+    'N.A': 'N.A.',
+    'N. A.': 'N.A.',
+    'N. A': 'N.A.',
+    'NA': 'N.A.',
+}
+
+# Colunas de múltipla escolha e o separador entre itens. Vírgulas dentro de
+# parênteses não separam itens ("PREPARO DE ÁREA (DERRUBA, DIÁRIA ...)").
+_SEP_VIRGULA = r'\s*,\s*(?![^()]*\))'
+MULTI_SELECT_COLUMNS = {
+    'Variedades_Mandioca': _SEP_VIRGULA,
+    'Qual(s) variedade(s) de MACAXEIRA?': _SEP_VIRGULA,
+    'Qual a forma de obtenção da maniva semente?': _SEP_VIRGULA,
+    'Se não, por quê?': _SEP_VIRGULA,
+    'Se sim, quais pragas?': r'\s*,\s*|\s+[Ee]\s+',
+    'Quais os principais custos do preparo e condução do plantio?': _SEP_VIRGULA,
+    'Dificuldades_Cultivo': _SEP_VIRGULA,
+    'Produtos_Comercializados': _SEP_VIRGULA,
+    'Local_Comercializacao': _SEP_VIRGULA,
+    'Com quem comercializa os produtos ?': _SEP_VIRGULA,
+    'Como é feito o pagamento dos produtos ou das raízes de mandiova e/ou macaxeira?': _SEP_VIRGULA,
+    'Se sim, como utiliza os resíduos?': _SEP_VIRGULA,
+    'Dificuldades_Comercializacao': _SEP_VIRGULA,
+    'Quais os principais custos da produção de farinha e derivados?': _SEP_VIRGULA,
+    'Dificuldades_Processamento': _SEP_VIRGULA,
+}
+
+# Colunas de identificação/metadados que não devem ser alteradas
+EXCLUDED_COLUMNS = {
+    'Nome produtor (entrevistado)', 'Nome da propriedade',
+    'Data resposta', 'Hora resposta', 'Data da tarefa',
+}
+
+MIN_WORD_LEN = 5
+MAX_EDITS = 2               # edições (Levenshtein) de uma correção aproximada
+# Acima disso a coluna é texto livre: só limpeza, sem correção aproximada
+MAX_FUZZY_UNIQUE = 50
+CANDIDATE_THRESHOLD = 0.7   # cosseno de bigramas (pré-filtro vetorizado)
+CONFIRM_THRESHOLD = 0.85    # razão do difflib (confirmação do melhor candidato)
+_HASH_DIM = 1024
+
+_RE_SPACES = re.compile(r'\s+')
+_RE_WORD = re.compile(r'\w+')
+_RE_ACCENTS = '[\u0300-\u036f]'
+
+
+def fold_accents(text):
+    """'Assistência  técnica' -> 'ASSISTENCIA TECNICA' (sem acento, caixa alta)."""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _RE_SPACES.sub(' ', text).strip().upper()
+
+
+def fold_series(series):
+    """Versão vetorizada de fold_accents para uma Series de texto."""
+    return (series.astype('string')
+            .str.normalize('NFKD')
+            .str.replace(_RE_ACCENTS, '', regex=True)
+            .str.replace(_RE_SPACES, ' ', regex=True)
+            .str.strip()
+            .str.upper())
+
+
+def slugify(name):
+    """Nome de arquivo/diretório: 'Café torrado' -> 'cafe_torrado'."""
+    return re.sub(r'[^a-z0-9]+', '_', fold_accents(name).lower()).strip('_')
+
+
+def _bigram_matrix(words):
+    """Matriz (len(words) x _HASH_DIM) de contagens de bigramas, normalizada por linha."""
+    matrix = np.zeros((len(words), _HASH_DIM), dtype=np.float32)
+    for i, word in enumerate(words):
+        padded = f' {word} '
+        for j in range(len(padded) - 1):
+            matrix[i, zlib.crc32(padded[j:j + 2].encode()) % _HASH_DIM] += 1
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+_VOCAB_FOLDED = [fold_accents(w) for w in VOCABULARIO]
+_VOCAB_BY_FOLDED = dict(zip(_VOCAB_FOLDED, VOCABULARIO))
+_VOCAB_MATRIX = _bigram_matrix(_VOCAB_FOLDED)
+
+
+def _edit_distance(word, target):
+    """Distância de Levenshtein (inserções, remoções e trocas de letra)."""
+    previous = list(range(len(target) + 1))
+    for i, char in enumerate(word, 1):
+        current = [i]
+        for j, other in enumerate(target, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+        previous = current
+    return previous[-1]
+
+
+def _is_typo(word, target):
+    """Troca com cara de erro de digitação ('LARGATA'/'LAGARTA').
+
+    Tamanho igual +-1 e até MAX_EDITS edições; trocar o fim da palavra (outra
+    letra final ou só letras a mais no fim) é flexão, não erro
+    ('TECNICAS'/'TECNICA', 'CAPINAR'/'CAPINA', 'TRANSPORTAR'/'TRANSPORTE').
+    """
+    if abs(len(word) - len(target)) > 1 or word[-1] != target[-1]:
+        return False
+    if word.startswith(target) or target.startswith(word):
+        return False
+    return _edit_distance(word, target) <= MAX_EDITS
+
+
+def match_words(words):
+    """Casa, em lote, palavras (sem acento) com o vocabulário.
+
+    Devolve {palavra: forma canônica} apenas para as palavras corrigidas.
+    """
+    candidates = [w for w in words if len(w) >= MIN_WORD_LEN and w not in _VOCAB_BY_FOLDED]
+    if not candidates:
+        return {}
+    scores = _bigram_matrix(candidates) @ _VOCAB_MATRIX.T
+    best = scores.argmax(axis=1)
+    best_score = scores[np.arange(len(candidates)), best]
+
+    corrections = {}
+    for word, idx, score in zip(candidates, best, best_score):
+        if score < CANDIDATE_THRESHOLD:
+            continue
+        target = _VOCAB_FOLDED[idx]
+        if not _is_typo(word, target):
+            continue
+        if difflib.SequenceMatcher(None, word, target).ratio() >= CONFIRM_THRESHOLD:
+            corrections[word] = _VOCAB_BY_FOLDED[target]
+    return corrections
+
+
+def _match_case(original, canonical):
+    """Aplica à palavra canônica a caixa da palavra original."""
+    if original.isupper():
+        return canonical.upper()
+    if original.islower():
+        return canonical.lower()
+    if original[:1].isupper():
+        return canonical.capitalize()
+    return canonical
+
+
+def _clean(value):
+    value = _RE_SPACES.sub(' ', value).strip()
+    return APELIDOS.get(value.upper(), value)
+
+
+def canonicalize_values(values, counts=None, fuzzy=True):
+    """Canonicaliza uma lista de valores distintos.
+
+    Devolve {valor bruto: valor canônico}. `counts` (mesma ordem de `values`)
+    decide qual grafia vence quando variantes só diferem em caixa/acentos;
+    com fuzzy=False as palavras não passam pelo casamento aproximado.
+    """
+    if counts is None:
+        counts = [1] * len(values)
+    cleaned = [_clean(v) for v in values]
+
+    # Casamento aproximado em lote de todas as palavras distintas
+    words = {fold_accents(w) for text in cleaned for w in _RE_WORD.findall(text)} if fuzzy else set()
+    corrections = match_words(sorted(words))
+
+    def fix(match):
+        word = match.group(0)
+        canonical = corrections.get(fold_accents(word))
+        return _match_case(word, canonical) if canonical else word
+
+    corrected = [_RE_WORD.sub(fix, text) if corrections else text for text in cleaned]
+
+    # Grafia mais frequente por chave sem acento/caixa
+    totals = {}
+    for text, count in zip(corrected, counts):
+        key = fold_accents(text)
+        totals.setdefault(key, {})
+        totals[key][text] = totals[key].get(text, 0) + count
+    representative = {
+        key: max(sorted(forms), key=lambda form: forms[form])
+        for key, forms in totals.items()
+    }
+    return {raw: representative[fold_accents(text)] for raw, text in zip(values, corrected)}
+
+
+def vocabulary_hash():
+    """Hash do que decide as correções: vocabulário, apelidos e limiares."""
+    state = json.dumps([VOCABULARIO, APELIDOS, MIN_WORD_LEN, CANDIDATE_THRESHOLD, CONFIRM_THRESHOLD,
+                        MAX_EDITS, MAX_FUZZY_UNIQUE], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(state.encode('utf-8')).hexdigest()[:16]
+
+
+def load_cache(path=CACHE_PATH):
+    """Carrega o mapeamento persistido ({coluna: {bruto: canônico}}); vazio se o vocabulário mudou."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if not isinstance(stored, dict) or stored.get('vocabulario') != vocabulary_hash():
+        return {}
+    return stored.get('colunas', {})
+
+
+def save_cache(cache, path=CACHE_PATH):
+    """Grava o mapeamento; falhas de escrita (disco somente leitura) são ignoradas."""
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'vocabulario': vocabulary_hash(), 'colunas': cache}, f,
+                      ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def _split_items(series, separator):
+    """Explode uma coluna de múltipla escolha em itens (um por linha)."""
+    return series.str.split(separator, regex=True).explode().str.strip()
+
+
+def canonicalize_column(series, mapping, separator=None):
+    """Canonicaliza uma coluna usando (e completando) o dicionário `mapping`.
+
+    A correção aproximada só vale para múltipla escolha (`separator`) e para
+    colunas com até MAX_FUZZY_UNIQUE valores distintos, contando os já vistos
+    em `mapping` (cargas incrementais não fazem o texto livre parecer curto).
+    """
+    text = series.dropna().astype(str)
+    items = _split_items(text, separator) if separator else text
+    items = items[items != '']
+
+    # Só valores ainda não vistos vão para o casamento aproximado
+    distinct = items.value_counts()
+    unseen = distinct[~distinct.index.isin(list(mapping))]
+    if len(unseen):
+        fuzzy = bool(separator) or len(mapping) + len(unseen) <= MAX_FUZZY_UNIQUE
+        new = canonicalize_values(list(unseen.index), list(unseen.values), fuzzy)
+        # Variantes novas de um valor já conhecido mantêm a grafia já escolhida
+        known = {fold_accents(canon): canon for canon in mapping.values()}
+        mapping.update({raw: known.get(fold_accents(canon), canon) for raw, canon in new.items()})
+
+    if separator:
+        canon = items.map(mapping)
+        joined = canon.groupby(level=0).agg(', '.join)
+        result = series.copy().astype(object)
+        result.loc[joined.index] = joined
+        return result
+    mapped = series.map(mapping)
+    return mapped.where(mapped.notna(), series)
+
+
+def canonical_columns(df):
+    """Colunas de texto que passam pela canonicalização."""
+    return [
+        col for col in df.columns
+        if col not in EXCLUDED_COLUMNS
+        and (col in MULTI_SELECT_COLUMNS or not pd.api.types.is_numeric_dtype(df[col]))
+    ]
+
+
+def canonicalize_dataframe(df, cache_path=CACHE_PATH):
+    """Canonicaliza todas as colunas categóricas e de múltipla escolha de uma vez."""
+    cache = load_cache(cache_path)
+    before = sum(len(m) for m in cache.values())
+    df = df.copy()
+    for col in canonical_columns(df):
+        mapping = cache.setdefault(col, {})
+        df[col] = canonicalize_column(df[col], mapping, MULTI_SELECT_COLUMNS.get(col))
+    if sum(len(m) for m in cache.values()) != before:
+        save_cache(cache, cache_path)
+    return df
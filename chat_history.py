@@ -0,0 +1,131 @@
+# Histórico de conversa do Maniv.IA com custo fixo por rerun.
+#
+# Cada mensagem guarda só texto e a especificação do gráfico (plot_config em
+# formato JSON), nunca a figura. As figuras são renderizadas uma única vez e
+# guardadas em um cache LRU compartilhado (FigureCache), indexado pelo hash da
+# especificação + versão dos dados; nos reruns seguintes o histórico é exibido
+# a partir desse cache, sem pandas nem Plotly.
+#
+# O histórico é limitado a MAX_MESSAGES mensagens. As mais antigas são
+# resumidas (quantidade de trocas e últimas perguntas) em vez de mantidas, então
+# uma conversa longa custa o mesmo por rerun que uma curta.
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+MAX_MESSAGES = 20
+SUMMARY_QUESTIONS = 5
+FIGURE_CACHE_SIZE = 256
+
+
+def _to_json_value(value):
+    if isinstance(value, (pd.Index, pd.Series, np.ndarray)):
+        return [_to_json_value(v) for v in value.tolist()]
+    if isinstance(value, dict):
+        return {str(k): _to_json_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json_value(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def compact_plot_config(plot_config):
+    """Converte Index/arrays do plot_config em listas (serializável e leve)."""
+    return _to_json_value(plot_config) if plot_config else None
+
+
+def figure_key(plot_config, data_key=''):
+    """Chave estável de uma figura: hash da especificação + versão dos dados."""
+    spec = json.dumps(plot_config, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f'{data_key}\n{spec}'.encode('utf-8')).hexdigest()[:20]
+
+
+class FigureCache:
+    """Cache LRU de figuras já renderizadas (dicts JSON do Plotly), thread-safe."""
+
+    def __init__(self, max_entries=FIGURE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            figure = self._figures.get(key)
+            if figure is not None:
+                self._figures.move_to_end(key)
+            return figure
+
+    def put(self, key, figure):
+        with self._lock:
+            self._figures[key] = figure
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.max_entries:
+                self._figures.popitem(last=False)
+
+    def get_or_render(self, key, render):
+        """Devolve a figura do cache ou chama render() (que devolve uma go.Figure)."""
+        figure = self.get(key)
+        if figure is None:
+            fig = render()
+            if fig is None:
+                return None
+            figure = json.loads(fig.to_json())
+            self.put(key, figure)
+        return figure
+
+
+class ChatHistory:
+    """Mensagens recentes + resumo das antigas."""
+
+    def __init__(self, greeting=None, max_messages=MAX_MESSAGES):
+        self.max_messages = max_messages
+        self.messages = []
+        self.next_id = 0
+        self.summarized_messages = 0
+        self.summarized_questions = []
+        if greeting:
+            self.append({'role': 'assistant', 'content': greeting})
+
+    def append(self, message):
+        """Adiciona uma mensagem (o plot_config é compactado) e aplica o limite.
+
+        Cada mensagem recebe um 'id' sequencial, usado como chave dos elementos
+        na tela (gráficos iguais em mensagens diferentes não colidem).
+        """
+        message = dict(message, id=self.next_id)
+        self.next_id += 1
+        if message.get('plot_config'):
+            message['plot_config'] = compact_plot_config(message['plot_config'])
+        self.messages.append(message)
+        self._enforce_limit()
+
+    def _enforce_limit(self):
+        overflow = len(self.messages) - self.max_messages
+        if overflow <= 0:
+            return
+        old, self.messages = self.messages[:overflow], self.messages[overflow:]
+        self.summarized_messages += len(old)
+        questions = [m['content'] for m in old if m.get('role') == 'user']
+        self.summarized_questions = (self.summarized_questions + questions)[-SUMMARY_QUESTIONS:]
+
+    def summary(self):
+        """Resumo textual das mensagens que saíram da janela (ou None)."""
+        if not self.summarized_messages:
+            return None
+        text = f'{self.summarized_messages} mensagens anteriores foram resumidas.'
+        if self.summarized_questions:
+            text += ' Últimas perguntas: ' + '; '.join(f'"{q}"' for q in self.summarized_questions)
+        return text
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __len__(self):
+        return len(self.messages)
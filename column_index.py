@@ -0,0 +1,170 @@
+# Índice invertido de colunas para o planejador de gráficos do Maniv.IA.
+#
+# Os nomes das colunas são perguntas longas em português ou chaves como
+# "Area_Mandioca_ha", que raramente aparecem literalmente na pergunta do
+# usuário. O índice mapeia termos (sem acento, em minúsculas, com um stemming
+# simples) para colunas, a partir de três fontes com pesos diferentes:
+#   - tokens do nome da coluna;
+#   - sinônimos curados (COLUMN_SYNONYMS);
+#   - tokens dos valores de resposta das colunas categóricas.
+# Cada termo é ponderado pelo IDF entre colunas. A busca é só tokenização +
+# consultas em dicionário, então leva bem menos de 1 ms mesmo com centenas de
+# colunas.
+
+import math
+import re
+from collections import defaultdict
+
+from canonicalization import EXCLUDED_COLUMNS, fold_accents
+from dtype_optimizer import is_measure
+
+
+NAME_WEIGHT = 3.0
+SYNONYM_WEIGHT = 3.0
+VALUE_WEIGHT = 0.5
+
+# Colunas com mais valores distintos que isso não são usadas para agrupar
+MAX_GROUP_CARDINALITY = 15
+# Nem têm seus valores indexados (texto livre)
+MAX_VALUE_CARDINALITY = 60
+
+STOPWORDS = {
+    'a', 'o', 'as', 'os', 'ao', 'aos', 'de', 'da', 'do', 'das', 'dos', 'e', 'em',
+    'no', 'na', 'nos', 'nas', 'um', 'uma', 'uns', 'umas', 'para', 'pra', 'por',
+    'com', 'sem', 'que', 'qual', 'quais', 'quanto', 'quanta', 'quantos', 'quantas',
+    'se', 'sim', 'nao', 'ou', 'como', 'ha', 'mais', 'menos', 'entre', 'sua', 'seu',
+    'suas', 'seus', 'ja', 'algum', 'alguma', 'me', 'mostre', 'mostrar',
+    'grafico', 'sobre', 'dados', 'outro', 'outra', 'outros',
+}
+
+# Termos alternativos usados pelos usuários para as colunas mais consultadas
+COLUMN_SYNONYMS = {
+    'Comunidade': ['comunidade', 'localidade', 'vila', 'lugar'],
+    'Município': ['municipio', 'cidade'],
+    'Sexo': ['genero', 'homem', 'mulher', 'masculino', 'feminino'],
+    'Idade': ['idade', 'anos', 'faixa etaria', 'velho', 'jovem'],
+    'Escolaridade': ['escolaridade', 'estudo', 'ensino', 'educacao', 'formacao'],
+    'Renda_Familiar': ['renda', 'salario', 'ganho', 'faixa de renda'],
+    'Renda_Familiar_R$': ['renda', 'salario', 'ganho', 'reais', 'dinheiro'],
+    'Area_Mandioca_ha': ['area mandioca', 'hectare mandioca', 'tamanho mandioca', 'plantio mandioca'],
+    'Area_Macaxeira_ha': ['area macaxeira', 'hectare macaxeira', 'tamanho macaxeira', 'plantio macaxeira'],
+    'Tamanho_Area_Plantada_ha': ['area plantada', 'hectare plantado', 'tamanho plantio'],
+    'Tamanho_Propriedade_ha': ['tamanho propriedade', 'hectare propriedade', 'terreno', 'sitio'],
+    'Preco_Farinha': ['preco farinha', 'valor farinha', 'quilo farinha', 'kg farinha'],
+    'Preco_Feixe_Maniva': ['preco feixe', 'valor maniva', 'compra maniva'],
+    'Tempo_Producao_Dias': ['tempo producao', 'dias producao', 'demora'],
+    'Meses_Colheita_Mandioca': ['colheita mandioca', 'meses mandioca'],
+    'Meses_Colheita_Macaxeira': ['colheita macaxeira', 'meses macaxeira'],
+    'Variedades_Mandioca': ['variedade mandioca', 'tipo mandioca', 'cultivar'],
+    'Qual(s) variedade(s) de MACAXEIRA?': ['variedade macaxeira', 'tipo macaxeira'],
+    'Se sim, quais pragas?': ['praga', 'inseto', 'lagarta', 'gafanhoto'],
+    'Dificuldades_Cultivo': ['dificuldade cultivo', 'problema cultivo', 'desafio'],
+    'Dificuldades_Processamento': ['dificuldade processamento', 'problema processamento'],
+    'Dificuldades_Comercializacao': ['dificuldade venda', 'dificuldade comercializacao', 'problema venda'],
+    'Produtos_Comercializados': ['produto vendido', 'derivado', 'produto comercializado'],
+    'Local_Comercializacao': ['onde vende', 'local venda', 'mercado'],
+    'Assistencia_Tecnica': ['assistencia tecnica', 'ater', 'extensao', 'tecnico'],
+    'Capinas_Por_Ano': ['capina', 'rocagem', 'limpeza'],
+    'Sacas_Raiz_Por_Saca_Farinha': ['rendimento farinha', 'conversao raiz', 'saca raiz'],
+    'Area_Total_ha': ['area total', 'hectare total', 'tamanho roca'],
+    'Renda_Por_ha': ['renda por hectare', 'renda hectare', 'rentabilidade'],
+    'Participacao_Mandioca': ['participacao mandioca', 'proporcao mandioca', 'percentual mandioca'],
+    'Participacao_Macaxeira': ['participacao macaxeira', 'proporcao macaxeira', 'percentual macaxeira'],
+    'Rendimento_Farinha_Por_Saca_Raiz': ['rendimento farinha', 'conversao farinha'],
+    'Quantas pessoas trabalham no cultivo?': ['trabalhador', 'mao de obra', 'pessoas'],
+}
+
+# Palavras que indicam o pedido de agrupamento ("por comunidade", "entre sexos")
+GROUP_MARKERS = {'por', 'entre', 'cada', 'segundo', 'conforme'}
+
+_RE_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def stem(token):
+    """Stemming mínimo: plural simples e "-ções" -> "-cao"."""
+    if token.endswith('coes'):
+        return token[:-4] + 'cao'
+    if token.endswith('oes'):
+        return token[:-3] + 'ao'
+    if len(token) > 4 and token.endswith('es') and token[-3] in 'rz':
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text, keep_stopwords=False):
+    """Tokens sem acento, em minúsculas e com stemming; remove stopwords."""
+    tokens = _RE_TOKEN.findall(fold_accents(str(text).replace('_', ' ')).lower())
+    return [stem(t) for t in tokens if keep_stopwords or (t not in STOPWORDS and len(t) > 1)]
+
+
+class ColumnIndex:
+    """Índice invertido termo -> {coluna: peso} de um DataFrame."""
+
+    def __init__(self, df):
+        # Colunas de identificação (nomes, datas) não viram gráfico
+        self.columns = [col for col in df.columns if col not in EXCLUDED_COLUMNS]
+        self.position = {col: i for i, col in enumerate(self.columns)}
+        self.numeric = {col for col in self.columns if is_measure(df[col])}
+        nunique = df.nunique(dropna=True)
+        self.groupable = [
+            col for col in self.columns
+            if col not in self.numeric and 1 < nunique[col] <= MAX_GROUP_CARDINALITY
+        ]
+
+        raw = defaultdict(lambda: defaultdict(float))
+        for col in self.columns:
+            for token in tokenize(col):
+                raw[token][col] = max(raw[token][col], NAME_WEIGHT)
+            for synonym in COLUMN_SYNONYMS.get(col, []):
+                for token in tokenize(synonym):
+                    raw[token][col] = max(raw[token][col], SYNONYM_WEIGHT)
+            if col not in self.numeric and nunique[col] <= MAX_VALUE_CARDINALITY:
+                for value in df[col].dropna().astype(str).unique():
+                    for token in tokenize(value):
+                        raw[token][col] = max(raw[token][col], VALUE_WEIGHT)
+
+        # IDF entre colunas: termos presentes em muitas colunas valem menos
+        n_cols = max(len(self.columns), 1)
+        self.postings = {
+            token: {col: weight * math.log(1 + n_cols / len(cols)) for col, weight in cols.items()}
+            for token, cols in raw.items()
+        }
+
+    def search(self, question, k=5):
+        """Colunas candidatas para a pergunta, ordenadas por relevância: [(coluna, score)]."""
+        scores = defaultdict(float)
+        for token in set(tokenize(question)):
+            for col, weight in self.postings.get(token, {}).items():
+                scores[col] += weight
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self.position[item[0]]))
+        return ranked[:k]
+
+    def asks_for_groups(self, question):
+        """Indica se a pergunta pede comparação entre grupos ("por", "entre"...)."""
+        return any(token in GROUP_MARKERS for token in tokenize(question, keep_stopwords=True))
+
+    def group_by_for(self, question, target=None):
+        """Dimensão de agrupamento para a pergunta (ex.: "preço por comunidade").
+
+        Prioriza os termos após "por"/"entre"; se nada casar, usa 'Comunidade'
+        quando disponível.
+        """
+        tokens = tokenize(question, keep_stopwords=True)
+        tail = []
+        for i, token in enumerate(tokens):
+            if token in GROUP_MARKERS:
+                tail = tokens[i + 1:]
+        candidates = self.groupable if target is None else [c for c in self.groupable if c != target]
+        if tail:
+            scores = defaultdict(float)
+            for token in tail:
+                for col, weight in self.postings.get(token, {}).items():
+                    if col in candidates:
+                        scores[col] += weight
+            if scores:
+                return max(scores.items(), key=lambda item: (item[1], -self.position[item[0]]))[0]
+        if 'Comunidade' in candidates:
+            return 'Comunidade'
+        return candidates[0] if candidates else None
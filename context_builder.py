@@ -0,0 +1,136 @@
+# Geração determinística do contexto textual usado pelo Maniv.IA.
+#
+# O texto gerado alimenta o embedding, o índice FAISS e o prompt; por isso
+# precisa ser idêntico sempre que os dados forem idênticos. Nada aqui usa
+# amostragem aleatória: as "amostras" de cada coluna são os valores mais
+# frequentes (empates resolvidos pela ordem alfabética). As estatísticas são
+# calculadas de uma vez para todas as colunas e cada seção recebe um hash do
+# próprio conteúdo, que serve de chave para caches de embedding e de prompt.
+
+import hashlib
+
+import pandas as pd
+
+from dtype_optimizer import is_measure, yes_no_labels
+
+
+# Versão do formato do contexto: mude sempre que o texto gerado mudar de
+# forma, para invalidar caches construídos com a versão anterior.
+CONTEXT_VERSION = 2
+
+SAMPLE_SIZE = 10
+MAX_CATEGORIES = 20
+
+
+def content_hash(text):
+    """Hash curto e estável (sha256) de um texto, prefixado pela versão do formato."""
+    digest = hashlib.sha256(f'v{CONTEXT_VERSION}\n{text}'.encode('utf-8')).hexdigest()
+    return digest[:16]
+
+
+def data_version(df):
+    """Hash do conteúdo do DataFrame (colunas + valores), independente do processo."""
+    hasher = hashlib.sha256()
+    hasher.update('\x1f'.join(map(str, df.columns)).encode('utf-8'))
+    hasher.update(pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy().tobytes())
+    return hasher.hexdigest()[:16]
+
+
+def _format_value(value):
+    return f'{value:.2f}' if pd.notna(value) else 'nan'
+
+
+def _numeric_sections(df, numeric_cols):
+    """Estatísticas de todas as colunas numéricas calculadas de uma só vez."""
+    if not numeric_cols:
+        return {}
+    stats = df[numeric_cols].agg(['mean', 'median', 'min', 'max', 'std']).T
+    labels = {'mean': 'Média', 'median': 'Mediana', 'min': 'Min', 'max': 'Max', 'std': 'Desvio Padrão'}
+    sections = {}
+    for col, row in stats.iterrows():
+        lines = [f'Coluna: {col} - Tipo: numérico']
+        lines.extend(f'  {labels[stat]}: {_format_value(row[stat])}' for stat in labels)
+        sections[col] = lines
+    return sections
+
+
+def categorical_counts(df, text_cols):
+    """Tabela longa (coluna, valor, n) com a contagem de cada resposta de texto."""
+    long = yes_no_labels(df[text_cols]).melt(var_name='coluna', value_name='valor').dropna()
+    long['valor'] = long['valor'].astype(str)
+    return long.groupby(['coluna', 'valor'], sort=False).size().rename('n').reset_index()
+
+
+def merge_counts(tables):
+    """Soma tabelas de categorical_counts (por exemplo, uma por partição)."""
+    tables = [table for table in tables if not table.empty]
+    if not tables:
+        return pd.DataFrame({'coluna': [], 'valor': [], 'n': []})
+    return pd.concat(tables).groupby(['coluna', 'valor'], sort=False)['n'].sum().reset_index()
+
+
+def _categorical_sections(counts):
+    """Seções das colunas de texto a partir da tabela longa de contagens."""
+    if counts.empty:
+        return {}
+    counts = counts.sort_values(['coluna', 'n', 'valor'], ascending=[True, False, True], kind='mergesort')
+    unique_counts = counts.groupby('coluna', sort=False).size()
+
+    sections = {}
+    for col, group in counts.groupby('coluna', sort=False):
+        unique_count = int(unique_counts[col])
+        lines = [f'Coluna: {col} - Tipo: texto', f'  Valores únicos: {unique_count}']
+        lines.append(f'  Amostra: {group["valor"].head(SAMPLE_SIZE).tolist()}')
+        if unique_count <= MAX_CATEGORIES:
+            for value, count in zip(group['valor'].head(10), group['n'].head(10)):
+                lines.append(f"  '{value}': {count} ocorrências")
+        sections[col] = lines
+    return sections
+
+
+def generate_context_sections(df, counts=None):
+    """Gera as seções do contexto: uma de resumo e uma por coluna.
+
+    Cada seção é um dict com 'id', 'text' e 'hash' (hash do texto da seção).
+    counts (tabela de categorical_counts já somada, como a do armazenamento
+    incremental) evita recontar as colunas de texto do DataFrame inteiro.
+    """
+    if df.empty:
+        text = 'Base de dados vazia.'
+        return [{'id': 'resumo', 'text': text, 'hash': content_hash(text)}]
+
+    columns = [str(col) for col in df.columns]
+    df = df.set_axis(columns, axis=1)
+    numeric_cols = [col for col in columns if is_measure(df[col])]
+    text_cols = [col for col in columns if col not in numeric_cols]
+    non_empty = df.notna().any()
+
+    per_column = {}
+    per_column.update(_numeric_sections(df, [c for c in numeric_cols if non_empty[c]]))
+    text_cols = [c for c in text_cols if non_empty[c]]
+    if counts is None:
+        counts = categorical_counts(df, text_cols) if text_cols else merge_counts([])
+    else:
+        counts = counts[counts['coluna'].isin(text_cols)]
+    per_column.update(_categorical_sections(counts))
+
+    summary = '\n'.join([
+        f'Total de registros: {len(df)}',
+        f'Colunas disponíveis ({len(columns)}): {", ".join(columns)}',
+    ])
+    sections = [{'id': 'resumo', 'text': summary, 'hash': content_hash(summary)}]
+    for col in columns:
+        lines = per_column.get(col, [f'Coluna: {col} - SEM DADOS'])
+        text = '\n'.join(lines)
+        sections.append({'id': col, 'text': text, 'hash': content_hash(text)})
+    return sections
+
+
+def context_fingerprint(sections):
+    """Hash do contexto completo a partir dos hashes das seções."""
+    return content_hash('\n'.join(section['hash'] for section in sections))
+
+
+def generate_comprehensive_context(df):
+    """Gera contexto estruturado com todas as colunas e estatísticas relevantes"""
+    return '\n\n'.join(section['text'] for section in generate_context_sections(df))
@@ -0,0 +1,419 @@
+# API HTTP somente leitura com os agregados do dashboard.
+#
+# Uso:
+#     python data_api.py [--host 127.0.0.1] [--port 8770]
+#
+# Rotas (GET):
+#   /api/v1/meta                   versão dos dados, agregados e filtros disponíveis
+#   /api/v1/aggregates/<nome>      um agregado (ver AGGREGATES)
+#   /api/v1/similar/<chave>        produtores parecidos com o da chave da
+#                                  entrevista (similarity.py); k=10 e
+#                                  resultado=<similarity.OUTCOMES> opcionais,
+#                                  os filtros restringem os vizinhos; compara
+#                                  dentro de uma onda (a do filtro onda, ou a
+#                                  mais recente da chave), então a
+#                                  reentrevista do produtor não é vizinha dele
+#
+# Filtros (parâmetros repetíveis, os mesmos da barra lateral do dashboard):
+#   municipio, onda, comunidade, sexo, cultivo, idade_min, idade_max
+# (sem onda, vale a onda mais recente de cada município, como no dashboard e
+# em reports.py; o mesmo produtor reentrevistado não conta duas vezes).
+# Formato: format=json (padrão) ou format=arrow (Arrow IPC stream), ou o
+# cabeçalho Accept: application/vnd.apache.arrow.stream.
+#
+# Os dados vêm de shared_store.shared_survey (o mesmo pipeline do app). A cada
+# RELOAD_SECONDS (MANIVA_API_RELOAD, padrão 30; 0 desliga) uma thread compara a
+# chave dos dados (versão das partições do manifesto de ingest.py) e, se uma
+# ingestão a mudou, troca o serviço por um com os dados novos; pedidos em
+# andamento terminam com o anterior. Cada resposta é
+# identificada por um ETag = hash(versão dos dados, agregado, filtros
+# normalizados, formato): pedidos com If-None-Match igual recebem 304 sem
+# recalcular nada, e os corpos (também já comprimidos com gzip) ficam em um
+# cache LRU, então requisições repetidas custam só a busca no dicionário.
+
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import pandas as pd
+import pyarrow as pa
+
+import shared_store
+from context_builder import content_hash, data_version
+from data_pipeline import COLUNA_CULTIVO, COLUNA_MUNICIPIO, COLUNA_ONDA, apply_filters
+from dtype_optimizer import count_yes
+from ingest import interview_keys
+from similarity import OUTCOMES, ProducerIndex
+
+
+RESPONSE_CACHE_SIZE = 1024
+# Corpos menores que isso não compensam o gzip
+GZIP_MIN_BYTES = 512
+CACHE_MAX_AGE = 300
+
+ARROW_MIME = 'application/vnd.apache.arrow.stream'
+JSON_MIME = 'application/json; charset=utf-8'
+
+FILTER_PARAMS = ('municipio', 'onda', 'comunidade', 'sexo', 'cultivo', 'idade_min', 'idade_max')
+SIMILAR_PARAMS = ('k', 'resultado')
+MAX_NEIGHBOURS = 100
+RELOAD_SECONDS = float(os.environ.get('MANIVA_API_RELOAD', 30))
+
+
+def _multi_counts(series, name):
+    """Frequência dos itens de uma coluna de múltipla escolha (separados por ', ')."""
+    counts = series.dropna().str.split(', ').explode().str.strip()
+    counts = counts[counts != ''].value_counts()
+    return counts.rename_axis(name).reset_index(name='produtores')
+
+
+def agg_comunidades(df):
+    return df['Comunidade'].value_counts().rename_axis('Comunidade').reset_index(name='produtores')
+
+
+def agg_variedades(df):
+    frames = []
+    for cultura, col in (('MANDIOCA', 'Variedades_Mandioca'), ('MACAXEIRA', 'Qual(s) variedade(s) de MACAXEIRA?')):
+        if col in df.columns:
+            frames.append(_multi_counts(df[col], 'variedade').assign(cultura=cultura))
+    return pd.concat(frames, ignore_index=True)[['cultura', 'variedade', 'produtores']]
+
+
+def agg_dificuldades(df):
+    frames = []
+    for etapa, col in (('CULTIVO', 'Dificuldades_Cultivo'),
+                       ('PROCESSAMENTO', 'Dificuldades_Processamento'),
+                       ('COMERCIALIZACAO', 'Dificuldades_Comercializacao')):
+        if col in df.columns:
+            frames.append(_multi_counts(df[col], 'dificuldade').assign(etapa=etapa))
+    return pd.concat(frames, ignore_index=True)[['etapa', 'dificuldade', 'produtores']]
+
+
+def agg_pragas(df):
+    return _multi_counts(df['Se sim, quais pragas?'].str.upper(), 'praga')
+
+
+def agg_precos(df):
+    """Preços por comunidade e no total (linha 'TODAS')."""
+    cols = {'Preco_Farinha': 'preco_farinha_kg', 'Preco_Feixe_Maniva': 'preco_feixe_maniva'}
+    cols = {src: dst for src, dst in cols.items() if src in df.columns}
+    prices = df[['Comunidade', *cols]].rename(columns=cols)
+    stats = ['count', 'mean', 'min', 'max']
+    per_community = prices.groupby('Comunidade').agg(stats)
+    total = prices.drop(columns='Comunidade').agg(stats).unstack().to_frame('TODAS').T
+    result = pd.concat([per_community, total])
+    result.columns = [f'{col}_{stat}' for col, stat in result.columns]
+    return result.rename_axis('Comunidade').reset_index()
+
+
+def agg_resumo(df):
+    """Os cartões de métricas do topo do dashboard."""
+    associados = count_yes(df['É associado a alguma entidade?'])
+    return pd.DataFrame([{
+        'produtores': len(df),
+        'pessoas_cultivo': df['Quantas pessoas trabalham no cultivo?'].sum(),
+        'area_plantada_media_ha': df['Tamanho_Area_Plantada_ha'].mean(),
+        'renda_familiar_media': df['Renda_Familiar_R$'].mean(),
+        'associados': associados,
+        'preco_farinha_medio': df['Preco_Farinha'].mean(),
+    }])
+
+
+AGGREGATES = {
+    'resumo': agg_resumo,
+    'comunidades': agg_comunidades,
+    'variedades': agg_variedades,
+    'dificuldades': agg_dificuldades,
+    'pragas': agg_pragas,
+    'precos': agg_precos,
+}
+
+
+def parse_filters(query, extra=('format',)):
+    """Normaliza os filtros da query string (ordem e repetição não mudam o ETag)."""
+    params = parse_qs(query)
+    unknown = set(params) - set(FILTER_PARAMS) - set(extra)
+    if unknown:
+        raise ValueError(f"Parâmetros desconhecidos: {', '.join(sorted(unknown))}")
+    filters = {name: sorted(set(params.get(name, []))) for name in ('municipio', 'onda', 'comunidade', 'sexo', 'cultivo')}
+    for name in ('idade_min', 'idade_max'):
+        values = params.get(name)
+        try:
+            filters[name] = int(values[-1]) if values else None
+        except ValueError:
+            raise ValueError(f'{name} deve ser um número inteiro') from None
+    return filters
+
+
+def latest_waves(df):
+    """Só as entrevistas da onda mais recente de cada município."""
+    if COLUNA_ONDA not in df.columns or COLUNA_MUNICIPIO not in df.columns:
+        return df
+    # Mesma ordem de ingest.municipality_waves
+    ondas = df[COLUNA_ONDA].astype('string')
+    latest = ondas.groupby(df[COLUNA_MUNICIPIO].astype('string')).transform('max')
+    return df[(ondas == latest).fillna(False).to_numpy(dtype=bool)]
+
+
+def filter_frame(df, filters):
+    """Linhas dos filtros; sem onda, só a onda mais recente de cada município."""
+    if not filters['onda']:
+        df = latest_waves(df)
+    idade_range = None
+    if filters['idade_min'] is not None or filters['idade_max'] is not None:
+        idade_range = (filters['idade_min'] if filters['idade_min'] is not None else 0,
+                       filters['idade_max'] if filters['idade_max'] is not None else 200)
+    return apply_filters(df, filters['comunidade'], filters['sexo'], filters['cultivo'], idade_range,
+                         municipios=filters['municipio'], ondas=filters['onda'])
+
+
+def _to_json(frame):
+    # to_json já converte NaN em null e tipos do numpy em números
+    records = json.loads(frame.to_json(orient='records', force_ascii=False))
+    return json.dumps({'data': records}, ensure_ascii=False).encode('utf-8')
+
+
+def _to_arrow(frame):
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class AggregateService:
+    """Agregados de um DataFrame fixo, com cache de respostas prontas por ETag."""
+
+    def __init__(self, df):
+        self.df = df
+        self.version = data_version(df)
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+        self._producers = {}
+        self._keys = None
+        self._producers_lock = threading.Lock()
+
+    def meta(self):
+        return {
+            'versao_dados': self.version,
+            'produtores': len(self.df),
+            'agregados': list(AGGREGATES),
+            'resultados': {name: label for name, (label, _, _) in OUTCOMES.items()},
+            'filtros': {
+                'municipio': sorted(self.df[COLUNA_MUNICIPIO].dropna().unique().tolist()),
+                'onda': sorted(self.df[COLUNA_ONDA].dropna().unique().tolist()),
+                'comunidade': sorted(self.df['Comunidade'].dropna().unique().tolist()),
+                'sexo': sorted(self.df['Sexo'].dropna().unique().tolist()),
+                'cultivo': sorted(self.df[COLUNA_CULTIVO].dropna().unique().tolist()),
+                'idade_min': None,
+                'idade_max': None,
+            },
+        }
+
+    def etag(self, name, filters, fmt):
+        key = json.dumps([self.version, name, filters, fmt], sort_keys=True, ensure_ascii=False)
+        return f'"{content_hash(key)}"'
+
+    def response(self, name, filters, fmt):
+        """(etag, corpo, corpo_gzip ou None), calculado uma vez por combinação."""
+        etag = self.etag(name, filters, fmt)
+        with self._lock:
+            cached = self._responses.get(etag)
+            if cached is not None:
+                self._responses.move_to_end(etag)
+                return cached
+        frame = AGGREGATES[name](filter_frame(self.df, filters))
+        body = _to_arrow(frame) if fmt == 'arrow' else _to_json(frame)
+        compressed = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_BYTES else None
+        cached = (etag, body, compressed)
+        with self._lock:
+            self._responses[etag] = cached
+            while len(self._responses) > RESPONSE_CACHE_SIZE:
+                self._responses.popitem(last=False)
+        return cached
+
+    def producers(self, onda):
+        """Índice dos produtores parecidos de uma onda, montado na primeira busca nela."""
+        with self._producers_lock:
+            if onda not in self._producers:
+                self._producers[onda] = ProducerIndex(self.df[self.df[COLUNA_ONDA].astype('string') == onda])
+            return self._producers[onda]
+
+    def key_wave(self, key, filters):
+        """Onda em que `key` é comparada: a do filtro, ou a mais recente em que a chave aparece."""
+        if len(filters['onda']) > 1:
+            raise ValueError('a busca de parecidos compara uma onda por vez')
+        if filters['onda']:
+            return filters['onda'][0]
+        with self._producers_lock:
+            if self._keys is None:
+                self._keys = pd.Index(interview_keys(self.df))
+        ondas = self.df[COLUNA_ONDA].astype('string')[self._keys == key].dropna()
+        if ondas.empty:
+            raise KeyError(key)
+        return ondas.max()
+
+    def similar(self, key, filters, k=10, outcome=None):
+        """Vizinhos de `key` entre os produtores dos filtros, na mesma onda; KeyError se a chave não existir."""
+        index = self.producers(self.key_wave(key, filters))
+        candidates = index.frame.index.isin(filter_frame(index.frame, filters).index)
+        return index.similar(key, k=k, outcome=outcome, candidates=candidates)
+
+
+class AggregateHandler(BaseHTTPRequestHandler):
+    service = None
+    protocol_version = 'HTTP/1.1'
+    # Cabeçalhos e corpo saem em escritas separadas; sem isso o Nagle + ACK
+    # atrasado do cliente seguram cada resposta keep-alive por ~40 ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', content_type=JSON_MIME, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send(status, json.dumps({'erro': message}, ensure_ascii=False).encode('utf-8'))
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        # O mesmo serviço no pedido inteiro, mesmo que uma recarga o troque no meio
+        service = self.service
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        if parts == ['api', 'v1', 'meta']:
+            self._send(200, json.dumps(service.meta(), ensure_ascii=False).encode('utf-8'))
+            return
+        if len(parts) == 4 and parts[:3] == ['api', 'v1', 'similar']:
+            self._send_similar(service, unquote(parts[3]), url.query)
+            return
+        if len(parts) != 4 or parts[:3] != ['api', 'v1', 'aggregates']:
+            self._send_error(404, 'rota não encontrada')
+            return
+        name = parts[3]
+        if name not in AGGREGATES:
+            self._send_error(404, f'agregado desconhecido: {name}')
+            return
+        try:
+            filters = parse_filters(url.query)
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+
+        fmt = parse_qs(url.query).get('format', [None])[-1]
+        if fmt is None:
+            fmt = 'arrow' if ARROW_MIME in self.headers.get('Accept', '') else 'json'
+        if fmt not in ('json', 'arrow'):
+            self._send_error(400, f'formato desconhecido: {fmt}')
+            return
+
+        headers = {
+            'Cache-Control': f'public, max-age={CACHE_MAX_AGE}',
+            'Vary': 'Accept, Accept-Encoding',
+        }
+        etag = service.etag(name, filters, fmt)
+        headers['ETag'] = etag
+        if_none_match = self.headers.get('If-None-Match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            self._send(304, headers=headers)
+            return
+
+        _, body, compressed = service.response(name, filters, fmt)
+        if compressed is not None and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            headers['Content-Encoding'] = 'gzip'
+            body = compressed
+        self._send(200, body, ARROW_MIME if fmt == 'arrow' else JSON_MIME, headers)
+
+    def _send_similar(self, service, key, query):
+        try:
+            filters = parse_filters(query, extra=SIMILAR_PARAMS)
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+        params = parse_qs(query)
+        try:
+            k = int(params.get('k', [10])[-1])
+        except ValueError:
+            self._send_error(400, 'k deve ser um número inteiro')
+            return
+        outcome = params.get('resultado', [None])[-1]
+        if outcome is not None and outcome not in OUTCOMES:
+            self._send_error(400, f'resultado desconhecido: {outcome}')
+            return
+        try:
+            frame = service.similar(key, filters, k=max(1, min(k, MAX_NEIGHBOURS)), outcome=outcome)
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+        except KeyError:
+            self._send_error(404, f'produtor desconhecido: {key}')
+            return
+        self._send(200, _to_json(frame), headers={'Cache-Control': f'public, max-age={CACHE_MAX_AGE}'})
+
+
+def _watch_store(handler, key, interval):
+    """Troca handler.service quando uma ingestão muda os dados (verifica a cada `interval` segundos)."""
+    while True:
+        time.sleep(interval)
+        try:
+            current = shared_store.survey_key()
+            if current != key:
+                handler.service = AggregateService(shared_store.shared_survey())
+                key = current
+        except Exception:
+            # Ex.: manifesto sendo regravado por uma ingestão; tenta de novo depois
+            continue
+
+
+def make_server(df=None, host='127.0.0.1', port=8770, reload_seconds=RELOAD_SECONDS):
+    """Cria o servidor (sem iniciar); port=0 escolhe uma porta livre.
+
+    Sem df, serve o armazenamento inteiro e recarrega quando ele muda.
+    """
+    key = shared_store.survey_key() if df is None else None
+    service = AggregateService(shared_store.shared_survey() if df is None else df)
+    handler = type('ConfiguredAggregateHandler', (AggregateHandler,), {'service': service})
+    if key is not None and reload_seconds > 0:
+        threading.Thread(target=_watch_store, args=(handler, key, reload_seconds),
+                         name='recarga-dados', daemon=True).start()
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API somente leitura com os agregados do dashboard.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8770)
+    args = parser.parse_args()
+
+    server = make_server(host=args.host, port=args.port)
+    print(f'API de agregados em http://{args.host}:{args.port}/api/v1 '
+          f'(dados {server.RequestHandlerClass.service.version})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# Pipeline de dados do questionário, sem dependência do Streamlit.
+#
+# O app (app.py) envolve estas funções com st.cache_data; scripts e serviços
+# auxiliares (benchmarks, API, relatórios) importam daqui diretamente.
+
+import numpy as np
+import pandas as pd
+
+from canonicalization import canonicalize_dataframe
+from derived_metrics import add_derived_metrics, metric_names
+from dtype_optimizer import optimize_dtypes, yes_no_labels
+from field_parsers import derived_column_names, parse_typed_fields
+
+
+DATA_PATH = 'Backup_Juriti.csv'
+
+COLUNA_CULTIVO = 'Cultiva macaxeira, mandioca ou as duas?'
+
+# Preenchidas na ingestão (ingest.py): as exportações não trazem o município
+# nem a onda (rodada) da pesquisa
+COLUNA_MUNICIPIO = 'Município'
+COLUNA_ONDA = 'Onda'
+
+# Municípios do programa: exportação inicial do armazenamento, coordenadas das
+# propriedades e enquadramento do mapa. Municípios ingeridos sem entrada aqui
+# aparecem no dashboard, mas sem o mapa.
+MUNICIPIOS = {
+    'Juruti': {
+        'fonte': DATA_PATH,
+        'coordenadas': 'Coordenadas_Separadas.csv',
+        'centro': (-2.37, -56.05),
+        'zoom': 11.3,
+    },
+}
+DEFAULT_MUNICIPIO = 'Juruti'
+# Onda das exportações ingeridas sem --onda (a primeira rodada, de 2025)
+DEFAULT_ONDA = '2025'
+
+# Identificação da família e metadados da coleta, fora das exportações
+HIDDEN_COLUMNS = ['Família', 'Data resposta', 'Hora resposta', 'Equipamento', 'Identificador',
+                  'Código externo', 'Data da tarefa']
+
+
+def load_data(path=DATA_PATH, dtype=None):
+    # Substitua pelo caminho do seu arquivo
+    df = pd.read_csv(path, delimiter=',', encoding='utf-8', dtype=dtype)
+    
+    # Verificar e corrigir nomes de colunas
+    col_mapping = {
+        'Tamanho da Propriedade (ha)': 'Tamanho_Propriedade_ha',
+        'Tamanho da área produtiva (ha)': 'Tamanho_Area_Produtiva_ha',
+        'Tamanho da área plantada (ha)': 'Tamanho_Area_Plantada_ha',
+        'Qual a renda familiar absoluta/mês em R$?': 'Renda_Familiar',
+        'Qual(s) variedade(s) de MANDIOCA?': 'Variedades_Mandioca',
+        'Com quantos meses colhe a MANDIOCA?': 'Meses_Colheita_Mandioca',
+        'Já teve problema com pragas na mandioca/macaxeira???': 'Teve_Problema_Pragas',
+        'Se sim, quais produtos são comercializados?': 'Produtos_Comercializados',
+        'Onde é comercializado os produtos?': 'Local_Comercializacao',
+        'Qual o preço médio de farinha atualmente (kg)?': 'Preco_Farinha',
+        'Quais as dificuldades encontradas na COMERCIALIZAÇÃO da farinha e derivados?': 'Dificuldades_Comercializacao',
+        'Quais as principais dificuldades no cultivo mandioca/macaxeira ?': 'Dificuldades_Cultivo',
+        'Realiza adubação?': 'Adubacao',
+        'Quais as principais dificuldades no PROESSAMENTO da mandioca/macaxeira?': 'Dificuldades_Processamento',
+        'Recebe algum tipo de assistência técnica?': 'Assistencia_Tecnica',
+        'Qual tamanho da área destinada ao plantio de MANDIOCA (ha)?': 'Area_Mandioca_ha',
+        'Qual tamanho da área destinada ao plantio de MACAXEIRA (ha)?': 'Area_Macaxeira_ha',
+        'Comunidade':'Comunidade',
+        'Qual o preço médio de farinha atualmente (kg)?': 'Preco_Farinha',
+        'Quanto tempo demora o processo de produção de farinha e outros derivados (da colheita até venda)?':'Tempo_Producao_Dias'
+    }
+    
+    # Renomear colunas
+    for original, new in col_mapping.items():
+        if original in df.columns:
+            df.rename(columns={original: new}, inplace=True)
+
+    return df
+
+
+def prepare_rows(df):
+    # Converte as respostas numéricas em texto livre ("8 MESES", "1m x 1m",
+    # "2X", faixas de renda...) em colunas tipadas, uma única vez por carga
+    df = parse_typed_fields(df)
+    # Área total, participações, renda por hectare etc. (ver derived_metrics.py)
+    df = add_derived_metrics(df)
+    # Corrige grafias ("LARGATA", "SIM ", "N.A") das respostas categóricas e de
+    # múltipla escolha; o dicionário de correções fica em cache no disco
+    df = canonicalize_dataframe(df)
+    # "N.A." (não se aplica) conta como sem resposta: trocado uma vez aqui, na
+    # carga, e não a cada filtro
+    return df.replace('N.A.', np.nan)
+
+
+def preprocess_data(df):
+    # Etapas linha a linha (também usadas por lote na ingestão incremental) e,
+    # no fim, categóricas, booleanos SIM/NÃO e strings do Arrow no lugar de object
+    return optimize_dtypes(prepare_rows(df))
+
+
+def load_survey(path=DATA_PATH):
+    """Carrega e pré-processa o questionário (equivalente ao df do dashboard)."""
+    return preprocess_data(load_data(path))
+
+
+def apply_filters(df, comunidades=None, generos=None, tipos_cultivo=None, idade_range=None, municipios=None,
+                  ondas=None):
+    """Filtros da barra lateral do dashboard; listas vazias ou None não filtram.
+
+    Só monta a máscara das linhas; o DataFrame é copiado uma vez, ao aplicá-la
+    ("N.A." já chega como ausente, ver prepare_rows).
+    """
+    mask = pd.Series(True, index=df.index)
+    if municipios and COLUNA_MUNICIPIO in df.columns:
+        mask &= df[COLUNA_MUNICIPIO].isin(municipios)
+    if ondas and COLUNA_ONDA in df.columns:
+        mask &= df[COLUNA_ONDA].isin(ondas)
+    if comunidades:
+        mask &= df['Comunidade'].isin(comunidades)
+    if generos and 'Sexo' in df.columns:
+        mask &= df['Sexo'].isin(generos)
+    if tipos_cultivo and COLUNA_CULTIVO in df.columns:
+        mask &= df[COLUNA_CULTIVO].isin(tipos_cultivo)
+    if idade_range and 'Idade' in df.columns:
+        mask &= df['Idade'].between(idade_range[0], idade_range[1])
+    filtered_df = df if mask.all() else df[mask]
+    # Sem isso value_counts das categóricas lista as categorias filtradas com 0
+    categorical = [col for col in filtered_df.columns if isinstance(filtered_df[col].dtype, pd.CategoricalDtype)]
+    if categorical:
+        filtered_df = filtered_df.assign(**{col: filtered_df[col].cat.remove_unused_categories() for col in categorical})
+    return filtered_df
+
+
+def export_frame(df):
+    """Colunas exportáveis (tabela e CSV): sem identificação nem colunas derivadas."""
+    hidden = HIDDEN_COLUMNS + derived_column_names() + metric_names()
+    return yes_no_labels(df.drop(columns=hidden, errors='ignore'))
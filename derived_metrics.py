@@ -0,0 +1,79 @@
+# Métricas derivadas do questionário, declaradas uma única vez.
+#
+# Cada entrada de DERIVED_METRICS diz de quais colunas a métrica depende e
+# como calculá-la (função vetorizada que recebe as dependências como Series).
+# As dependências podem ser colunas tipadas de field_parsers ou outras
+# métricas; add_derived_metrics resolve a ordem e calcula tudo uma vez na
+# ingestão (ver preprocess_data), então as abas só leem as colunas prontas, em
+# vez de criá-las no filtered_df a cada rerun.
+# Métricas cujas dependências não existem no DataFrame são omitidas.
+
+import numpy as np
+
+from field_parsers import count_months
+
+
+def _ratio(numerator, denominator):
+    """Divisão vetorizada com NaN onde o denominador é zero ou ausente."""
+    return numerator / denominator.where(denominator != 0)
+
+
+def area_total(mandioca, macaxeira):
+    return mandioca + macaxeira
+
+
+def plantas_por_ha(linha, planta):
+    return (10000 / (linha * planta).replace(0, np.nan)).round()
+
+
+def rendimento_farinha(sacas_raiz_por_saca):
+    # Sacas de farinha (60 kg) obtidas de cada saca de raiz
+    return 1 / sacas_raiz_por_saca.where(sacas_raiz_por_saca != 0)
+
+
+# Métrica -> (dependências, função)
+DERIVED_METRICS = {
+    'Area_Total_ha': (('Area_Mandioca_ha', 'Area_Macaxeira_ha'), area_total),
+    'Participacao_Mandioca': (('Area_Mandioca_ha', 'Area_Total_ha'), _ratio),
+    'Participacao_Macaxeira': (('Area_Macaxeira_ha', 'Area_Total_ha'), _ratio),
+    'Renda_Por_ha': (('Renda_Familiar_R$', 'Area_Total_ha'), _ratio),
+    'Rendimento_Farinha_Por_Saca_Raiz': (('Sacas_Raiz_Por_Saca_Farinha',), rendimento_farinha),
+    'N_Meses_Preco_Baixo': (('Meses_Preco_Baixo',), count_months),
+    'Plantas_Por_ha': (('Espacamento_Linha_m', 'Espacamento_Planta_m'), plantas_por_ha),
+}
+
+
+def metric_order(metrics=DERIVED_METRICS):
+    """Métricas em ordem de cálculo (dependências antes); falha em ciclos."""
+    order, visiting = [], set()
+
+    def visit(name):
+        if name in order:
+            return
+        if name in visiting:
+            raise ValueError(f'Dependência circular nas métricas derivadas: {name}')
+        visiting.add(name)
+        for dep in metrics[name][0]:
+            if dep in metrics:
+                visit(dep)
+        visiting.discard(name)
+        order.append(name)
+
+    for name in metrics:
+        visit(name)
+    return order
+
+
+def metric_names():
+    """Nomes das colunas criadas por add_derived_metrics."""
+    return list(DERIVED_METRICS)
+
+
+def add_derived_metrics(df):
+    """Novo DataFrame com todas as métricas derivadas calculáveis."""
+    columns = {}
+    for name in metric_order():
+        deps, compute = DERIVED_METRICS[name]
+        if all(dep in columns or dep in df.columns for dep in deps):
+            columns[name] = compute(*(columns[dep] if dep in columns else df[dep] for dep in deps))
+    return df.assign(**columns)
@@ -0,0 +1,128 @@
+# Tipos de dados enxutos para o DataFrame do questionário.
+#
+# Depois de load_data quase todas as colunas são texto com valores muito
+# repetidos ("SIM", "NÃO", "N.A.", nomes de comunidades, escolaridade...), e
+# cada sessão do dashboard copia o DataFrame ao filtrar. optimize_dtypes
+# converte, no fim do pré-processamento:
+#   - colunas só com SIM/NÃO -> booleano anulável ('boolean');
+#   - respostas de baixa cardinalidade -> 'category';
+#   - o restante do texto (nomes, respostas abertas) -> string do Arrow;
+#   - inteiros -> o menor tipo inteiro que comporta os valores.
+# As colunas float ficam em float64: as médias e preços exibidos no app e no
+# contexto do RAG mudariam na terceira casa com float32.
+#
+# Para exibição (gráficos, CSV, contexto do RAG) os booleanos voltam a aparecer
+# como SIM/NÃO via yes_no_labels.
+#
+# Uso:
+#     python dtype_optimizer.py [--top 15]
+# imprime o relatório de memória por coluna antes e depois da otimização.
+
+import argparse
+
+import pandas as pd
+
+from canonicalization import EXCLUDED_COLUMNS
+
+
+YES, NO = 'SIM', 'NÃO'
+
+# Texto vira 'category' quando tem poucos valores distintos e eles se repetem
+CATEGORY_MAX_UNIQUE = 50
+CATEGORY_MAX_RATIO = 0.5
+
+ARROW_STRING = pd.StringDtype('pyarrow', na_value=float('nan'))
+
+
+def is_yes_no(series):
+    """Coluna de texto cujas respostas são só SIM/NÃO."""
+    values = set(series.dropna().unique())
+    return bool(values) and values <= {YES, NO}
+
+
+def is_measure(series):
+    """Coluna numérica de verdade (booleanos SIM/NÃO não contam)."""
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def _is_text(series):
+    return (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)) \
+        and not isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def optimize_dtypes(df):
+    """Cópia do DataFrame com os tipos enxutos descritos acima."""
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if _is_text(series):
+            n_unique = series.nunique(dropna=True)
+            if is_yes_no(series):
+                series = series.map({YES: True, NO: False}).astype('boolean')
+            elif (col not in EXCLUDED_COLUMNS and n_unique <= CATEGORY_MAX_UNIQUE
+                  and n_unique <= CATEGORY_MAX_RATIO * series.count()):
+                series = series.astype(ARROW_STRING).astype('category')
+            else:
+                series = series.astype(ARROW_STRING)
+        elif pd.api.types.is_integer_dtype(series):
+            series = pd.to_numeric(series, downcast='integer')
+        columns[col] = series
+    return pd.DataFrame(columns, index=df.index)
+
+
+def yes_no_labels(data):
+    """Mostra colunas booleanas como SIM/NÃO (aceita Series ou DataFrame)."""
+    labels = {True: YES, False: NO}
+    if isinstance(data, pd.Series):
+        return data.map(labels, na_action='ignore') if pd.api.types.is_bool_dtype(data) else data
+    bool_cols = [col for col in data.columns if pd.api.types.is_bool_dtype(data[col])]
+    if not bool_cols:
+        return data
+    return data.assign(**{col: data[col].map(labels, na_action='ignore') for col in bool_cols})
+
+
+def count_yes(series):
+    """Quantidade de respostas SIM, com a coluna booleana ou em texto."""
+    if pd.api.types.is_bool_dtype(series):
+        return int(series.sum())
+    return int((series == YES).sum())
+
+
+def memory_report(df):
+    """Memória por coluna (bytes, bytes por entrevista e % do total), da maior para a menor."""
+    usage = df.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({
+        'dtype': df.dtypes.astype(str),
+        'bytes': usage,
+        'bytes_por_entrevista': usage / max(len(df), 1),
+        'pct': usage / max(usage.sum(), 1) * 100,
+    })
+    return report.sort_values('bytes', ascending=False)
+
+
+def _print_report(title, df, top):
+    report = memory_report(df)
+    total = report['bytes'].sum()
+    print(f'{title}: {total / 1024:.1f} KiB, {total / max(len(df), 1):.0f} bytes por entrevista')
+    print(report.head(top).to_string(float_format=lambda v: f'{v:.1f}'))
+    print()
+
+
+def main():
+    from canonicalization import canonicalize_dataframe
+    from data_pipeline import load_data
+    from field_parsers import parse_typed_fields
+
+    parser = argparse.ArgumentParser(description='Relatório de memória por coluna do questionário.')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    before = canonicalize_dataframe(parse_typed_fields(load_data()))
+    after = optimize_dtypes(before)
+    _print_report('Antes', before, args.top)
+    _print_report('Depois', after, args.top)
+    print(f"Tipos depois: {after.dtypes.astype(str).value_counts().to_dict()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# Backends de embedding para o RAG do Maniv.IA.
+#
+# - "huggingface": HuggingFaceEmbeddings (sentence-transformers + PyTorch, fp32),
+#   o comportamento original do app.
+# - "onnx-int8": o mesmo all-MiniLM-L6-v2 exportado para ONNX e quantizado em
+#   int8, executado com onnxruntime na CPU. Não carrega PyTorch, usa bem menos
+#   memória e codifica em lotes ordenados por tamanho (menos padding).
+#
+# O backend é escolhido pela variável de ambiente MANIVA_EMBEDDINGS_BACKEND
+# (padrão: "huggingface"). Os dois produzem vetores de 384 dimensões
+# normalizados, então o índice FAISS e o retriever não mudam. O app original
+# usava os vetores do HuggingFaceEmbeddings sem normalizar; com a normalização
+# a distância L2 do FAISS ordena como o cosseno. Índices e caches de vetores
+# são chaveados por embedding_name, que inclui EMBEDDINGS_VERSION: os gravados
+# antes da mudança não são reaproveitados.
+
+import os
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+ONNX_REPO_ID = f'sentence-transformers/{EMBEDDING_MODEL}'
+# Variante quantizada publicada no repositório do modelo (AVX2 roda em
+# praticamente qualquer CPU x86 de servidor; use model_qint8_arm64.onnx em ARM)
+ONNX_MODEL_FILE = os.environ.get('MANIVA_ONNX_MODEL_FILE', 'onnx/model_quint8_avx2.onnx')
+
+BACKENDS = ('huggingface', 'onnx-int8')
+DEFAULT_BACKEND = os.environ.get('MANIVA_EMBEDDINGS_BACKEND', 'huggingface')
+# Mude quando os vetores gerados mudarem (ex.: normalização)
+EMBEDDINGS_VERSION = 2
+
+
+def embedding_name(backend=None):
+    """Identificação dos vetores (backend, modelo e versão), usada nas chaves de índices e caches."""
+    return f'{backend or DEFAULT_BACKEND}:{EMBEDDING_MODEL}:v{EMBEDDINGS_VERSION}'
+
+
+class OnnxEmbeddings(Embeddings):
+    """all-MiniLM-L6-v2 em ONNX (int8) com mean pooling e normalização L2."""
+
+    def __init__(self, repo_id=ONNX_REPO_ID, model_file=ONNX_MODEL_FILE,
+                 batch_size=32, max_length=256, num_threads=None):
+        try:
+            import onnxruntime as ort
+            from huggingface_hub import hf_hub_download
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                "O backend 'onnx-int8' requer os pacotes onnxruntime, tokenizers e huggingface-hub."
+            ) from e
+
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(hf_hub_download(repo_id, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token='[PAD]')
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            hf_hub_download(repo_id, model_file),
+            sess_options=options,
+            providers=['CPUExecutionProvider'],
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self.input_names:
+            feeds['token_type_ids'] = np.zeros_like(input_ids)
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling considerando apenas os tokens reais + normalização L2
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, texts):
+        """Codifica textos em lotes; ordena por tamanho para reduzir o padding."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        order = np.argsort([len(t) for t in texts], kind='stable')
+        vectors = [None] * len(texts)
+        for start in range(0, len(texts), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            for i, vector in zip(idx, self._encode_batch([texts[i] for i in idx])):
+                vectors[i] = vector
+        return np.vstack(vectors).astype(np.float32)
+
+    def embed_documents(self, texts):
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self.encode([text])[0].tolist()
+
+
+def get_embeddings(backend=None):
+    """Instancia o backend de embeddings escolhido (ou o padrão da variável de ambiente)."""
+    backend = backend or DEFAULT_BACKEND
+    if backend == 'huggingface':
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, encode_kwargs={'normalize_embeddings': True})
+    if backend == 'onnx-int8':
+        return OnnxEmbeddings()
+    raise ValueError(f"Backend de embeddings desconhecido: {backend!r} (opções: {', '.join(BACKENDS)})")
@@ -0,0 +1,166 @@
+# Parsers compilados para as respostas numéricas em texto livre do questionário.
+#
+# Cada entrada do registro TYPED_FIELDS diz de qual coluna bruta sai o valor,
+# qual parser (vetorizado, com regex compilada uma única vez) é aplicado e em
+# qual coluna tipada o resultado é gravado. O app aplica o registro uma vez na
+# ingestão (ver preprocess_data) e o resultado fica em cache.
+
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# Expressões regulares compiladas
+_RE_FIRST_NUMBER = re.compile(r'(\d+(?:[.,]\d+)?)')
+_RE_TIMES = re.compile(r'(\d+)\s*X', re.IGNORECASE)
+_RE_SPACING = re.compile(r'(\d+(?:[.,]\d+)?)\s*m?\s*[xX×]\s*(\d+(?:[.,]\d+)?)\s*m?')
+_RE_RATIO = re.compile(r'(\d+(?:[.,]\d+)?)\s*SACAS?\s+DE\s+RAIZ\s*/\s*(\d+(?:[.,]\d+)?)\s*SACAS?', re.IGNORECASE)
+
+MESES = [
+    'JANEIRO', 'FEVEREIRO', 'MARÇO', 'ABRIL', 'MAIO', 'JUNHO',
+    'JULHO', 'AGOSTO', 'SETEMBRO', 'OUTUBRO', 'NOVEMBRO', 'DEZEMBRO'
+]
+_RE_MESES = [re.compile(mes, re.IGNORECASE) for mes in MESES]
+
+RENDA_MAP = {
+    'MENOR QUE UM SALÁRIO MÍNIMO': 1000,
+    '1 SALÁRIO MÍNIMO': 1630,
+    '1 A 2 SALÁRIOS MÍNIMOS': 3260,
+    '2 A 3 SALÁRIOS MÍNIMOS': 4890
+}
+
+
+def _to_float(s):
+    """Converte texto com vírgula ou ponto decimal em float (NaN se inválido)."""
+    return pd.to_numeric(s.str.replace(',', '.', regex=False), errors='coerce')
+
+
+def _as_text(series):
+    """Garante uma série de texto, preservando ausentes como NaN."""
+    return series.astype('string')
+
+
+def parse_decimal(series):
+    """'0,2' -> 0.2, '10.00' -> 10.0, 'N.A.' -> NaN."""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float)
+    return _to_float(_as_text(series).str.strip()).astype(float)
+
+
+def parse_price(series):
+    """Preço em R$ como parse_decimal; 0 é "não comprou" e vira NaN (não entra nas médias)."""
+    prices = parse_decimal(series)
+    return prices.where(prices != 0)
+
+
+def parse_first_number(series):
+    """Primeiro número do texto: '8 MESES' -> 8, 'ACIMA DE 5 DIAS' -> 5, '2 ANOS POR ÁREA.' -> 2."""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float)
+    return _to_float(_as_text(series).str.extract(_RE_FIRST_NUMBER, expand=False)).astype(float)
+
+
+def parse_times(series):
+    """Frequência no formato '2X' -> 2."""
+    return _to_float(_as_text(series).str.extract(_RE_TIMES, expand=False)).astype(float)
+
+
+def parse_spacing(series):
+    """Espaçamento '1m x 1m' -> DataFrame com as duas dimensões em metros."""
+    parts = _as_text(series).str.extract(_RE_SPACING)
+    return pd.DataFrame({
+        'linha': _to_float(parts[0]).astype(float),
+        'planta': _to_float(parts[1]).astype(float),
+    }, index=series.index)
+
+
+def parse_root_flour_ratio(series):
+    """'3 SACAS DE RAIZ/1 SACA DE FARINHA' -> 3.0 sacas de raiz por saca de farinha."""
+    parts = _as_text(series).str.extract(_RE_RATIO)
+    return (_to_float(parts[0]) / _to_float(parts[1]).replace(0, np.nan)).astype(float)
+
+
+def parse_month_mask(series):
+    """Lista de meses 'JANEIRO, MARÇO' -> bitmask inteiro (bit 0 = janeiro)."""
+    text = _as_text(series)
+    mask = np.zeros(len(text), dtype='int64')
+    for bit, pattern in enumerate(_RE_MESES):
+        mask |= text.str.contains(pattern, na=False).to_numpy(dtype='int64') << bit
+    mask = pd.Series(mask, index=series.index)
+    # Respostas sem nenhum mês reconhecido ('N.A.', vazio) ficam ausentes
+    return mask.where(mask > 0, other=pd.NA).astype('Int64')
+
+
+def parse_income_band(series):
+    """Faixa de renda ('1 A 2 SALÁRIOS MÍNIMOS ') -> valor em R$."""
+    return _as_text(series).str.strip().str.upper().map(RENDA_MAP).astype(float)
+
+
+def count_months(mask):
+    """Quantidade de meses marcados em um bitmask gerado por parse_month_mask."""
+    values = mask.fillna(0).astype('int64').to_numpy()
+    counts = np.zeros(len(values), dtype='int64')
+    for bit in range(len(MESES)):
+        counts += (values >> bit) & 1
+    return pd.Series(counts, index=mask.index).where(mask.notna()).astype('Int64')
+
+
+# Registro das colunas tipadas: coluna destino -> (coluna origem, parser).
+# Parsers que devolvem DataFrame geram uma coluna por campo, com o sufixo
+# indicado em TYPED_FIELDS_MULTI.
+TYPED_FIELDS = {
+    'Tamanho_Propriedade_ha': ('Tamanho_Propriedade_ha', parse_decimal),
+    'Tamanho_Area_Produtiva_ha': ('Tamanho_Area_Produtiva_ha', parse_decimal),
+    'Tamanho_Area_Plantada_ha': ('Tamanho_Area_Plantada_ha', parse_decimal),
+    'Idade': ('Idade', parse_decimal),
+    'Area_Mandioca_ha': ('Area_Mandioca_ha', parse_decimal),
+    'Area_Macaxeira_ha': ('Area_Macaxeira_ha', parse_decimal),
+    'Preco_Farinha': ('Preco_Farinha', parse_decimal),
+    'Preco_Feixe_Maniva': ('Em caso de compra, qual o valor pago por feixe(R$)?', parse_price),
+    'Meses_Colheita_Mandioca': ('Meses_Colheita_Mandioca', parse_first_number),
+    'Meses_Colheita_Macaxeira': ('Quantos meses colhe a MACAXEIRA?', parse_first_number),
+    'Tempo_Producao_Dias': ('Tempo_Producao_Dias', parse_first_number),
+    'Tempo_Uso_Area_Anos': ('Qual o tempo uso da mesma área para o plantio de macaxeira e/ou mandioca?', parse_first_number),
+    'Capina_Meses_Apos_Plantio': ('Em que período do ano realiza a capina/roçagem?', parse_first_number),
+    'Capinas_Por_Ano': ('Quantas veze ao ano realiza capina e/ou roçagem?', parse_times),
+    'Sacas_Raiz_Por_Saca_Farinha': ('Quantos kg de mandioca são coletados para 1 saca de farinha (60kg)?', parse_root_flour_ratio),
+    'Meses_Preco_Baixo': ('Se sim, qual época do ano o preço é mais baixo (meses)? ', parse_month_mask),
+    'Renda_Familiar_R$': ('Renda_Familiar', parse_income_band),
+    'Espacamento': ('Qual o espaçamento entre plantas? (m)', parse_spacing),
+}
+
+TYPED_FIELDS_MULTI = {
+    'Espacamento': {'linha': 'Espacamento_Linha_m', 'planta': 'Espacamento_Planta_m'},
+}
+
+
+def derived_column_names():
+    """Colunas novas criadas pelo registro (as convertidas no lugar ficam de fora)."""
+    names = []
+    for target, (source, _) in TYPED_FIELDS.items():
+        if target in TYPED_FIELDS_MULTI:
+            names.extend(TYPED_FIELDS_MULTI[target].values())
+        elif target != source:
+            names.append(target)
+    return names
+
+
+def parse_typed_fields(df):
+    """Aplica todos os parsers do registro de uma vez e devolve um novo DataFrame."""
+    df = df.copy()
+    new_cols = {}
+    for target, (source, parser) in TYPED_FIELDS.items():
+        if source not in df.columns:
+            continue
+        parsed = parser(df[source])
+        if isinstance(parsed, pd.DataFrame):
+            for part, name in TYPED_FIELDS_MULTI[target].items():
+                new_cols[name] = parsed[part]
+        else:
+            new_cols[target] = parsed
+
+    # Colunas já existentes são substituídas no lugar; as novas vão para o fim
+    for name, values in new_cols.items():
+        df[name] = values
+    return df
@@ -0,0 +1,408 @@
+# Ingestão incremental das exportações de entrevistas.
+#
+# Uso:
+#     python ingest.py nova_exportacao.csv [outra.csv ...] [--municipio Juruti] [--onda 2025]
+#     python ingest.py --status
+#
+# Em vez de sobrescrever Backup_Juriti.csv e reconstruir tudo, cada exportação
+# vira partições novas em STORE_DIR (Feather comprimido), só com as
+# entrevistas novas ou alteradas, separadas por município, onda da pesquisa,
+# comunidade e mês da coleta:
+#     municipio=juruti/onda=2025/comunidade=castanhal/coleta=2025-04/part-00003.feather
+# O manifesto guarda esses atributos de cada partição, então os leitores
+# (load_store, load_counts, shared_store) escolhem as partições pelos filtros
+# antes de abrir qualquer arquivo: a visão de Juruti nunca lê dados de outro
+# município, e o volume total não pesa em nenhuma visão isolada.
+#
+# Uma onda é uma rodada da pesquisa (o mesmo produtor é reentrevistado em
+# cada uma; ver waves.py). A chave de cada entrevista é o município + a onda +
+# o Identificador quando existe;
+# senão Comunidade + Família; senão Comunidade + nome do produtor. O índice de
+# chaves (chaves.json) guarda, por chave, a partição onde ela está e o hash
+# das respostas brutas; o manifesto (manifest.json, lido a cada rerun do app)
+# só lista as partições:
+#   - chave nova -> entra na partição nova;
+#   - chave conhecida com respostas iguais -> ignorada;
+#   - chave conhecida com respostas diferentes -> sai da partição antiga
+#     (reescrita sem ela) e entra na nova.
+#
+# Cada lote passa pelas etapas linha a linha do pipeline (prepare_rows) uma
+# única vez. Junto de cada partição fica a tabela longa de contagens das
+# respostas de texto (<partição>.counts.feather), que somadas dão as seções do
+# contexto do RAG sem recontar o questionário inteiro. Assim, ingerir 50
+# entrevistas custa proporcional a 50. Quem monta o DataFrame completo é
+# load_store (usado pelo shared_store); o índice FAISS e o cache da API são
+# chaveados pela versão dos dados e se renovam sozinhos (a API confere a
+# versão periodicamente, ver data_api.RELOAD_SECONDS).
+#
+# Na primeira execução o armazenamento é criado a partir das exportações dos
+# municípios de data_pipeline.MUNICIPIOS. Todos os municípios compartilham o
+# esquema do questionário. Configuração: MANIVA_STORE_DIR muda o diretório
+# (padrão "dados").
+
+import argparse
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from canonicalization import fold_series, slugify
+from context_builder import categorical_counts, content_hash, merge_counts
+from data_pipeline import (COLUNA_MUNICIPIO, COLUNA_ONDA, DEFAULT_MUNICIPIO, DEFAULT_ONDA, MUNICIPIOS,
+                           load_data, prepare_rows)
+from dtype_optimizer import is_measure, optimize_dtypes
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+
+STORE_DIR = os.environ.get('MANIVA_STORE_DIR', 'dados')
+MANIFEST = 'manifest.json'
+KEY_INDEX = 'chaves.json'
+# As partições guardam as linhas já preparadas (prepare_rows): mude também
+# quando um parser de field_parsers ou a canonicalização mudar o valor gravado
+MANIFEST_VERSION = 6
+
+KEY_COLUMN = '_chave'
+
+# Valores das partições quando a entrevista não tem comunidade ou data
+NO_COMMUNITY = 'Sem comunidade'
+NO_DATE = 'sem-data'
+# Data da coleta: a da tarefa e, sem ela, a da resposta
+DATE_COLUMNS = ('Data da tarefa', 'Data resposta')
+
+
+def interview_keys(df):
+    """Chave de cada entrevista: Identificador, Comunidade+Família ou Comunidade+nome."""
+    comunidade = fold_series(df['Comunidade'].fillna('')) if 'Comunidade' in df.columns else ''
+    keys = pd.Series('nome:' + comunidade + ':' + fold_series(
+        df.get('Nome produtor (entrevistado)', pd.Series('', index=df.index)).fillna('')),
+        index=df.index)
+    if 'Família' in df.columns:
+        familia = df['Família'].astype('string').str.strip()
+        keys = keys.mask(familia.notna(), 'familia:' + comunidade + ':' + familia)
+    if 'Identificador' in df.columns:
+        identificador = df['Identificador'].astype('string').str.strip()
+        keys = keys.mask(identificador.notna(), 'id:' + identificador)
+    return keys.astype(str)
+
+
+def collection_months(df):
+    """Mês da coleta (AAAA-MM) de cada entrevista, ou NO_DATE."""
+    dates = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            parsed = pd.to_datetime(df[col], dayfirst=True, format='mixed', errors='coerce')
+            dates = dates.fillna(parsed)
+    return dates.dt.strftime('%Y-%m').fillna(NO_DATE)
+
+
+def row_hashes(df):
+    """Hash das respostas brutas de cada linha (detecta entrevistas alteradas)."""
+    return pd.util.hash_pandas_object(df.astype(str), index=False).map('{:016x}'.format)
+
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _store_lock(store_dir):
+    """Lock exclusivo entre processos para ler, alterar e gravar manifesto e chaves (como em shared_store)."""
+    os.makedirs(store_dir, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(store_dir, 'ingest.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_manifest(store_dir=None):
+    store_dir = store_dir or STORE_DIR
+    manifest = _read_json(os.path.join(store_dir, MANIFEST), {
+        'versao': MANIFEST_VERSION, 'esquema': {}, 'proxima_particao': 1, 'particoes': {},
+    })
+    if manifest['versao'] != MANIFEST_VERSION:
+        raise ValueError(f"Armazenamento em {store_dir} no formato {manifest['versao']} "
+                         f"(atual: {MANIFEST_VERSION}); apague o diretório e ingira as exportações de novo.")
+    return manifest
+
+
+def load_key_index(store_dir=None):
+    """chave -> {'particao', 'hash'} de todas as entrevistas armazenadas."""
+    return _read_json(os.path.join(store_dir or STORE_DIR, KEY_INDEX), {})
+
+
+def partition_name(municipio, onda, comunidade, coleta, number):
+    return (f'municipio={slugify(municipio) or "_"}/onda={slugify(onda) or "_"}/'
+            f'comunidade={slugify(comunidade) or "_"}/coleta={coleta}/part-{number:05d}')
+
+
+def _partition_order(name):
+    # Ordem de ingestão (o número da partição), não a do diretório
+    return name.rsplit('/', 1)[-1]
+
+
+def select_partitions(manifest, municipios=None, comunidades=None, coleta=None, ondas=None):
+    """Partições que podem ter linhas dos filtros; None ou listas vazias não filtram.
+
+    coleta é um intervalo (início, fim) de meses AAAA-MM, inclusivo.
+    """
+    selected = []
+    for name, info in manifest['particoes'].items():
+        if municipios and info['municipio'] not in municipios:
+            continue
+        if ondas and info['onda'] not in ondas:
+            continue
+        if comunidades and info['comunidade'] not in comunidades:
+            continue
+        if coleta and not coleta[0] <= info['coleta'] <= coleta[1]:
+            continue
+        selected.append(name)
+    return sorted(selected, key=_partition_order)
+
+
+def partition_catalog(store_dir=None):
+    """Municípios, ondas, comunidades e meses armazenados (do manifesto, sem ler dados)."""
+    manifest = ensure_store(store_dir)
+    columns = ['municipio', 'onda', 'comunidade', 'coleta', 'linhas']
+    catalog = pd.DataFrame(
+        [{'particao': name, **{k: info[k] for k in columns}} for name, info in manifest['particoes'].items()],
+        columns=['particao', *columns])
+    return catalog.sort_values(columns[:4], ignore_index=True)
+
+
+def municipality_waves(municipio, store_dir=None):
+    """Ondas armazenadas do município, da mais antiga à mais recente."""
+    manifest = ensure_store(store_dir)
+    return sorted({info['onda'] for info in manifest['particoes'].values() if info['municipio'] == municipio})
+
+
+def store_version(manifest, names=None):
+    """Versão dos dados armazenados (ou só das partições names); muda a cada ingestão que as altera."""
+    names = manifest['particoes'] if names is None else names
+    state = {name: manifest['particoes'][name]['hash'] for name in names}
+    return content_hash(json.dumps(state, sort_keys=True))
+
+
+def _partition_path(store_dir, name, kind=''):
+    return os.path.join(store_dir, f'{name}{kind}.feather')
+
+
+def _write_partition(store_dir, name, rows):
+    """Grava a partição e sua tabela de contagens; devolve o hash do conteúdo."""
+    text_cols = [col for col in rows.columns if col != KEY_COLUMN and not is_measure(rows[col])]
+    counts = categorical_counts(rows, text_cols) if text_cols else merge_counts([])
+    os.makedirs(os.path.dirname(_partition_path(store_dir, name)), exist_ok=True)
+    for kind, frame in (('', rows), ('.counts', counts)):
+        path = _partition_path(store_dir, name, kind)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        frame.reset_index(drop=True).to_feather(tmp_path, compression='zstd')
+        os.replace(tmp_path, path)
+    return content_hash(''.join(row_hashes(rows.drop(columns=KEY_COLUMN))))
+
+
+def _remove_partition(store_dir, name):
+    for kind in ('', '.counts'):
+        path = _partition_path(store_dir, name, kind)
+        if os.path.exists(path):
+            os.remove(path)
+    # Remove os diretórios municipio=/comunidade=/coleta= que ficaram vazios
+    directory = os.path.dirname(_partition_path(store_dir, name))
+    while os.path.abspath(directory) != os.path.abspath(store_dir) and not os.listdir(directory):
+        os.rmdir(directory)
+        directory = os.path.dirname(directory)
+
+
+# Tipo fixo de cada coluna numérica do esquema: o mesmo em todos os lotes,
+# tenham eles valores ausentes ou não
+_SCHEMA_DTYPES = {'inteiro': 'Int64', 'decimal': 'float64'}
+
+
+def _infer_schema(path):
+    df = load_data(path)
+    schema = {}
+    for col in df.columns:
+        if pd.api.types.is_integer_dtype(df[col]):
+            schema[col] = 'inteiro'
+        elif pd.api.types.is_numeric_dtype(df[col]):
+            schema[col] = 'decimal'
+        else:
+            schema[col] = 'texto'
+    return schema
+
+
+def read_export(path, schema):
+    """Lê uma exportação com os tipos do armazenamento; devolve (DataFrame, chaves).
+
+    Tudo é lido como texto e só as colunas numéricas do esquema são convertidas
+    (a inferência de tipos por lote não é confiável: uma coluna de texto só com
+    "2023" viraria float). As chaves saem do texto original ("1", não "1.0").
+    """
+    df = load_data(path, dtype=str)
+    keys = interview_keys(df)
+    for col in df.columns:
+        if schema.get(col) in _SCHEMA_DTYPES:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(_SCHEMA_DTYPES[schema[col]])
+    return df, keys
+
+
+def ingest_export(path, store_dir=None, municipio=DEFAULT_MUNICIPIO, onda=DEFAULT_ONDA):
+    """Ingere uma exportação de uma onda do município; devolve {'novas', 'alteradas', 'ignoradas', 'particoes'}.
+
+    Duas ingestões ao mesmo tempo (ou com a criação do armazenamento pelo app)
+    rodam uma depois da outra: cada uma lê, altera e grava manifesto e chaves.
+    """
+    store_dir = store_dir or STORE_DIR
+    with _store_lock(store_dir):
+        return _ingest_export(path, store_dir, municipio, onda)
+
+
+def _ingest_export(path, store_dir, municipio, onda):
+    manifest = load_manifest(store_dir)
+    if not manifest['esquema']:
+        manifest['esquema'] = _infer_schema(path)
+
+    raw, keys = read_export(path, manifest['esquema'])
+    # Identificadores e famílias só são únicos dentro de um município, e cada
+    # onda reentrevista os mesmos produtores
+    keys = f'{slugify(municipio)}:{slugify(onda)}:' + keys
+    raw = raw[~keys.duplicated(keep='last')]
+    keys = keys[raw.index]
+    hashes = row_hashes(raw)
+
+    known = load_key_index(store_dir)
+    is_new = ~keys.isin(known.keys())
+    is_changed = ~is_new & pd.Series(
+        [known.get(k, {}).get('hash') != h for k, h in zip(keys, hashes)], index=raw.index)
+    result = {'novas': int(is_new.sum()), 'alteradas': int(is_changed.sum()),
+              'ignoradas': int((~is_new & ~is_changed).sum()), 'particoes': []}
+    if not (is_new | is_changed).any():
+        return result
+
+    # Entrevistas alteradas saem das partições antigas, que são reescritas
+    changed_keys = set(keys[is_changed])
+    for name in sorted({known[k]['particao'] for k in changed_keys}):
+        rows = pd.read_feather(_partition_path(store_dir, name))
+        rows = rows[~rows[KEY_COLUMN].isin(changed_keys)]
+        if rows.empty:
+            _remove_partition(store_dir, name)
+            del manifest['particoes'][name]
+        else:
+            manifest['particoes'][name].update(linhas=len(rows), hash=_write_partition(store_dir, name, rows))
+
+    batch = raw[is_new | is_changed]
+    rows = prepare_rows(batch)
+    rows.insert(0, COLUNA_ONDA, onda)
+    rows.insert(0, COLUNA_MUNICIPIO, municipio)
+    rows.insert(0, KEY_COLUMN, keys[batch.index])
+    # Uma partição por comunidade (já canonizada) e mês da coleta
+    comunidades = rows['Comunidade'].astype('string').fillna(NO_COMMUNITY)
+    ingested_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    for (comunidade, coleta), part in rows.groupby([comunidades, collection_months(rows)], sort=True):
+        name = partition_name(municipio, onda, comunidade, coleta, manifest['proxima_particao'])
+        manifest['particoes'][name] = {
+            'municipio': municipio,
+            'onda': onda,
+            'comunidade': comunidade,
+            'coleta': coleta,
+            'linhas': len(part),
+            'origem': os.path.basename(str(path)),
+            'ingerido_em': ingested_at,
+            'hash': _write_partition(store_dir, name, part),
+        }
+        manifest['proxima_particao'] += 1
+        for key, row_hash in zip(part[KEY_COLUMN], hashes[part.index]):
+            known[key] = {'particao': name, 'hash': row_hash}
+        result['particoes'].append(name)
+    # O manifesto é gravado por último: é ele que publica a nova versão
+    _write_json(os.path.join(store_dir, KEY_INDEX), known)
+    _write_json(os.path.join(store_dir, MANIFEST), manifest)
+    return result
+
+
+def ensure_store(store_dir=None):
+    """Manifesto do armazenamento; municípios de MUNICIPIOS ainda ausentes são ingeridos da fonte."""
+    store_dir = store_dir or STORE_DIR
+
+    def missing(manifest):
+        stored = {info['municipio'] for info in manifest['particoes'].values()}
+        return [m for m, info in MUNICIPIOS.items() if m not in stored and info.get('fonte')]
+
+    manifest = load_manifest(store_dir)
+    if not missing(manifest):
+        return manifest
+    with _store_lock(store_dir):
+        # Outro processo pode ter criado o armazenamento enquanto esperávamos o lock
+        for municipio in missing(load_manifest(store_dir)):
+            _ingest_export(MUNICIPIOS[municipio]['fonte'], store_dir, municipio, DEFAULT_ONDA)
+        return load_manifest(store_dir)
+
+
+def _selected(store_dir, municipios, comunidades, coleta, ondas):
+    names = select_partitions(ensure_store(store_dir), municipios, comunidades, coleta, ondas)
+    if not names:
+        raise ValueError('Nenhuma partição armazenada para os filtros escolhidos')
+    return names
+
+
+def load_store(store_dir=None, municipios=None, comunidades=None, coleta=None, ondas=None):
+    """O questionário (mesmo formato de load_survey), lendo só as partições dos filtros."""
+    store_dir = store_dir or STORE_DIR
+    names = _selected(store_dir, municipios, comunidades, coleta, ondas)
+    parts = [pd.read_feather(_partition_path(store_dir, name)) for name in names]
+    df = pd.concat(parts, ignore_index=True).drop(columns=KEY_COLUMN)
+    return optimize_dtypes(df)
+
+
+def load_counts(store_dir=None, municipios=None, comunidades=None, coleta=None, ondas=None):
+    """Contagens das respostas de texto somadas entre as partições dos filtros."""
+    store_dir = store_dir or STORE_DIR
+    names = _selected(store_dir, municipios, comunidades, coleta, ondas)
+    return merge_counts([pd.read_feather(_partition_path(store_dir, name, '.counts')) for name in names])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingestão incremental de exportações de entrevistas.')
+    parser.add_argument('exports', nargs='*')
+    parser.add_argument('--municipio', default=DEFAULT_MUNICIPIO)
+    parser.add_argument('--onda', default=DEFAULT_ONDA)
+    parser.add_argument('--status', action='store_true')
+    args = parser.parse_args()
+
+    ensure_store()
+    for path in args.exports:
+        result = ingest_export(path, municipio=args.municipio, onda=args.onda)
+        print(f"{path}: {result['novas']} novas, {result['alteradas']} alteradas, "
+              f"{result['ignoradas']} ignoradas -> {len(result['particoes'])} partições novas")
+    manifest = load_manifest()
+    if args.status:
+        catalog = partition_catalog()
+        print(catalog.groupby(['municipio', 'onda', 'comunidade'])
+              .agg(particoes=('particao', 'size'), entrevistas=('linhas', 'sum'),
+                   primeira_coleta=('coleta', 'min'), ultima_coleta=('coleta', 'max'))
+              .to_string())
+    print(f"{len(load_key_index())} entrevistas em {len(manifest['particoes'])} partições "
+          f"(versão {store_version(manifest)})")
+
+
+if __name__ == '__main__':
+    main()
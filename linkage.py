@@ -0,0 +1,286 @@
+# Vinculação de registros: o mesmo produtor nas diferentes fontes.
+#
+# Uso:
+#     python linkage.py [--municipio Juruti] [--csv vinculos.csv]
+#
+# O produtor aparece como "Nome produtor (entrevistado)" no questionário,
+# "Produtor" em Coordenadas_Separadas.csv e "Target" em RedeDificuldades.json,
+# sem chave comum e com grafias diferentes (espaços, acentos, "Haraujo").
+# link_records casa duas listas de (comunidade, nome) sem comparar todos com
+# todos:
+#   1. blocagem: só viram candidatos os pares da mesma comunidade
+#      (normalizada: sem acento, sem o prefixo "Comunidade") que dividem
+#      tokens do nome (dois, se os dois nomes tiverem dois ou mais); tokens
+#      comuns demais no bloco (SILVA) não geram pares sozinhos;
+#   2. similaridade vetorizada: cosseno dos bigramas de caracteres, com nomes,
+#      tokens e bigramas trocados por códigos inteiros e cada par de nomes
+#      distintos pontuado uma vez (busca ordenada na tabela nome/bigrama/peso);
+#   3. pares acima de LINK_THRESHOLD, do maior score para o menor, sem repetir
+#      registro.
+# A tabela de vínculos (fonte, registro da fonte -> chave da entrevista) é
+# gravada em .cache/ com o hash das entradas no nome, então só é recalculada
+# quando o questionário ou os arquivos mudam. O app usa os vínculos para
+# mostrar respostas do questionário no mapa.
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from canonicalization import fold_series
+from context_builder import content_hash
+from ingest import interview_keys
+
+
+CACHE_DIR = '.cache'
+LINKAGE_VERSION = 1
+
+COORDINATES_PATH = 'Coordenadas_Separadas.csv'
+NETWORK_PATH = 'RedeDificuldades.json'
+NAME_COLUMN = 'Nome produtor (entrevistado)'
+
+LINK_THRESHOLD = 0.75
+# Tokens de nome ignorados na blocagem
+STOPWORDS = {'DA', 'DE', 'DO', 'DAS', 'DOS', 'E'}
+MIN_TOKEN_LEN = 3
+# Um token só gera candidatos se o bloco dele tiver até tantos pares
+MAX_BLOCK_PAIRS = 2500
+MIN_SHARED_TOKENS = 2
+
+LINK_COLUMNS = ['fonte', 'registro', 'nome_fonte', 'comunidade_fonte', 'chave', 'nome', 'comunidade', 'score']
+
+
+def normalize_communities(series):
+    """'Comunidade Café torrado' e 'Café Torrado' -> 'CAFE TORRADO'."""
+    return fold_series(series.astype('string').fillna('')).str.replace(r'^COMUNIDADE\s+', '', regex=True)
+
+
+def _prepare(records):
+    return pd.DataFrame({
+        'comunidade': normalize_communities(records['comunidade']),
+        'nome': fold_series(records['nome'].astype('string').fillna('')),
+    }, index=records.index).query("nome != ''")
+
+
+def _codes(left_values, right_values):
+    """Códigos inteiros comuns aos dois lados (as junções em int64 são bem mais rápidas que em texto)."""
+    codes, uniques = pd.factorize(pd.concat([left_values, right_values], ignore_index=True))
+    return codes[:len(left_values)], codes[len(left_values):], len(uniques)
+
+
+def _tokens(prepared):
+    """(posição do registro, token) para os tokens do nome úteis na blocagem."""
+    tokens = prepared['nome'].reset_index(drop=True).str.split(' ').explode()
+    tokens = tokens[(tokens.str.len() >= MIN_TOKEN_LEN) & ~tokens.isin(STOPWORDS)]
+    return pd.DataFrame({'id': tokens.index.to_numpy(), 'token': tokens.to_numpy()}).drop_duplicates()
+
+
+def candidate_pairs(left, right):
+    """Posições (esquerda, direita) dos pares da mesma comunidade que dividem tokens do nome.
+
+    Pares com nomes de dois ou mais tokens úteis precisam dividir pelo menos
+    MIN_SHARED_TOKENS deles; nomes idênticos são sempre candidatos.
+    """
+    left_tokens, right_tokens = _tokens(left), _tokens(right)
+    left_communities, right_communities, _ = _codes(left['comunidade'], right['comunidade'])
+    left_token_codes, right_token_codes, n_tokens = _codes(left_tokens['token'], right_tokens['token'])
+    # Bloco = (comunidade, token), num único inteiro
+    left_blocks = pd.DataFrame({
+        'id_esquerda': left_tokens['id'].to_numpy(),
+        'bloco': left_communities[left_tokens['id'].to_numpy()].astype(np.int64) * n_tokens + left_token_codes,
+    })
+    right_blocks = pd.DataFrame({
+        'id_direita': right_tokens['id'].to_numpy(),
+        'bloco': right_communities[right_tokens['id'].to_numpy()].astype(np.int64) * n_tokens + right_token_codes,
+    })
+    sizes = left_blocks['bloco'].value_counts().mul(right_blocks['bloco'].value_counts(), fill_value=0)
+    small = sizes.index[(sizes > 0) & (sizes <= MAX_BLOCK_PAIRS)]
+    pairs = left_blocks[left_blocks['bloco'].isin(small)].merge(right_blocks, on='bloco')
+    # Tokens divididos por par, contra os tokens úteis de cada nome
+    keys, shared = np.unique(pairs['id_esquerda'].to_numpy(np.int64) * len(right) + pairs['id_direita'], return_counts=True)
+    first, second = keys // len(right), keys % len(right)
+    useful_left = np.bincount(left_blocks['id_esquerda'], minlength=len(left))
+    useful_right = np.bincount(right_blocks['id_direita'], minlength=len(right))
+    keep = shared >= np.minimum(MIN_SHARED_TOKENS, np.minimum(useful_left[first], useful_right[second]))
+    shared = pd.DataFrame({'id_esquerda': first[keep], 'id_direita': second[keep]})
+
+    left_names, right_names, _ = _codes(left['comunidade'] + '|' + left['nome'], right['comunidade'] + '|' + right['nome'])
+    same_name = pd.DataFrame({'id_esquerda': np.arange(len(left)), 'nome': left_names}).merge(
+        pd.DataFrame({'id_direita': np.arange(len(right)), 'nome': right_names}), on='nome')
+    return (pd.concat([shared[['id_esquerda', 'id_direita']], same_name[['id_esquerda', 'id_direita']]])
+            .drop_duplicates(ignore_index=True))
+
+
+def _bigrams(names):
+    """(nome, bigrama, peso) de cada nome distinto, ordenado por nome e bigrama; os pesos de cada nome têm norma 1."""
+    padded = ' ' + pd.Series(names, dtype=object) + ' '
+    bigrams = pd.Series([[text[i:i + 2] for i in range(len(text) - 1)] for text in padded]).explode()
+    codes, uniques = pd.factorize(bigrams)
+    keys, counts = np.unique(bigrams.index.to_numpy(np.int64) * len(uniques) + codes, return_counts=True)
+    name = keys // len(uniques)
+    norms = np.sqrt(np.bincount(name, weights=counts.astype(float) ** 2))
+    return pd.DataFrame({'nome': name, 'bigrama': keys % len(uniques), 'peso': counts / norms[name]})
+
+
+def pair_scores(pairs, left, right):
+    """Cosseno dos bigramas de cada par candidato (0 a 1), na ordem de pairs."""
+    # Cada nome distinto é decomposto uma vez, e cada par de nomes pontuado uma vez
+    left_names, right_names, n_names = _codes(left['nome'], right['nome'])
+    pair_codes, name_pairs = pd.factorize(left_names[pairs['id_esquerda']].astype(np.int64) * n_names
+                                          + right_names[pairs['id_direita']])
+    first, second = name_pairs // n_names, name_pairs % n_names
+    bigrams = _bigrams(pd.unique(pd.concat([left['nome'], right['nome']], ignore_index=True)))
+    name, bigram, weight = (bigrams[c].to_numpy() for c in ('nome', 'bigrama', 'peso'))
+    n_bigrams = int(bigram.max()) + 1 if len(bigram) else 1
+    keys = name * n_bigrams + bigram
+
+    # Bigramas do primeiro nome de cada par (tabela ordenada por nome: fatias contíguas)...
+    starts = np.searchsorted(name, np.arange(n_names))
+    lengths = np.bincount(name, minlength=n_names)[first]
+    pair = np.repeat(np.arange(len(name_pairs)), lengths)
+    rows = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts[first], lengths)
+    # ... procurados entre os bigramas do segundo nome
+    query = second[pair] * n_bigrams + bigram[rows]
+    found = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    hit = keys[found] == query
+    scores = np.bincount(pair[hit], weights=weight[rows[hit]] * weight[found[hit]], minlength=len(name_pairs))
+    return pairs.assign(score=scores[pair_codes])
+
+
+def name_scores(left_names, right_names):
+    """Cosseno dos bigramas entre os nomes de cada par (listas alinhadas); NaN onde falta um dos nomes."""
+    left = pd.DataFrame({'nome': fold_series(pd.Series(left_names, dtype='string').fillna(''))})
+    right = pd.DataFrame({'nome': fold_series(pd.Series(right_names, dtype='string').fillna(''))})
+    if left.empty:
+        return np.array([], dtype=float)
+    positions = np.arange(len(left))
+    scores = pair_scores(pd.DataFrame({'id_esquerda': positions, 'id_direita': positions}), left, right)['score']
+    missing = (left['nome'] == '').to_numpy() | (right['nome'] == '').to_numpy()
+    return np.where(missing, np.nan, scores.to_numpy())
+
+
+def _one_to_one(scored):
+    """Pares do maior score para o menor, sem repetir registro de nenhum lado."""
+    scored = scored.sort_values('score', ascending=False, kind='stable')
+    used_left, used_right, keep = set(), set(), []
+    for position, (left_id, right_id) in enumerate(zip(scored['id_esquerda'], scored['id_direita'])):
+        if left_id in used_left or right_id in used_right:
+            continue
+        used_left.add(left_id)
+        used_right.add(right_id)
+        keep.append(position)
+    return scored.iloc[keep]
+
+
+def link_records(left, right, threshold=LINK_THRESHOLD):
+    """Casa registros (colunas 'comunidade' e 'nome'; o índice é o id) das duas listas.
+
+    Devolve DataFrame (esquerda, direita, score), um vínculo por registro no máximo.
+    """
+    left, right = _prepare(left), _prepare(right)
+    pairs = candidate_pairs(left, right)
+    if pairs.empty:
+        return pd.DataFrame({'esquerda': [], 'direita': [], 'score': []})
+    scored = pair_scores(pairs, left, right)
+    linked = _one_to_one(scored[scored['score'] >= threshold])
+    return pd.DataFrame({'esquerda': left.index[linked['id_esquerda']],
+                         'direita': right.index[linked['id_direita']],
+                         'score': linked['score'].to_numpy()})
+
+
+def survey_records(df):
+    """Produtores do questionário indexados pela chave da entrevista (ingest.interview_keys)."""
+    records = pd.DataFrame({'comunidade': df['Comunidade'], 'nome': df[NAME_COLUMN]})
+    records.index = interview_keys(df)
+    return records
+
+
+def source_records(coordinates_path=COORDINATES_PATH, network_path=NETWORK_PATH):
+    """Produtores das outras fontes: {fonte: DataFrame(comunidade, nome)}; o índice é a linha na fonte."""
+    sources = {}
+    if os.path.exists(coordinates_path):
+        coords = pd.read_csv(coordinates_path)
+        sources['coordenadas'] = pd.DataFrame({'comunidade': coords['Comunidade'], 'nome': coords['Produtor']})
+    if os.path.exists(network_path):
+        with open(network_path, encoding='utf-8') as f:
+            edges = pd.DataFrame(json.load(f))
+        # Um registro por nó de produtor da rede (o nó é o próprio Target)
+        producers = edges[['Comunidade', 'Target']].drop_duplicates(ignore_index=True)
+        sources['rede'] = pd.DataFrame({'comunidade': producers['Comunidade'], 'nome': producers['Target']})
+    return sources
+
+
+def build_link_table(survey, sources):
+    """Tabela de vínculos: uma linha por registro de cada fonte casado com uma entrevista."""
+    survey = survey[~survey.index.duplicated()]
+    frames = []
+    for source, records in sources.items():
+        links = link_records(records, survey)
+        frames.append(pd.DataFrame({
+            'fonte': source,
+            'registro': links['esquerda'].astype(int).to_numpy(),
+            'nome_fonte': records.loc[links['esquerda'], 'nome'].astype('string').to_numpy(),
+            'comunidade_fonte': records.loc[links['esquerda'], 'comunidade'].astype('string').to_numpy(),
+            'chave': links['direita'].astype(str).to_numpy(),
+            'nome': survey.loc[links['direita'], 'nome'].astype('string').to_numpy(),
+            'comunidade': survey.loc[links['direita'], 'comunidade'].astype('string').to_numpy(),
+            'score': links['score'].to_numpy(),
+        }))
+    if not frames:
+        return pd.DataFrame(columns=LINK_COLUMNS)
+    return pd.concat(frames, ignore_index=True)[LINK_COLUMNS]
+
+
+def _inputs_hash(survey, paths):
+    parts = [str(LINKAGE_VERSION), str(LINK_THRESHOLD),
+             pd.util.hash_pandas_object(survey.astype(str), index=True).to_numpy().tobytes().hex()]
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                parts.append(content_hash(f.read().decode('utf-8', errors='replace')))
+    return content_hash('\n'.join(parts))
+
+
+def load_link_table(df, coordinates_path=COORDINATES_PATH, network_path=NETWORK_PATH, cache_dir=CACHE_DIR):
+    """Vínculos do questionário df com as coordenadas e a rede, lidos de .cache/ ou recalculados."""
+    survey = survey_records(df)
+    path = os.path.join(cache_dir, f'vinculos-{_inputs_hash(survey, (coordinates_path, network_path))}.feather')
+    if os.path.exists(path):
+        return pd.read_feather(path)
+    table = build_link_table(survey, source_records(coordinates_path, network_path))
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    table.to_feather(tmp_path)
+    os.replace(tmp_path, path)
+    return table
+
+
+def main():
+    import time
+
+    import ingest
+    from data_pipeline import DEFAULT_MUNICIPIO
+
+    parser = argparse.ArgumentParser(description='Vincula os produtores do questionário às coordenadas e à rede.')
+    parser.add_argument('--municipio', default=DEFAULT_MUNICIPIO)
+    parser.add_argument('--csv', default=None, help='grava também a tabela de vínculos em CSV (para revisão)')
+    args = parser.parse_args()
+
+    df = ingest.load_store(municipios=[args.municipio],
+                           ondas=[ingest.municipality_waves(args.municipio)[-1]])
+    start = time.perf_counter()
+    table = load_link_table(df)
+    elapsed = time.perf_counter() - start
+    for source, records in source_records().items():
+        linked = table[table['fonte'] == source]
+        print(f'{source}: {len(linked)} de {len(records)} registros vinculados '
+              f'({(linked["score"].round(6) < 1).sum()} por nome aproximado)')
+    print(f'{len(df)} entrevistas; vínculos em {elapsed:.2f}s')
+    if args.csv:
+        table.to_csv(args.csv, index=False, encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# Backends de LLM para o Maniv.IA.
+#
+# Todos os backends devolvem um chat model do LangChain, então a cadeia RAG não
+# muda. Hoje existem dois:
+#   - "deepseek": a API paga da DeepSeek (comportamento original);
+#   - "local": o mesmo cliente apontado para um servidor compatível com a API
+#     da OpenAI, por padrão o simulador de llm_standin.py. Serve para testar e
+#     medir o RAG sem rede e sem chave.
+#
+# Configuração por variáveis de ambiente:
+#   MANIVA_LLM_BACKEND      "deepseek" (padrão) ou "local"
+#   MANIVA_LLM_BASE_URL     URL do servidor local (padrão http://127.0.0.1:8765/v1)
+#   MANIVA_LLM_TIMEOUT      timeout por requisição, em segundos (padrão 60)
+#   MANIVA_LLM_MAX_RETRIES  novas tentativas em erro/timeout (padrão 2)
+#   MANIVA_LLM_MAX_TOKENS   teto de tokens da resposta (padrão 1000)
+
+import os
+
+from langchain_deepseek import ChatDeepSeek
+
+
+DEFAULT_LLM_BACKEND = os.environ.get('MANIVA_LLM_BACKEND', 'deepseek')
+LOCAL_BASE_URL = os.environ.get('MANIVA_LLM_BASE_URL', 'http://127.0.0.1:8765/v1')
+LLM_TIMEOUT = float(os.environ.get('MANIVA_LLM_TIMEOUT', 60))
+LLM_MAX_RETRIES = int(os.environ.get('MANIVA_LLM_MAX_RETRIES', 2))
+
+# Parâmetros de geração usados pelo app
+LLM_MODEL = 'deepseek-chat'
+LLM_TEMPERATURE = 0.3
+LLM_MAX_TOKENS = int(os.environ.get('MANIVA_LLM_MAX_TOKENS', 1000))
+
+
+def _deepseek(api_key, **overrides):
+    params = {
+        'api_key': api_key,
+        'model': LLM_MODEL,
+        'temperature': LLM_TEMPERATURE,
+        'max_tokens': LLM_MAX_TOKENS,
+        'timeout': LLM_TIMEOUT,
+        'max_retries': LLM_MAX_RETRIES,
+    }
+    params.update(overrides)
+    return ChatDeepSeek(**params)
+
+
+def _local(api_key=None, **overrides):
+    # O servidor local ignora a chave, mas o cliente exige uma
+    overrides.setdefault('api_base', LOCAL_BASE_URL)
+    return _deepseek(api_key or 'local', **overrides)
+
+
+LLM_BACKENDS = {
+    'deepseek': _deepseek,
+    'local': _local,
+}
+
+# Backends que só funcionam com uma chave de API informada pelo usuário
+REQUIRES_API_KEY = {'deepseek'}
+
+
+def requires_api_key(backend=None):
+    return (backend or DEFAULT_LLM_BACKEND) in REQUIRES_API_KEY
+
+
+def get_llm(api_key=None, backend=None, **overrides):
+    """Cria o chat model do backend escolhido (ou do padrão da variável de ambiente)."""
+    backend = backend or DEFAULT_LLM_BACKEND
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"Backend de LLM desconhecido: {backend!r} (opções: {', '.join(LLM_BACKENDS)})")
+    if backend in REQUIRES_API_KEY and not api_key:
+        raise ValueError(f"O backend {backend!r} requer uma API Key.")
+    return LLM_BACKENDS[backend](api_key, **overrides)
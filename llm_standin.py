@@ -0,0 +1,205 @@
+# Servidor local compatível com a API de chat da OpenAI, usado no lugar da
+# DeepSeek em testes offline e medições de latência do Maniv.IA.
+#
+# Uso:
+#     python llm_standin.py [--port 8765] [--latency 0.8] [--jitter 0.2]
+#                           [--tokens-per-second 40] [--completion-tokens 60]
+#                           [--failure-rate 0.05] [--seed 0]
+#
+# e depois rode o app com MANIVA_LLM_BACKEND=local.
+#
+# Rotas: POST /v1/chat/completions (com e sem stream=true) e GET /v1/models.
+# A resposta simula o tempo até o primeiro token (latency ± jitter), a geração
+# em tokens_per_second e falhas aleatórias (HTTP 500/429 na proporção
+# failure_rate). O texto da resposta é determinístico para o mesmo prompt.
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@dataclass
+class StandinConfig:
+    latency: float = 0.8            # segundos até o primeiro token
+    jitter: float = 0.2             # variação uniforme (±) da latência
+    tokens_per_second: float = 40.0
+    completion_tokens: int = 60
+    failure_rate: float = 0.0       # fração de requisições que falham
+    seed: int = 0
+    model: str = 'deepseek-chat'
+
+
+_PALAVRAS = [
+    'produtores', 'mandioca', 'macaxeira', 'farinha', 'comunidade', 'área',
+    'produção', 'dados', 'média', 'hectares', 'assistência', 'técnica',
+    'preço', 'Juruti', 'cultivo', 'variedades', 'pragas', 'renda',
+]
+
+
+def count_tokens(text):
+    """Estimativa simples de tokens (palavras), suficiente para o simulador."""
+    return len(text.split())
+
+
+def fake_completion(prompt, n_tokens):
+    """Gera um texto determinístico de n_tokens palavras a partir do prompt."""
+    rng = random.Random(hashlib.sha256(prompt.encode('utf-8')).hexdigest())
+    words = ['Resposta', 'simulada:'] + [rng.choice(_PALAVRAS) for _ in range(max(0, n_tokens - 2))]
+    return words[:n_tokens]
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    config = StandinConfig()
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _draw(self):
+        with self.rng_lock:
+            return self.rng.random(), self.rng.uniform(-1, 1)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': self.config.model, 'object': 'model'}]})
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+
+        failure_draw, jitter_draw = self._draw()
+        time.sleep(max(0.0, self.config.latency + jitter_draw * self.config.jitter))
+        if failure_draw < self.config.failure_rate:
+            # Metade das falhas simula limite de taxa, metade erro do servidor
+            status = 429 if failure_draw < self.config.failure_rate / 2 else 500
+            self._send_json(status, {'error': {'message': 'falha simulada', 'type': 'standin_error'}})
+            return
+
+        prompt = '\n'.join(str(m.get('content', '')) for m in request.get('messages', []))
+        n_tokens = min(self.config.completion_tokens, int(request.get('max_tokens') or self.config.completion_tokens))
+        words = fake_completion(prompt, n_tokens)
+        usage = {
+            'prompt_tokens': count_tokens(prompt),
+            'completion_tokens': len(words),
+            'total_tokens': count_tokens(prompt) + len(words),
+        }
+        completion_id = f'chatcmpl-{uuid.uuid4().hex[:12]}'
+        delay = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0.0
+
+        if request.get('stream'):
+            self._stream(completion_id, words, delay, usage)
+            return
+
+        time.sleep(delay * len(words))
+        self._send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': self.config.model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': ' '.join(words)},
+                'finish_reason': 'stop',
+            }],
+            'usage': usage,
+        })
+
+    def _stream(self, completion_id, words, delay, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(delta, finish_reason=None, extra=None):
+            payload = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': self.config.model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+            payload.update(extra or {})
+            self.wfile.write(f'data: {json.dumps(payload)}\n\n'.encode('utf-8'))
+            self.wfile.flush()
+
+        chunk({'role': 'assistant', 'content': ''})
+        for i, word in enumerate(words):
+            time.sleep(delay)
+            chunk({'content': word if i == 0 else f' {word}'})
+        chunk({}, finish_reason='stop', extra={'usage': usage})
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+
+
+def make_server(config=None, host='127.0.0.1', port=8765):
+    """Cria o servidor (sem iniciar); port=0 escolhe uma porta livre."""
+    config = config or StandinConfig()
+    handler = type('ConfiguredStandinHandler', (StandinHandler,), {
+        'config': config,
+        'rng': random.Random(config.seed),
+        'rng_lock': threading.Lock(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(config=None, host='127.0.0.1', port=0):
+    """Inicia o servidor em uma thread daemon e devolve (server, base_url)."""
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}/v1'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulador local da API de chat (compatível com OpenAI).')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    defaults = StandinConfig()
+    parser.add_argument('--latency', type=float, default=defaults.latency)
+    parser.add_argument('--jitter', type=float, default=defaults.jitter)
+    parser.add_argument('--tokens-per-second', type=float, default=defaults.tokens_per_second)
+    parser.add_argument('--completion-tokens', type=int, default=defaults.completion_tokens)
+    parser.add_argument('--failure-rate', type=float, default=defaults.failure_rate)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    args = parser.parse_args()
+
+    config = StandinConfig(
+        latency=args.latency, jitter=args.jitter, tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens, failure_rate=args.failure_rate, seed=args.seed,
+    )
+    server = make_server(config, args.host, args.port)
+    print(f'Simulador de LLM em http://{args.host}:{args.port}/v1 ({config})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
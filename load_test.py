@@ -0,0 +1,314 @@
+# Teste de carga do dashboard: muitas sessões simultâneas do app.py em um só processo.
+#
+# Uso:
+#     python load_test.py [--sessoes 30] [--duracao 120] [--roteiro misto]
+#                         [--pensar 3] [--latencia-llm 0.8] [--json resultado.json]
+#
+# Cada sessão é um AppTest do Streamlit (sem navegador) rodando em uma thread,
+# como as sessões de um servidor `streamlit run`: todas dividem o processo, o
+# GIL e os caches st.cache_data/st.cache_resource. A sessão repete um roteiro
+# (ROTEIROS) de ações, com uma pausa aleatória entre elas (média --pensar s), e
+# cada ação é um rerun do script, que é o que o usuário espera na tela:
+#   - filtros da barra lateral (comunidades, faixa etária, gênero, onda);
+#   - widgets das abas (associações, produtores parecidos, temas);
+#   - perguntas ao chatbot, respondidas pelo simulador de llm_standin.py
+#     (iniciado aqui, em uma porta livre; nada sai para a rede).
+# Trocar de aba e baixar o CSV não rodam o script no Streamlit (as abas são
+# todas executadas em cada rerun e o CSV é gerado junto), então o custo dos
+# dois já está em cada rerun medido.
+# Antes da medição, uma sessão de aquecimento roda o roteiro inteiro uma vez,
+# depois que o aquecimento em segundo plano do app termina (o tempo do
+# primeiro rerun, com os caches frios, sai no relatório).
+# Relatório: latência dos reruns (p50/p95/p99) por ação e no total, erros,
+# reruns por segundo e memória (RSS do processo antes e depois das sessões,
+# dividido pelo número de sessões abertas).
+
+import argparse
+import json
+import os
+import random
+import resource
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import llm_standin
+import warm_cache
+from similarity import OUTCOMES
+
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+RUN_TIMEOUT = 300
+
+PERGUNTAS = [
+    'Qual a média de preço da farinha?',
+    'Quais variedades de mandioca são mais plantadas?',
+    'Quantos produtores recebem assistência técnica?',
+    'Quais as principais dificuldades na comercialização?',
+    'Qual a renda familiar dos produtores de Castanhal?',
+]
+
+
+def _rss_mb():
+    """RSS atual do processo (Linux: /proc); fora do Linux, o pico."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        # ru_maxrss está em KB no Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _widget(elements, label, nth=0):
+    """O n-ésimo widget com esse rótulo, ou None se o app não o mostrar."""
+    found = [element for element in elements if element.label == label]
+    return found[nth] if len(found) > nth else None
+
+
+def _select_other(at, rng, label, nth=0):
+    """Escolhe outra opção, ao acaso, no selectbox; False se o app não o mostrar ou só houver uma.
+
+    Só para selectbox sem format_func (o AppTest grava o rótulo como valor).
+    """
+    box = _widget(at.selectbox, label, nth)
+    if box is None or len(box.options) < 2:
+        return False
+    current = box.index
+    box.select_index(rng.choice([i for i in range(len(box.options)) if i != current]))
+    return True
+
+
+def filtrar_comunidades(at, rng):
+    box = _widget(at.sidebar.multiselect, 'Selecione as comunidades:')
+    if box is None or not box.options:
+        return False
+    box.set_value(rng.sample(list(box.options), rng.randint(1, len(box.options))))
+    return True
+
+
+def faixa_etaria(at, rng):
+    slider = _widget(at.sidebar.slider, 'Faixa etária:')
+    if slider is None:
+        return False
+    low, high = slider.min, slider.max
+    start = rng.randint(low, max(low, (low + high) // 2))
+    slider.set_range(start, rng.randint(start, high))
+    return True
+
+
+def filtrar_genero(at, rng):
+    box = _widget(at.sidebar.multiselect, 'Gênero:')
+    if box is None or not box.options:
+        return False
+    box.set_value(rng.sample(list(box.options), rng.randint(1, len(box.options))))
+    return True
+
+
+def limpar_filtros(at, rng):
+    changed = False
+    for label in ('Selecione as comunidades:', 'Gênero:', 'Tipo de Cultivo:'):
+        box = _widget(at.sidebar.multiselect, label)
+        if box is not None:
+            box.set_value(list(box.options))
+            changed = True
+    slider = _widget(at.sidebar.slider, 'Faixa etária:')
+    if slider is not None:
+        slider.set_range(slider.min, slider.max)
+        changed = True
+    return changed
+
+
+def trocar_onda(at, rng):
+    return _select_other(at, rng, 'Onda da pesquisa:')
+
+
+def associacoes(at, rng):
+    return _select_other(at, rng, 'Pergunta:', nth=0)
+
+
+def produtor_parecido(at, rng):
+    box = _widget(at.selectbox, 'Com resultado melhor em:')
+    if box is None:
+        return False
+    box.set_value(rng.choice([outcome for outcome in [None, *OUTCOMES] if outcome != box.value]))
+    return True
+
+
+def temas(at, rng):
+    return _select_other(at, rng, 'Pergunta:', nth=1)
+
+
+def perguntar(at, rng):
+    box = _widget(at.text_area, 'Digite sua pergunta:')
+    send = _widget(at.button, 'Enviar')
+    if box is None or send is None:
+        return False
+    box.set_value(rng.choice(PERGUNTAS))
+    send.click()
+    return True
+
+
+# Roteiro -> ações, na ordem em que uma sessão as repete
+ROTEIROS = {
+    'explorar': [filtrar_comunidades, faixa_etaria, associacoes, produtor_parecido, filtrar_genero,
+                 temas, trocar_onda, limpar_filtros],
+    'chat': [perguntar, perguntar, filtrar_comunidades, perguntar, limpar_filtros],
+    'misto': [filtrar_comunidades, perguntar, associacoes, faixa_etaria, produtor_parecido, perguntar,
+              temas, limpar_filtros],
+}
+
+
+class Session(threading.Thread):
+    """Uma sessão do app que repete um roteiro até `deadline` e guarda a latência de cada rerun."""
+
+    def __init__(self, number, actions, deadline, think, seed, results, opened):
+        super().__init__(name=f'sessao-{number}', daemon=True)
+        self.number = number
+        self.actions = actions
+        self.deadline = deadline
+        self.think = think
+        self.rng = random.Random(seed)
+        self.results = results
+        self.opened = opened
+        self.app = None
+
+    def _run(self, action):
+        start = time.perf_counter()
+        error = None
+        try:
+            self.app.run(timeout=RUN_TIMEOUT)
+            if self.app.exception:
+                error = self.app.exception[0].value
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        self.results.append({'sessao': self.number, 'acao': action, 'inicio': start,
+                             'latencia_s': time.perf_counter() - start, 'erro': error})
+
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+
+        self.app = AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT)
+        self._run('abrir')
+        self.opened.release()
+        step = 0
+        while time.monotonic() < self.deadline:
+            time.sleep(self.rng.expovariate(1 / self.think) if self.think > 0 else 0)
+            action = self.actions[step % len(self.actions)]
+            step += 1
+            if action(self.app, self.rng):
+                self._run(action.__name__)
+
+
+def _percentiles(latencies):
+    values = np.asarray(latencies) * 1000
+    return {'reruns': len(values), 'p50_ms': float(np.percentile(values, 50)),
+            'p95_ms': float(np.percentile(values, 95)), 'p99_ms': float(np.percentile(values, 99))}
+
+
+def run_load_test(sessions=30, duration=120, roteiro='misto', think=3.0, ramp=10.0, seed=0):
+    """Aquece o app, roda `sessions` sessões por `duration` segundos e devolve o relatório (dict)."""
+    from streamlit.testing.v1 import AppTest
+
+    from streamlit import config
+
+    # Cada AppTest.run liga global.appTest só durante o próprio rerun, trocando
+    # config.get_option do processo: com sessões em paralelo, o fim de um rerun
+    # desligaria a opção no meio de outro. Ligada de vez, a troca não muda nada.
+    config.set_option('global.appTest', True)
+    actions = ROTEIROS[roteiro]
+    rss_start = _rss_mb()
+    warmup = AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT)
+    start = time.perf_counter()
+    warmup.run()
+    cold = time.perf_counter() - start
+    # O app aquece os caches das outras abas e visões em segundo plano (warm_cache.py)
+    warm_cache.wait_all(RUN_TIMEOUT)
+    rng = random.Random(seed)
+    for action in actions:
+        if action(warmup, rng):
+            warmup.run()
+    if warmup.exception:
+        raise RuntimeError(f'O app falhou no aquecimento: {warmup.exception[0].value}')
+    del warmup
+    rss_warm = _rss_mb()
+
+    results, opened = [], threading.Semaphore(0)
+    deadline = time.monotonic() + ramp + duration
+    threads = []
+    for number in range(sessions):
+        thread = Session(number, actions, deadline, think, seed + number + 1, results, opened)
+        thread.start()
+        threads.append(thread)
+        # Chegada gradual, como numa oficina
+        time.sleep(ramp / max(sessions, 1))
+    for _ in threads:
+        opened.acquire()
+    rss_open = _rss_mb()
+    for thread in threads:
+        thread.join()
+    rss_end = _rss_mb()
+
+    reruns = pd.DataFrame(results)
+    measured = reruns[reruns['acao'] != 'abrir']
+    window = (reruns['inicio'] + reruns['latencia_s']).max() - reruns['inicio'].min() if len(reruns) else 0
+    by_action = {action: _percentiles(group['latencia_s']) for action, group in reruns.groupby('acao')}
+    return {
+        'sessoes': sessions, 'roteiro': roteiro, 'duracao_s': duration, 'pensar_s': think,
+        'primeiro_rerun_frio_s': round(cold, 2),
+        'total': _percentiles(measured['latencia_s']) if len(measured) else {},
+        'por_acao': by_action,
+        'erros': int(reruns['erro'].notna().sum()),
+        'exemplos_de_erro': reruns['erro'].dropna().astype(str).unique()[:3].tolist(),
+        'reruns_por_s': round(len(reruns) / window, 2) if window else 0.0,
+        'rss_inicio_mb': round(rss_start, 1), 'rss_aquecido_mb': round(rss_warm, 1),
+        'rss_fim_mb': round(rss_end, 1),
+        'mb_por_sessao': round((max(rss_open, rss_end) - rss_warm) / max(sessions, 1), 2),
+    }
+
+
+def print_report(report):
+    print(f"{report['sessoes']} sessões, roteiro '{report['roteiro']}', {report['duracao_s']} s, "
+          f"pausa média {report['pensar_s']} s")
+    print(f"Primeiro rerun (caches frios): {report['primeiro_rerun_frio_s']:.2f} s\n")
+    header = f"{'ação':<22}{'reruns':>8}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}"
+    print(header)
+    print('-' * len(header))
+    for action, stats in [*report['por_acao'].items(), ('TOTAL (sem abrir)', report['total'])]:
+        if stats:
+            print(f"{action:<22}{stats['reruns']:>8}{stats['p50_ms']:>10.0f}{stats['p95_ms']:>10.0f}"
+                  f"{stats['p99_ms']:>10.0f}")
+    print(f"\nErros: {report['erros']} {report['exemplos_de_erro'] or ''}")
+    print(f"Vazão: {report['reruns_por_s']:.2f} reruns/s")
+    print(f"Memória: {report['rss_aquecido_mb']:.0f} MB aquecido -> {report['rss_fim_mb']:.0f} MB no fim "
+          f"({report['mb_por_sessao']:.1f} MB por sessão)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga do dashboard com sessões simultâneas.')
+    parser.add_argument('--sessoes', type=int, default=30)
+    parser.add_argument('--duracao', type=float, default=120, help='segundos de medição, depois da chegada')
+    parser.add_argument('--chegada', type=float, default=10, help='segundos para abrir todas as sessões')
+    parser.add_argument('--roteiro', choices=list(ROTEIROS), default='misto')
+    parser.add_argument('--pensar', type=float, default=3.0, help='pausa média entre ações (s)')
+    parser.add_argument('--latencia-llm', type=float, default=0.8, help='latência do LLM simulado (s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='grava o relatório neste arquivo')
+    args = parser.parse_args()
+
+    # O app lê o backend na importação de llm_backends, que acontece no primeiro rerun
+    _, base_url = llm_standin.start_in_thread(llm_standin.StandinConfig(latency=args.latencia_llm,
+                                                                        failure_rate=0.0, seed=args.seed))
+    os.environ['MANIVA_LLM_BACKEND'] = 'local'
+    os.environ['MANIVA_LLM_BASE_URL'] = base_url
+
+    report = run_load_test(args.sessoes, args.duracao, args.roteiro, args.pensar, args.chegada, args.seed)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as out:
+            json.dump(report, out, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+# Orçamento de tokens do prompt do Maniv.IA e registro de cada pergunta.
+#
+# Uso:
+#     python prompt_budget.py [--log .cache/llm_requests.jsonl]
+#
+# BudgetedQA substitui o RetrievalQA "stuff" (mesma chamada: qa({"query": ...})):
+#   1. recupera as seções (retrieval.HybridRetriever, em ordem de relevância);
+#   2. encaixa as seções no orçamento (MANIVA_PROMPT_BUDGET tokens para o prompt
+#      inteiro, com instruções e pergunta), da mais para a menos relevante: a que
+#      não cabe inteira é comprimida (sai a linha "Amostra", repetida nas
+#      contagens, e depois as respostas menos frequentes, do fim para o começo,
+#      ou os últimos itens da amostra); se só sobrar o cabeçalho (coluna,
+#      valores únicos), a seção fica de fora;
+#   3. chama o LLM (a resposta é limitada por MANIVA_LLM_MAX_TOKENS, em
+#      llm_backends) e grava uma linha JSON por pergunta em MANIVA_LLM_LOG:
+#      tokens do prompt (estimados aqui e informados pela API), tokens da
+#      resposta, tokens servidos do cache de prompt da API, seções usadas e
+#      comprimidas, tempo de recuperação e tempo do LLM.
+# A contagem é local e não depende do tokenizador do modelo (o do tiktoken
+# precisa baixar o vocabulário): cada palavra vale um token a cada 4 letras e
+# cada sinal, um token. Superestima um pouco, que é o lado seguro para um
+# teto; o log traz as duas contagens para calibrar o orçamento.
+# Rodar o módulo resume o log (medianas, p95 e totais).
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+
+
+PROMPT_BUDGET = int(os.environ.get('MANIVA_PROMPT_BUDGET', 3000))
+REQUEST_LOG = os.environ.get('MANIVA_LLM_LOG', os.path.join('.cache', 'llm_requests.jsonl'))
+# Seções menores que isso (depois de comprimidas) não valem o espaço
+MIN_SECTION_TOKENS = 20
+CHARS_PER_TOKEN = 4
+
+# Linhas de cabeçalho das seções (context_builder e retrieval); o resto é dado
+HEADER_PREFIXES = ('Comunidade:', 'Coluna:', '  Valores únicos:', 'Total de')
+SAMPLE_PREFIX = '  Amostra: '
+
+_RE_TOKEN = re.compile(r'\w+|[^\w\s]')
+_log_lock = threading.Lock()
+
+
+def count_tokens(text):
+    """Estimativa local de tokens: ceil(letras / 4) por palavra e 1 por sinal."""
+    return sum(-(-len(token) // CHARS_PER_TOKEN) for token in _RE_TOKEN.findall(text))
+
+
+def _sample(line):
+    """Itens da linha "  Amostra: [...]" (None se a linha não for a amostra)."""
+    if not line.startswith(SAMPLE_PREFIX):
+        return None
+    try:
+        items = ast.literal_eval(line[len(SAMPLE_PREFIX):])
+    except (ValueError, SyntaxError):
+        return None
+    return items if isinstance(items, list) else None
+
+
+def compress_section(text, max_tokens):
+    """A seção cortada para caber em max_tokens, ou None se não sobrar nenhuma linha de dados.
+
+    Comunidade, coluna, valores únicos e totais são cabeçalho; dados são as
+    contagens, a amostra e as estatísticas. As contagens vêm da mais para a
+    menos frequente (context_builder), então o corte tira as respostas mais
+    raras primeiro; sem contagens, corta os últimos itens da amostra.
+    """
+    lines = text.split('\n')
+    if any(line.startswith("  '") for line in lines):
+        # A amostra repete os valores das contagens
+        lines = [line for line in lines if not line.startswith(SAMPLE_PREFIX)]
+    header = [line for line in lines if line.startswith(HEADER_PREFIXES)]
+    data = [line for line in lines if not line.startswith(HEADER_PREFIXES)]
+    total = sum(count_tokens(line) + 1 for line in lines)
+    while total > max_tokens and data:
+        items = _sample(data[-1])
+        total -= count_tokens(data[-1]) + 1
+        if items is not None and len(items) > 1:
+            data[-1] = f'{SAMPLE_PREFIX}{items[:-1]}'
+            total += count_tokens(data[-1]) + 1
+        else:
+            data.pop()
+    if total > max_tokens or not data:
+        return None
+    return '\n'.join(header + data)
+
+
+def fit_context(documents, max_tokens):
+    """Seções que cabem em max_tokens, na ordem de relevância recebida.
+
+    Devolve (textos, estatísticas) com o número de seções recebidas, usadas e
+    comprimidas e os tokens do contexto.
+    """
+    texts, compressed, remaining = [], 0, max_tokens
+    for doc in documents:
+        # Separador "\n\n" entre seções
+        cost = count_tokens(doc.page_content) + 2
+        if cost <= remaining:
+            texts.append(doc.page_content)
+            remaining -= cost
+            continue
+        if remaining - 2 < MIN_SECTION_TOKENS:
+            continue
+        text = compress_section(doc.page_content, remaining - 2)
+        if text is None:
+            continue
+        texts.append(text)
+        compressed += 1
+        remaining -= count_tokens(text) + 2
+    return texts, {'secoes_recuperadas': len(documents), 'secoes_usadas': len(texts),
+                   'secoes_comprimidas': compressed, 'tokens_contexto': max_tokens - remaining}
+
+
+def _usage(message):
+    """(prompt, resposta, cache) informados pela API na resposta do LLM (None se ausentes)."""
+    usage = getattr(message, 'usage_metadata', None) or {}
+    raw = (getattr(message, 'response_metadata', None) or {}).get('token_usage') or {}
+    # DeepSeek informa prompt_cache_hit_tokens; a API da OpenAI, cached_tokens
+    cached = raw.get('prompt_cache_hit_tokens', (usage.get('input_token_details') or {}).get('cache_read'))
+    return usage.get('input_tokens'), usage.get('output_tokens'), cached
+
+
+def append_log(record, path=REQUEST_LOG):
+    """Acrescenta um registro (uma linha JSON) ao log de perguntas."""
+    if not path:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    line = json.dumps(record, ensure_ascii=False)
+    with _log_lock, open(path, 'a', encoding='utf-8') as log:
+        log.write(line + '\n')
+
+
+class BudgetedQA:
+    """Recuperação + orçamento de tokens + LLM, com uma linha de log por pergunta."""
+
+    def __init__(self, retriever, llm, prompt, budget=PROMPT_BUDGET, log_path=REQUEST_LOG):
+        self.retriever = retriever
+        self.llm = llm
+        self.prompt = prompt
+        self.budget = budget
+        self.log_path = log_path
+
+    def __call__(self, inputs):
+        query = inputs['query']
+        record = {'ts': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'pergunta_hash': hashlib.sha256(query.encode('utf-8')).hexdigest()[:12],
+                  'orcamento': self.budget}
+        try:
+            start = time.perf_counter()
+            documents = self.retriever.invoke(query)
+            record['recuperacao_s'] = round(time.perf_counter() - start, 4)
+
+            fixed = count_tokens(self.prompt.format(context='', question=query))
+            texts, stats = fit_context(documents, max(self.budget - fixed, 0))
+            record.update(stats)
+            text = self.prompt.format(context='\n\n'.join(texts), question=query)
+            record['tokens_prompt_estimados'] = fixed + stats['tokens_contexto']
+
+            start = time.perf_counter()
+            message = self.llm.invoke(text)
+            record['llm_s'] = round(time.perf_counter() - start, 4)
+            prompt_tokens, completion_tokens, cached = _usage(message)
+            answer = message.content
+            record.update(tokens_prompt=prompt_tokens, tokens_resposta=completion_tokens,
+                          tokens_cache=cached)
+            if completion_tokens is None:
+                record['tokens_resposta'] = count_tokens(answer)
+        except Exception as e:
+            record['erro'] = type(e).__name__
+            raise
+        finally:
+            append_log(record, self.log_path)
+        return {'query': query, 'result': answer, 'usage': record}
+
+
+def summarize_log(path=REQUEST_LOG):
+    """Mediana, p95 e total de cada medida do log (DataFrame vazio se não houver log)."""
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    records = pd.read_json(path, lines=True)
+    columns = [col for col in ('tokens_prompt_estimados', 'tokens_prompt', 'tokens_resposta', 'tokens_cache',
+                               'secoes_usadas', 'secoes_comprimidas', 'recuperacao_s', 'llm_s')
+               if col in records.columns]
+    values = records[columns].apply(pd.to_numeric, errors='coerce')
+    return pd.DataFrame({'mediana': values.median(), 'p95': values.quantile(0.95),
+                         'total': values.sum()}).round(3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resume o log de perguntas ao LLM (tokens e tempos).')
+    parser.add_argument('--log', default=REQUEST_LOG)
+    args = parser.parse_args()
+
+    summary = summarize_log(args.log)
+    if summary.empty:
+        print(f'Sem registros em {args.log}.')
+        return
+    records = pd.read_json(args.log, lines=True)
+    errors = int(records['erro'].notna().sum()) if 'erro' in records.columns else 0
+    print(f'{len(records)} perguntas ({errors} com erro)')
+    print(summary.to_string())
+
+
+if __name__ == '__main__':
+    main()
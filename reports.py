@@ -0,0 +1,190 @@
+# Relatórios estáticos por comunidade (HTML autocontido + CSV anexo).
+#
+# Uso:
+#     python reports.py [--municipio Juruti] [--onda 2025] [--saida relatorios] [--processos N]
+#                       [--comunidades "Castanhal" ...]
+#
+# Para cada Comunidade do município, na onda pedida (por padrão a mais
+# recente), são gerados <saida>/<município>/<comunidade>.html, com os cartões
+# de métricas, os gráficos das abas (os mesmos do dashboard, de tab_figures.py:
+# variedades, produtos, dificuldades, pragas) e o preço da farinha comparado
+# ao município, e <saida>/<município>/<comunidade>.csv com as respostas da
+# comunidade (as mesmas colunas do download da aba de dados). --comunidades
+# desconhecidas são recusadas com a lista das válidas.
+#
+# As comunidades são renderizadas em paralelo em um pool de processos. Os
+# agregados do município inteiro são calculados uma vez no processo principal
+# e entregues a cada worker no inicializador; o questionário é mapeado pelos
+# workers a partir do shared_store (só as partições do município), sem ser
+# serializado para cada tarefa.
+
+import argparse
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import pandas as pd
+import plotly.express as px
+from plotly.offline import get_plotlyjs
+
+import ingest
+import shared_store
+from canonicalization import slugify
+from data_api import AGGREGATES, filter_frame, parse_filters
+from data_pipeline import DEFAULT_MUNICIPIO, export_frame
+from tab_figures import TAB_FIGURES, tab_figure
+
+
+OUTPUT_DIR = 'relatorios'
+
+_COLORS = ['#8B4513', '#b9d306', '#a0522d', '#5D4037', '#D2B48C']
+
+# Estado de cada worker, preenchido por _init_worker
+_worker = {}
+
+
+def compute_aggregates(df):
+    """Todos os agregados da API para um recorte do questionário."""
+    return {name: aggregate(df) for name, aggregate in AGGREGATES.items()}
+
+
+def _bar(frame, x, y, title, **kwargs):
+    fig = px.bar(frame, x=x, y=y, title=title, color_discrete_sequence=_COLORS, **kwargs)
+    fig.update_layout(margin=dict(l=20, r=20, t=60, b=20), legend_title_text='')
+    return fig
+
+
+def build_figures(community_df, aggregates, municipio):
+    """Gráficos do relatório: os das abas (tab_figures) e o preço da comunidade contra o do município."""
+    figures = [fig for fig in (tab_figure(community_df, name) for name in TAB_FIGURES) if fig is not None]
+
+    precos = aggregates['precos']
+    comunidade = precos[precos['Comunidade'] != 'TODAS']
+    total = municipio['precos'][municipio['precos']['Comunidade'] == 'TODAS']
+    if not comunidade.empty and comunidade['preco_farinha_kg_count'].sum() > 0:
+        comparacao = pd.concat([comunidade.assign(Comunidade='Comunidade'), total.assign(Comunidade='Município')])
+        figures.append(_bar(comparacao, 'Comunidade', 'preco_farinha_kg_mean',
+                            'Preço médio da farinha (R$/kg)', labels={'preco_farinha_kg_mean': 'R$/kg'}))
+    return figures
+
+
+def _metric_cards(resumo, municipio):
+    labels = {
+        'produtores': ('Produtores', '{:.0f}'),
+        'pessoas_cultivo': ('Pessoas no cultivo', '{:.0f}'),
+        'area_plantada_media_ha': ('Área plantada média (ha)', '{:.1f}'),
+        'renda_familiar_media': ('Renda familiar média (R$)', '{:,.0f}'),
+        'associados': ('Associados', '{:.0f}'),
+        'preco_farinha_medio': ('Preço médio farinha (R$/kg)', '{:.2f}'),
+    }
+    cards = []
+    for key, (label, fmt) in labels.items():
+        value, reference = resumo.iloc[0][key], municipio.iloc[0][key]
+        shown = '—' if value != value else fmt.format(value)
+        ref = '—' if reference != reference else fmt.format(reference)
+        cards.append(f'<div class="card"><span>{html.escape(label)}</span>'
+                     f'<strong>{shown}</strong><small>Município: {ref}</small></div>')
+    return '\n'.join(cards)
+
+
+def render_report(comunidade, community_df, aggregates, municipio, plotlyjs, nome_municipio=DEFAULT_MUNICIPIO):
+    """HTML autocontido (plotly.js embutido uma vez) do relatório de uma comunidade."""
+    figures = ''.join(fig.to_html(full_html=False, include_plotlyjs=False)
+                      for fig in build_figures(community_df, aggregates, municipio))
+    title = html.escape(comunidade)
+    return f"""<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+<meta charset="utf-8">
+<title>Relatório - {title}</title>
+<script type="text/javascript">{plotlyjs}</script>
+<style>
+  body {{ font-family: sans-serif; margin: 2rem; color: #3e2723; }}
+  h1 {{ color: #8B4513; }}
+  .cards {{ display: flex; flex-wrap: wrap; gap: 1rem; margin-bottom: 2rem; }}
+  .card {{ border: 1px solid #D2B48C; border-radius: 10px; padding: 1rem; min-width: 180px; }}
+  .card span, .card small {{ display: block; color: #5D4037; }}
+  .card strong {{ display: block; font-size: 1.6rem; margin: 0.3rem 0; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<p>Projeto Maniva Tapajós - {html.escape(nome_municipio)}/PA. {len(community_df)} produtores entrevistados.
+Dados completos no arquivo CSV anexo.</p>
+<div class="cards">
+{_metric_cards(aggregates['resumo'], municipio['resumo'])}
+</div>
+{figures}
+</body>
+</html>
+"""
+
+
+def _init_worker(nome_municipio, onda, municipio, output_dir):
+    _worker['df'] = shared_store.shared_survey(municipios=[nome_municipio], ondas=[onda])
+    _worker['nome_municipio'] = nome_municipio
+    _worker['municipio'] = municipio
+    _worker['output_dir'] = output_dir
+    _worker['plotlyjs'] = get_plotlyjs()
+
+
+def build_community_report(comunidade):
+    """Gera o HTML e o CSV de uma comunidade; devolve os caminhos gravados."""
+    community_df = filter_frame(_worker['df'], dict(parse_filters(''), comunidade=[comunidade]))
+    aggregates = compute_aggregates(community_df)
+    base = os.path.join(_worker['output_dir'], slugify(comunidade) or 'comunidade')
+    with open(f'{base}.html', 'w', encoding='utf-8') as f:
+        f.write(render_report(comunidade, community_df, aggregates, _worker['municipio'], _worker['plotlyjs'],
+                              _worker['nome_municipio']))
+    export_frame(community_df).to_csv(f'{base}.csv', index=False, encoding='utf-8')
+    return f'{base}.html', f'{base}.csv'
+
+
+def build_reports(comunidades=None, output_dir=OUTPUT_DIR, processes=None, nome_municipio=DEFAULT_MUNICIPIO,
+                  onda=None):
+    """Relatórios de todas (ou das comunidades pedidas) do município em uma onda, em paralelo.
+
+    ValueError se alguma comunidade pedida não existe no município e na onda.
+    """
+    onda = onda or ingest.municipality_waves(nome_municipio)[-1]
+    df = shared_store.shared_survey(municipios=[nome_municipio], ondas=[onda])
+    existentes = sorted(df['Comunidade'].dropna().astype(str).unique())
+    desconhecidas = [comunidade for comunidade in comunidades or [] if comunidade not in existentes]
+    if desconhecidas:
+        raise ValueError(f"comunidades desconhecidas em {nome_municipio}/{onda}: {', '.join(desconhecidas)} "
+                         f"(válidas: {', '.join(existentes)})")
+    comunidades = comunidades or existentes
+    if not comunidades:
+        return {}
+    municipio = compute_aggregates(filter_frame(df, parse_filters('')))
+    output_dir = os.path.join(output_dir, slugify(nome_municipio))
+    os.makedirs(output_dir, exist_ok=True)
+    processes = min(processes or os.cpu_count() or 1, len(comunidades))
+    with ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn'),
+                             initializer=_init_worker, initargs=(nome_municipio, onda, municipio, output_dir)) as pool:
+        return dict(zip(comunidades, pool.map(build_community_report, comunidades)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera um relatório HTML + CSV por comunidade.')
+    parser.add_argument('--municipio', default=DEFAULT_MUNICIPIO)
+    parser.add_argument('--onda', default=None)
+    parser.add_argument('--saida', default=OUTPUT_DIR)
+    parser.add_argument('--processos', type=int, default=None)
+    parser.add_argument('--comunidades', nargs='+', default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        reports = build_reports(args.comunidades, args.saida, args.processos, args.municipio, args.onda)
+    except ValueError as e:
+        parser.error(str(e))
+    for comunidade, (html_path, _) in reports.items():
+        print(f'{comunidade}: {html_path}')
+    print(f'{len(reports)} relatórios em {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
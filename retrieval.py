@@ -0,0 +1,222 @@
+# Recuperação híbrida (lexical + vetorial) do contexto do Maniv.IA.
+#
+# Uso:
+#     python retrieval.py "Quem planta Coraci em Castanhal?" [--municipio Juruti] [--k 4]
+#
+# O contexto vai para o índice em seções (context_builder): uma por coluna para
+# todos os produtores e as mesmas seções para cada comunidade (metadado
+# 'comunidade'). HybridRetriever escolhe poucas seções por pergunta:
+#   1. pré-filtro: se a pergunta cita uma comunidade (sem acento e sem o
+#      prefixo "Comunidade"), só as seções dela; senão, só as gerais;
+#   2. BM25 (BM25Index: índice invertido em arrays, tokens de
+#      column_index.tokenize, sem acento e com stemming; o nome da coluna conta
+#      em dobro), que acerta termos exatos como "Coraci", "Pororoca" ou
+#      "Renda_Familiar_R$", onde o MiniLM (treinado em inglês) erra;
+#   3. cosseno com os vetores do índice FAISS (shared_store) das seções
+#      permitidas, calculado direto nos vetores (são poucas seções);
+#   4. fusão por posto recíproco (RRF) e as k melhores seções.
+# Sem modelo de embeddings, fica só o BM25.
+
+import argparse
+import re
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+import shared_store
+from canonicalization import fold_accents
+from column_index import tokenize
+from context_builder import CONTEXT_VERSION, context_fingerprint, generate_context_sections
+from linkage import normalize_communities
+
+
+RETRIEVER_K = 4
+# Seções de cada ranking que entram na fusão
+FUSION_CANDIDATES = 20
+RRF_K = 60
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Peso dos tokens do nome da coluna (id da seção) no BM25
+ID_WEIGHT = 2
+
+# Verbos e pronomes interrogativos que column_index.STOPWORDS mantém (lá
+# não atrapalham, mas aqui premiam qualquer pergunta do questionário com "são")
+EXTRA_STOPWORDS = {'sao', 'esta', 'estao', 'ser', 'foi', 'ter', 'tem', 'quem', 'onde', 'quando', 'usa', 'usam'}
+
+_RE_PUNCTUATION = re.compile(r'[^\w]+')
+
+
+def _tokens(text):
+    return [t for t in tokenize(text) if t not in EXTRA_STOPWORDS]
+
+
+def retrieval_sections(df, counts=None, community_counts=None):
+    """Seções do contexto para o índice: as gerais e as de cada comunidade.
+
+    Cada seção ganha 'comunidade' (None nas gerais). community_counts
+    ({comunidade: tabela de contagens}) evita recontar as respostas de texto.
+    """
+    sections = [dict(section, comunidade=None) for section in generate_context_sections(df, counts=counts)]
+    if 'Comunidade' not in df.columns:
+        return sections
+    community_counts = community_counts or {}
+    for comunidade, rows in df.groupby(df['Comunidade'].astype('string'), sort=True):
+        for section in generate_context_sections(rows, counts=community_counts.get(comunidade)):
+            # A lista de colunas já está no resumo geral
+            body = (f'Total de produtores entrevistados: {len(rows)}' if section['id'] == 'resumo'
+                    else section['text'])
+            text = f'Comunidade: {comunidade}\n{body}'
+            sections.append(dict(section, id=f'{comunidade} | {section["id"]}', text=text, comunidade=comunidade))
+    return sections
+
+
+class BM25Index:
+    """BM25 sobre textos curtos, com as listas de postings em arrays (uma bincount por consulta)."""
+
+    def __init__(self, texts, ids=None, k1=BM25_K1, b=BM25_B):
+        tokens = [_tokens(text) + _tokens(doc_id) * ID_WEIGHT
+                  for text, doc_id in zip(texts, ids if ids is not None else [''] * len(texts))]
+        self.n = len(tokens)
+        lengths = np.array([len(doc) for doc in tokens], dtype=float)
+        pairs = pd.DataFrame({'termo': [t for doc in tokens for t in doc],
+                              'doc': np.repeat(np.arange(self.n), lengths.astype(int))})
+        postings = pairs.groupby(['termo', 'doc'], sort=True).size().rename('tf').reset_index()
+        terms, starts = np.unique(postings['termo'].to_numpy(str), return_index=True)
+        self._terms = {term: i for i, term in enumerate(terms)}
+        self._starts = np.append(starts, len(postings))
+        self._docs = postings['doc'].to_numpy()
+
+        doc_freq = np.diff(self._starts)
+        idf = np.log(1 + (self.n - doc_freq + 0.5) / (doc_freq + 0.5))
+        tf = postings['tf'].to_numpy(float)
+        norm = k1 * (1 - b + b * lengths[self._docs] / max(lengths.mean(), 1e-9)) if self.n else tf
+        self._weights = np.repeat(idf, doc_freq) * tf * (k1 + 1) / (tf + norm)
+
+    def scores(self, query, ignore=()):
+        """Score BM25 de todos os documentos para a consulta (sem os termos de `ignore`)."""
+        ids = sorted({self._terms[t] for t in _tokens(query) if t in self._terms and t not in ignore})
+        if not ids:
+            return np.zeros(self.n)
+        postings = np.concatenate([np.arange(self._starts[i], self._starts[i + 1]) for i in ids])
+        return np.bincount(self._docs[postings], weights=self._weights[postings], minlength=self.n)
+
+
+def _ranking(scores, allowed, n):
+    """Posições das n maiores notas entre as permitidas (com nota > 0)."""
+    candidates = np.flatnonzero(allowed & (scores > 0))
+    return candidates[np.argsort(-scores[candidates], kind='stable')][:n]
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever do LangChain: pré-filtro por comunidade, BM25 + cosseno e fusão RRF."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    documents: list
+    lexical: Any
+    vectors: Optional[Any] = None
+    embeddings: Optional[Any] = None
+    communities: dict = {}
+    k: int = RETRIEVER_K
+    candidates: int = FUSION_CANDIDATES
+    rrf_k: int = RRF_K
+
+    @classmethod
+    def from_sections(cls, sections, embeddings=None, vector_store=None, **kwargs):
+        """Retriever das seções (retrieval_sections); vector_store é o FAISS construído com os mesmos textos."""
+        documents = [Document(page_content=section['text'],
+                              metadata={'id': section['id'], 'comunidade': section.get('comunidade'),
+                                        'hash': section.get('hash')})
+                     for section in sections]
+        vectors = None
+        if vector_store is not None and embeddings is not None:
+            # Na ordem do índice, que é a ordem dos textos em FAISS.from_texts
+            vectors = vector_store.index.reconstruct_n(0, vector_store.index.ntotal)
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        names = pd.Series([doc.metadata['comunidade'] for doc in documents], dtype='string').dropna().unique()
+        communities = dict(zip(normalize_communities(pd.Series(names, dtype='string')), names))
+        return cls(documents=documents, lexical=BM25Index([d.page_content for d in documents],
+                                                          [d.metadata['id'] for d in documents]),
+                   vectors=vectors, embeddings=embeddings if vectors is not None else None,
+                   communities=communities, **kwargs)
+
+    def community_for(self, query):
+        """Comunidade citada na pergunta (a de nome mais longo, se houver mais de uma), ou None."""
+        folded = f' {_RE_PUNCTUATION.sub(" ", fold_accents(query))} '
+        cited = [name for name in self.communities if name and f' {name} ' in folded]
+        return self.communities[max(cited, key=len)] if cited else None
+
+    def search(self, query):
+        """[(documento, nota RRF)] das k melhores seções para a pergunta."""
+        community = self.community_for(query)
+        allowed = np.array([doc.metadata['comunidade'] == community if community else
+                            doc.metadata['comunidade'] is None for doc in self.documents])
+        # O nome da comunidade está em todas as seções dela: não ajuda a ordenar
+        ignore = set(tokenize(f'comunidade {community}')) if community else ()
+        rankings = [_ranking(self.lexical.scores(query, ignore), allowed, self.candidates)]
+        if self.vectors is not None:
+            query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+            dense = self.vectors @ (query_vector / max(np.linalg.norm(query_vector), 1e-12))
+            # Cosseno pode ser negativo: desloca para que toda seção permitida concorra
+            rankings.append(_ranking(dense + 2, allowed, self.candidates))
+        fused = {}
+        for ranking in rankings:
+            for rank, position in enumerate(ranking):
+                fused[position] = fused.get(position, 0.0) + 1 / (self.rrf_k + rank + 1)
+        best = sorted(fused, key=lambda position: (-fused[position], position))[:self.k]
+        return [(self.documents[position], fused[position]) for position in best]
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return [Document(page_content=doc.page_content, metadata=dict(doc.metadata, score=round(score, 5)))
+                for doc, score in self.search(query)]
+
+
+def shared_retriever(sections, embeddings=None, embedding_name='', **kwargs):
+    """HybridRetriever das seções com o índice FAISS publicado uma vez por nó (shared_store).
+
+    A chave do índice muda junto com o contexto ou o modelo; sem embeddings, só o BM25.
+    """
+    vector_store = None
+    if embeddings is not None:
+        index_key = shared_store.vectorstore_key(context_fingerprint(sections), embedding_name)
+        vector_store = shared_store.shared_vectorstore(
+            [section['text'] for section in sections], embeddings,
+            [{'id': section['id'], 'comunidade': section['comunidade'], 'hash': section['hash'],
+              'versao': CONTEXT_VERSION} for section in sections],
+            index_key)
+    return HybridRetriever.from_sections(sections, embeddings, vector_store, **kwargs)
+
+
+def main():
+    import ingest
+    from data_pipeline import DEFAULT_MUNICIPIO
+
+    parser = argparse.ArgumentParser(description='Mostra as seções do contexto recuperadas para uma pergunta.')
+    parser.add_argument('pergunta')
+    parser.add_argument('--municipio', default=DEFAULT_MUNICIPIO)
+    parser.add_argument('--k', type=int, default=RETRIEVER_K)
+    parser.add_argument('--sem-embeddings', action='store_true', help='só o BM25')
+    args = parser.parse_args()
+
+    df = ingest.load_store(municipios=[args.municipio])
+    sections = retrieval_sections(df)
+    embeddings = vector_store = None
+    if not args.sem_embeddings:
+        from langchain_community.vectorstores import FAISS
+
+        from embeddings import get_embeddings
+        embeddings = get_embeddings()
+        vector_store = FAISS.from_texts([s['text'] for s in sections], embeddings)
+    retriever = HybridRetriever.from_sections(sections, embeddings, vector_store, k=args.k)
+    total = sum(len(s['text'].split()) for s in sections if s['comunidade'] is None)
+    for doc, score in retriever.search(args.pergunta):
+        print(f"[{score:.4f}] {doc.metadata['id']} ({len(doc.page_content.split())} palavras)")
+    print(f'(contexto geral completo: {total} palavras)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+# Plano de dados somente leitura compartilhado entre processos do Streamlit.
+#
+# Com várias réplicas do app atrás de um proxy, cada processo carregava sua
+# própria cópia do questionário pré-processado e do índice FAISS. Aqui o
+# primeiro processo a precisar deles os publica em SHARED_DIR (por padrão em
+# /dev/shm, ou seja, memória compartilhada do nó) e todos os outros apenas os
+# mapeiam em memória:
+#   - survey-<chave>.arrow: o DataFrame pré-processado (de todos os municípios
+#     ou só dos pedidos) em Arrow IPC sem compressão, lido com pa.memory_map
+#     (as colunas numéricas sem nulos viram views do arquivo, sem cópia);
+#   - faiss-<chave>/: o índice FAISS (index.faiss, aberto com IO_FLAG_MMAP) e o
+#     docstore do LangChain (index.pkl).
+#
+# As chaves vêm do conteúdo (versão das partições lidas do armazenamento de
+# ingest.py; fingerprint do contexto + modelo de embedding), então dados novos
+# geram arquivos novos, ingerir outro município não invalida a visão de Juruti, e réplicas
+# recém-iniciadas encontram tudo pronto. A publicação é atômica (arquivo
+# temporário + os.replace) e protegida por um lock de arquivo, para que réplicas
+# subindo ao mesmo tempo não refaçam o trabalho.
+#
+# Cada abertura marca o artefato como usado (mtime). Quem publica um artefato
+# novo apaga, sob o mesmo lock, os do mesmo tipo sem uso há mais de
+# SHARED_MAX_AGE_DAYS dias (as chaves antigas de cada ingestão), para o /dev/shm
+# não encher; processos que ainda mapeiam um arquivo apagado seguem lendo.
+#
+# Configuração: MANIVA_SHARED_DIR muda o diretório compartilhado e
+# MANIVA_SHARED_MAX_AGE, a idade em dias (padrão 1).
+
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+import pyarrow as pa
+
+import ingest
+from context_builder import content_hash
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+
+# Mude quando o pré-processamento mudar de forma incompatível
+STORE_VERSION = 4
+
+SHARED_DIR = os.environ.get(
+    'MANIVA_SHARED_DIR',
+    '/dev/shm/maniva' if os.path.isdir('/dev/shm') else os.path.join('.cache', 'shared'),
+)
+SHARED_MAX_AGE_DAYS = float(os.environ.get('MANIVA_SHARED_MAX_AGE', 1))
+
+# Tipo de artefato -> prefixo dos nomes (o lock de construção tem o nome do tipo)
+ARTIFACTS = {'survey': 'survey-', 'faiss': 'faiss-'}
+
+
+@contextmanager
+def _build_lock(shared_dir, name):
+    """Lock exclusivo entre processos para a construção de um artefato."""
+    os.makedirs(shared_dir, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(shared_dir, f'{name}.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _mark_used(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def prune_shared(kind, max_age_days=None, shared_dir=None):
+    """Apaga os artefatos `kind` (ARTIFACTS) sem uso há mais de max_age_days dias; devolve quantos apagou.
+
+    Chame com o lock de construção de `kind`, para não apagar um que está sendo publicado.
+    """
+    shared_dir = shared_dir or SHARED_DIR
+    max_age_days = SHARED_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    limit = time.time() - max_age_days * 86400
+    removed = 0
+    for name in os.listdir(shared_dir):
+        path = os.path.join(shared_dir, name)
+        if not name.startswith(ARTIFACTS[kind]) or os.path.getmtime(path) >= limit:
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+        removed += 1
+    return removed
+
+
+def write_table(df, path):
+    """Grava o DataFrame em Arrow IPC (sem compressão, mapeável) de forma atômica."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def attach_table(path):
+    """Mapeia um arquivo Arrow IPC em memória e devolve o DataFrame."""
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def survey_key(store_dir=None, municipios=None, ondas=None):
+    """Chave do questionário: versão das partições dos municípios/ondas + versão do formato."""
+    manifest = ingest.ensure_store(store_dir)
+    names = ingest.select_partitions(manifest, municipios, ondas=ondas)
+    selection = f"{','.join(sorted(municipios or []))}|{','.join(sorted(ondas or []))}"
+    return content_hash(f'{STORE_VERSION}\n{selection}\n{ingest.store_version(manifest, names)}')
+
+
+def shared_survey(store_dir=None, shared_dir=None, municipios=None, ondas=None):
+    """Questionário pré-processado dos municípios/ondas pedidos (ou de todos), publicado uma vez por nó."""
+    shared_dir = shared_dir or SHARED_DIR
+    table_path = os.path.join(shared_dir, f'survey-{survey_key(store_dir, municipios, ondas)}.arrow')
+    if not os.path.exists(table_path):
+        with _build_lock(shared_dir, 'survey'):
+            # Outro processo pode ter publicado enquanto esperávamos o lock
+            if not os.path.exists(table_path):
+                write_table(ingest.load_store(store_dir, municipios, ondas=ondas), table_path)
+                prune_shared('survey', shared_dir=shared_dir)
+    _mark_used(table_path)
+    return attach_table(table_path)
+
+
+def vectorstore_key(context_hash, embedding_name):
+    """Chave do índice: contexto + modelo de embedding que gerou os vetores."""
+    return content_hash(f'{STORE_VERSION}\n{context_hash}\n{embedding_name}')
+
+
+def shared_vectorstore(texts, embeddings, metadatas, key, shared_dir=None):
+    """Índice FAISS do LangChain construído uma vez e aberto via mmap pelos demais processos."""
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+    shared_dir = shared_dir or SHARED_DIR
+    index_dir = os.path.join(shared_dir, f'faiss-{key}')
+    if not os.path.isdir(index_dir):
+        with _build_lock(shared_dir, 'faiss'):
+            if not os.path.isdir(index_dir):
+                tmp_dir = tempfile.mkdtemp(prefix='faiss-', dir=shared_dir)
+                try:
+                    FAISS.from_texts(texts, embeddings, metadatas=metadatas).save_local(tmp_dir)
+                    os.replace(tmp_dir, index_dir)
+                except BaseException:
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                    raise
+                prune_shared('faiss', shared_dir=shared_dir)
+    _mark_used(index_dir)
+
+    index = faiss.read_index(os.path.join(index_dir, 'index.faiss'),
+                             faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    # index.pkl é gravado por este módulo (FAISS.save_local), não vem de fora
+    with open(os.path.join(index_dir, 'index.pkl'), 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
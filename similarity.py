@@ -0,0 +1,234 @@
+# Produtores parecidos (para a troca de experiências entre agricultores).
+#
+# Uso:
+#     python similarity.py --produtor "nome:castanhal:joao da silva" [--k 10] [--resultado producao]
+#     python similarity.py --benchmark 100000
+#
+# Cada entrevista vira um vetor de respostas:
+#   - categóricas e SIM/NÃO: um bit por resposta (one-hot); cada bit diferente
+#     soma 1/2 à distância², então duas respostas diferentes ficam a distância
+#     1 e sem resposta fica a √0,5 de qualquer uma;
+#   - múltipla escolha: cada item frequente vira uma SIM/NÃO (os mesmos itens
+#     de associations.categorical_variables);
+#   - medidas: posição percentil de 0 a 1 (sem resposta = 0,5), para que os
+#     valores extremos de área e renda não dominem a distância.
+# As colunas de resultado (OUTCOMES), e as calculadas a partir delas, ficam
+# fora do vetor: procura-se quem faz parecido, e o resultado é o que se compara.
+# ProducerIndex guarda os bits empacotados em palavras de 64 bits (uma busca
+# é XOR + contagem de bits, ~40 bytes por produtor) e as medidas em float32
+# (produto matriz-vetor). A busca é exata, com os filtros (comunidades,
+# resultado melhor que o do produtor) aplicados antes do top-k; com 100 mil
+# produtores leva poucos milissegundos (ver --benchmark). O pickle do índice
+# (retratos do warm_cache) não leva o DataFrame: quem restaura chama attach.
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from associations import IGNORED_COLUMNS, categorical_variables, column_sources
+from canonicalization import fold_accents
+from dtype_optimizer import is_measure, yes_no_labels
+from ingest import interview_keys
+from linkage import NAME_COLUMN
+
+# Resultado -> (rótulo, coluna, ordem das respostas; None para medidas)
+OUTCOMES = {
+    'producao': ('Produção considerada', 'Considera sua produção?', ('RUIM', 'REGULAR', 'BOA', 'OTIMA')),
+    'renda_por_ha': ('Renda por hectare (R$)', 'Renda_Por_ha', None),
+    'rendimento_farinha': ('Rendimento da farinha por saca de raiz', 'Rendimento_Farinha_Por_Saca_Raiz', None),
+    'renda_familiar': ('Renda familiar (R$)', 'Renda_Familiar_R$', None),
+}
+
+DEFAULT_K = 10
+
+
+def _outcome_scores(df, column, order):
+    """Valor do resultado de cada produtor (posição em `order` para as respostas ordenadas)."""
+    if column not in df.columns:
+        return np.full(len(df), np.nan)
+    if order is None:
+        return pd.to_numeric(df[column], errors='coerce').astype(float).to_numpy()
+    ranks = {answer: float(i) for i, answer in enumerate(order)}
+    codes, uniques = pd.factorize(df[column].astype('string').str.strip())
+    scores = np.array([ranks.get(fold_accents(answer).upper(), np.nan) for answer in uniques] + [np.nan])
+    return scores[codes]
+
+
+class ProducerIndex:
+    """Vetores de respostas dos produtores de um DataFrame e busca dos mais parecidos."""
+
+    def __init__(self, df, outcomes=OUTCOMES):
+        self.frame = df
+        self.n = len(df)
+        keys = pd.Index(interview_keys(df))
+        self.keys = keys
+        # Numa mesma chave repetida (mais de uma onda), vale a primeira entrevista
+        self._positions = pd.Series(np.arange(self.n), index=keys)[~keys.duplicated()]
+
+        sources = column_sources()
+        excluded = set().union(*(sources.get(col, {col}) for _, col, _ in outcomes.values()))
+        variables, _ = categorical_variables(df)
+        categorical = {variable: (question, answers) for variable, (question, answers) in variables.items()
+                       if not sources.get(question, {question}) & excluded}
+        numeric = [col for col in df.columns if col not in IGNORED_COLUMNS and is_measure(df[col])
+                   and df[col].nunique() > 1 and not sources.get(col, {col}) & excluded]
+
+        # Um bit por resposta (os itens da múltipla escolha são SIM/NÃO) e uma coluna por medida
+        bits = np.zeros((self.n, sum(answers.nunique() for _, answers in categorical.values())), dtype=bool)
+        dimensions, offset = [], 0
+        for variable, (question, answers) in categorical.items():
+            codes, uniques = pd.factorize(answers, sort=True)
+            present = np.flatnonzero(codes >= 0)
+            bits[present, offset + codes[present]] = True
+            dimensions.extend((variable, question, str(value)) for value in uniques)
+            offset += len(uniques)
+        self.dimensions = pd.DataFrame(dimensions + [(col, col, '') for col in numeric],
+                                       columns=['variavel', 'pergunta', 'resposta'])
+        self.questions = list(dict.fromkeys(self.dimensions['pergunta']))
+        self.n_variables = len(categorical) + len(numeric)
+        # Palavras de 64 bits, uma linha por palavra (cada busca percorre uma palavra de todos os produtores)
+        padded = np.zeros((self.n, -(-bits.shape[1] // 64) * 64), dtype=bool)
+        padded[:, :bits.shape[1]] = bits
+        self._bits = np.ascontiguousarray(np.packbits(padded, axis=1, bitorder='little').view(np.uint64).T)
+
+        ranks = np.full((self.n, len(numeric)), 0.5, dtype=np.float32)
+        for j, col in enumerate(numeric):
+            values = pd.to_numeric(df[col], errors='coerce').astype(float)
+            scaled = (values.rank(method='average') - 1) / max(values.notna().sum() - 1, 1)
+            ranks[:, j] = scaled.fillna(0.5).to_numpy()
+        self._numeric = ranks
+        self._sqnorm = np.einsum('ij,ij->i', ranks, ranks)
+
+        self.outcomes = {name: _outcome_scores(df, col, order) for name, (_, col, order) in outcomes.items()}
+        self._outcome_labels = {name: label for name, (label, _, _) in outcomes.items()}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['frame'] = None
+        return state
+
+    def attach(self, df):
+        """Religa o DataFrame de origem (o mesmo da construção) depois de restaurar do pickle."""
+        if len(df) != self.n:
+            raise ValueError(f'O índice tem {self.n} produtores e o DataFrame, {len(df)}')
+        self.frame = df
+        return self
+
+    def position(self, key):
+        """Linha da entrevista com essa chave (ingest.interview_keys); KeyError se não existir."""
+        return int(self._positions[key])
+
+    def search(self, position, k=DEFAULT_K, candidates=None):
+        """As k linhas mais próximas de `position` (sem ela): DataFrame (posicao, distancia, similaridade).
+
+        `candidates` é uma máscara booleana das linhas aceitas (ex.: filtros do
+        dashboard); a similaridade é 1 - distância² / número de variáveis.
+        """
+        # Respostas: cada bit diferente vale 1/2 (1 por resposta trocada); medidas: ‖a - b‖²
+        distances = self._numeric @ (-2 * self._numeric[position])
+        distances += self._sqnorm
+        distances += self._sqnorm[position]
+        differing, word = np.zeros(self.n, dtype=np.uint16), np.empty(self.n, dtype=np.uint64)
+        for words, own in zip(self._bits, self._bits[:, position]):
+            np.bitwise_xor(words, own, out=word)
+            differing += np.bitwise_count(word)
+        distances += differing * np.float32(0.5)
+        np.maximum(distances, 0, out=distances)
+        if candidates is not None:
+            distances[~candidates] = np.inf
+        distances[position] = np.inf
+        k = min(k, int(np.isfinite(distances).sum()))
+        if k <= 0:
+            return pd.DataFrame({'posicao': np.array([], dtype=np.int64), 'distancia': [], 'similaridade': []})
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+        squared = distances[nearest].astype(float)
+        return pd.DataFrame({'posicao': nearest, 'distancia': np.sqrt(squared),
+                             'similaridade': 1 - squared / max(self.n_variables, 1)})
+
+    def similar(self, key, k=DEFAULT_K, outcome=None, candidates=None):
+        """Produtores mais parecidos com `key`; com `outcome` (chave de OUTCOMES), só os de resultado melhor.
+
+        DataFrame (chave, Comunidade, Produtor, similaridade, distancia[, resultado]).
+        """
+        position = self.position(key)
+        mask = np.ones(self.n, dtype=bool) if candidates is None else np.asarray(candidates, dtype=bool).copy()
+        if outcome is not None:
+            scores = self.outcomes[outcome]
+            own = scores[position]
+            # Sem o resultado do próprio produtor, vale qualquer resultado conhecido
+            mask &= ~np.isnan(scores) if np.isnan(own) else scores > own
+        found = self.search(position, k, mask)
+        rows = self.frame.iloc[found['posicao']]
+        result = pd.DataFrame({
+            'chave': self.keys[found['posicao']],
+            'Comunidade': rows['Comunidade'].astype('string').to_numpy() if 'Comunidade' in rows else pd.NA,
+            'Produtor': rows[NAME_COLUMN].astype('string').to_numpy() if NAME_COLUMN in rows else pd.NA,
+            'similaridade': found['similaridade'].round(3).to_numpy(),
+            'distancia': found['distancia'].round(3).to_numpy(),
+        })
+        if outcome is not None:
+            _, col, _ = OUTCOMES[outcome]
+            result[self._outcome_labels[outcome]] = rows[col].to_numpy() if col in rows else pd.NA
+        return result
+
+    def differences(self, key, other):
+        """Perguntas em que dois produtores responderam diferente: DataFrame (pergunta, produtor, vizinho)."""
+        rows = yes_no_labels(self.frame.iloc[[self.position(key), self.position(other)]][self.questions])
+        rows = rows.astype('string').fillna('—')
+        differ = rows.iloc[0] != rows.iloc[1]
+        return pd.DataFrame({'pergunta': rows.columns[differ], 'produtor': rows.iloc[0][differ].to_numpy(),
+                             'vizinho': rows.iloc[1][differ].to_numpy()})
+
+
+def benchmark(df, n, queries=200, k=DEFAULT_K, seed=0):
+    """Tempo de construção e latência das buscas com `n` entrevistas sorteadas (com reposição) de `df`."""
+    rng = np.random.default_rng(seed)
+    sample = df.iloc[rng.integers(0, len(df), n)].reset_index(drop=True)
+    # Chaves distintas para cada cópia
+    sample['Identificador'] = pd.Series(np.arange(n).astype(str), dtype='string')
+    start = time.perf_counter()
+    index = ProducerIndex(sample)
+    build = time.perf_counter() - start
+    latencies = []
+    for position in rng.integers(0, n, queries):
+        start = time.perf_counter()
+        index.search(int(position), k)
+        latencies.append(time.perf_counter() - start)
+    return {'produtores': n, 'dimensoes': len(index.dimensions), 'construcao_s': round(build, 2),
+            'busca_mediana_ms': round(float(np.median(latencies)) * 1000, 2),
+            'busca_p95_ms': round(float(np.percentile(latencies, 95)) * 1000, 2)}
+
+
+def main():
+    import ingest
+    from data_pipeline import DEFAULT_MUNICIPIO, apply_filters
+
+    parser = argparse.ArgumentParser(description='Produtores com respostas parecidas às de um produtor.')
+    parser.add_argument('--municipio', default=DEFAULT_MUNICIPIO)
+    parser.add_argument('--onda', action='append', help='ondas (padrão: todas)')
+    parser.add_argument('--produtor', help='chave da entrevista (padrão: lista as chaves)')
+    parser.add_argument('--k', type=int, default=DEFAULT_K)
+    parser.add_argument('--resultado', choices=list(OUTCOMES), help='só vizinhos com resultado melhor')
+    parser.add_argument('--benchmark', type=int, metavar='N', help='mede a busca com N produtores sorteados')
+    args = parser.parse_args()
+
+    df = apply_filters(ingest.load_store(municipios=[args.municipio], ondas=args.onda))
+    if args.benchmark:
+        print(benchmark(df, args.benchmark))
+        return
+    index = ProducerIndex(df)
+    if not args.produtor:
+        print('\n'.join(index.keys.unique()))
+        return
+    similar = index.similar(args.produtor, k=args.k, outcome=args.resultado)
+    print(similar.to_string(index=False))
+    if not similar.empty:
+        print(f"\nDiferenças para {similar['chave'].iloc[0]}:")
+        print(index.differences(args.produtor, similar['chave'].iloc[0]).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
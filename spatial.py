@@ -0,0 +1,424 @@
+# Índice espacial das propriedades (Coordenadas_Separadas.csv).
+#
+# Uso:
+#     python spatial.py [--municipio Juruti] [--raio 5]
+#
+# SpatialIndex guarda os pontos numa grade regular (células de cell_km, numa
+# projeção equirretangular em torno da latitude média) e responde em lote:
+#   - within: todos os pontos a até radius_km de cada consulta, pelas células
+#     vizinhas da consulta;
+#   - nearest: os k pontos mais próximos de cada consulta, por uma árvore k-d
+#     percorrida nível a nível.
+# A grade e a árvore só escolhem os candidatos; a distância final é sempre a
+# de haversine. Nada de laço por consulta: cada deslocamento de célula e cada
+# nível da árvore são tratados de uma vez para todas as consultas. Medido com
+# 5 mil pontos e 5 mil consultas num quadrado de 44 km: nearest com k=1 leva
+# ~0,13 s com os pontos espalhados e ~0,15 s com eles em 5 aglomerados (k=5,
+# ~0,35 s); within com raio de 2 km, ~0,3 s.
+#
+# Para a logística, producer_points junta às coordenadas as respostas da
+# entrevista vinculada (linkage.py), e flour_house_access diz, para cada
+# produtor sem casa de farinha, qual a casa mais próxima e quantas há no raio.
+#
+# grid_layers agrega as propriedades em hexágonos, com um lado de hexágono por
+# faixa de zoom do mapa (GRID_RESOLUTIONS), e calcula a média de cada
+# indicador de GRID_METRICS por célula; o mapa recebe só os polígonos e os
+# valores das células, então o custo de desenhar depende do número de células,
+# não do de produtores.
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from dtype_optimizer import NO, YES
+from ingest import interview_keys
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_CELL_KM = 2.0
+# A grade é equirretangular: o raio em células ganha 5% de folga (sobra para
+# regiões de algumas centenas de km, como um município)
+PROJECTION_MARGIN = 1.05
+# Teto da grade densa (linhas x colunas) que aponta cada célula para seus pontos
+MAX_GRID_CELLS = 1_000_000
+# Pontos por folha da árvore k-d usada por nearest
+LEAF_SIZE = 16
+FLOUR_HOUSE_COLUMN = 'Possui casa de farinha?'
+OUTFLOW_COLUMN = 'Como é realizado o escoamento da produção?'
+DEFAULT_RADIUS_KM = 5.0
+
+# Indicador da camada de hexágonos do mapa -> (coluna, tipo). 'media': média
+# da coluna; 'sim'/'nao': % das propriedades que responderam SIM/NÃO
+GRID_METRICS = {
+    'Preço da farinha (R$/kg)': ('Preco_Farinha', 'media'),
+    'Incidência de pragas (%)': ('Atualmente, há incidência de pragas da mandioca/macaxeira?', 'sim'),
+    'Sem assistência técnica (%)': ('Assistencia_Tecnica', 'nao'),
+    'Renda familiar (R$)': ('Renda_Familiar_R$', 'media'),
+    'Área plantada (ha)': ('Tamanho_Area_Plantada_ha', 'media'),
+}
+# Zoom mínimo do mapa -> lado do hexágono (km): aproximando, células menores
+GRID_RESOLUTIONS = {0: 4.0, 12: 1.5, 14: 0.5}
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distância de haversine (km), vetorizada (aceita arrays com broadcast)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def project_km(lat, lon, ref_lat):
+    """(x, y) em km na projeção equirretangular em torno de ref_lat."""
+    y = np.radians(np.asarray(lat, dtype=float)) * EARTH_RADIUS_KM
+    x = np.radians(np.asarray(lon, dtype=float)) * EARTH_RADIUS_KM * np.cos(np.radians(ref_lat))
+    return x, y
+
+
+def unproject_km(x, y, ref_lat):
+    """Inverso de project_km: (lat, lon) em graus."""
+    lat = np.degrees(np.asarray(y, dtype=float) / EARTH_RADIUS_KM)
+    lon = np.degrees(np.asarray(x, dtype=float) / (EARTH_RADIUS_KM * np.cos(np.radians(ref_lat))))
+    return lat, lon
+
+
+class SpatialIndex:
+    """Grade de pontos (lat, lon) para consultas por raio e k vizinhos mais próximos."""
+
+    def __init__(self, lat, lon, cell_km=DEFAULT_CELL_KM):
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        points = np.flatnonzero(~(np.isnan(self.lat) | np.isnan(self.lon)))
+        self._ref_lat = float(np.mean(self.lat[points])) if len(points) else 0.0
+        self.cell_km = cell_km
+        rows, cols = self._cells(self.lat[points], self.lon[points])
+        if len(points):
+            # Pontos espalhados demais: células maiores, para a grade caber em MAX_GRID_CELLS
+            extent = (np.ptp(rows) + 1) * (np.ptp(cols) + 1)
+            if extent > MAX_GRID_CELLS:
+                self.cell_km *= np.sqrt(extent / MAX_GRID_CELLS) * 1.01
+                rows, cols = self._cells(self.lat[points], self.lon[points])
+            self._origin = (int(rows.min()), int(cols.min()))
+            self._shape = (int(rows.max()) - self._origin[0] + 1, int(cols.max()) - self._origin[1] + 1)
+        else:
+            self._origin, self._shape = (0, 0), (0, 0)
+        # Pontos ordenados por célula (cada célula é uma fatia contígua) e a
+        # grade densa célula -> fatia (-1 nas células vazias)
+        keys = (rows - self._origin[0]) * self._shape[1] + (cols - self._origin[1])
+        order = np.argsort(keys, kind='stable')
+        self._points = points[order]
+        self._cell_keys, self._starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        self._ends = self._starts + counts
+        self._grid = np.full(self._shape[0] * self._shape[1], -1, dtype=np.int64)
+        self._grid[self._cell_keys] = np.arange(len(self._cell_keys))
+        self._tree = None
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cells(self, lat, lon):
+        """(linha, coluna) da célula de cada ponto."""
+        x, y = project_km(lat, lon, self._ref_lat)
+        with np.errstate(invalid='ignore'):
+            return (np.floor(y / self.cell_km).astype(np.int64, copy=False),
+                    np.floor(x / self.cell_km).astype(np.int64, copy=False))
+
+    def _slots(self, rows, cols):
+        """Fatia de pontos de cada célula (-1 se vazia ou fora da grade)."""
+        rows, cols = rows - self._origin[0], cols - self._origin[1]
+        inside = np.flatnonzero((rows >= 0) & (rows < self._shape[0]) & (cols >= 0) & (cols < self._shape[1]))
+        slots = np.full(len(rows), -1, dtype=np.int64)
+        slots[inside] = self._grid[rows[inside] * self._shape[1] + cols[inside]]
+        return slots
+
+    def _candidates(self, lat, lon, rings):
+        """Pares (consulta, ponto) das células a até `rings` células da consulta."""
+        queries, slots = [], []
+        rows, cols = self._cells(lat, lon)
+        if (2 * rings + 1) ** 2 <= len(self._cell_keys):
+            # Poucos deslocamentos: cada um procurado de uma vez para todas as consultas
+            for dy in range(-rings, rings + 1):
+                for dx in range(-rings, rings + 1):
+                    # Células cujo canto mais próximo já passa do raio ficam de fora
+                    if (max(abs(dx) - 1, 0) ** 2 + max(abs(dy) - 1, 0) ** 2) > rings ** 2:
+                        continue
+                    slot = self._slots(rows + dy, cols + dx)
+                    found = np.flatnonzero(slot >= 0)
+                    queries.append(found)
+                    slots.append(slot[found])
+        else:
+            # Raio grande: mais barato percorrer as células ocupadas
+            cell_rows, cell_cols = np.divmod(self._cell_keys, self._shape[1])
+            for slot, (cell_row, cell_col) in enumerate(zip(cell_rows + self._origin[0], cell_cols + self._origin[1])):
+                found = np.flatnonzero((np.abs(rows - cell_row) <= rings) & (np.abs(cols - cell_col) <= rings))
+                queries.append(found)
+                slots.append(np.full(len(found), slot))
+        if not queries:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        # (consulta, célula) -> (consulta, cada ponto da célula)
+        slots = np.concatenate(slots)
+        queries, positions = _expand_ranges(np.concatenate(queries), self._starts[slots], self._ends[slots])
+        return queries, self._points[positions]
+
+    def within(self, lat, lon, radius_km):
+        """Pontos a até radius_km de cada consulta: DataFrame (consulta, ponto, distancia_km).
+
+        consulta e ponto são posições (nas consultas e nos pontos do índice);
+        as linhas saem ordenadas por consulta e distância.
+        """
+        lat, lon = np.atleast_1d(np.asarray(lat, dtype=float)), np.atleast_1d(np.asarray(lon, dtype=float))
+        # Folga de PROJECTION_MARGIN para a distorção da projeção
+        rings = int(np.ceil(radius_km * PROJECTION_MARGIN / self.cell_km))
+        queries, points = self._candidates(lat, lon, rings)
+        distances = haversine_km(lat[queries], lon[queries], self.lat[points], self.lon[points])
+        keep = np.flatnonzero(distances <= radius_km)
+        keep = keep[np.lexsort((distances[keep], queries[keep]))]
+        return pd.DataFrame({'consulta': queries[keep], 'ponto': points[keep], 'distancia_km': distances[keep]})
+
+    def _top_k(self, lat, lon, queries, points, k, max_km):
+        """Os k candidatos mais próximos de cada consulta: (consulta, ponto, distancia), por consulta e distância."""
+        distances = haversine_km(lat[queries], lon[queries], self.lat[points], self.lon[points])
+        if max_km is not None:
+            keep = np.flatnonzero(distances <= max_km)
+            queries, points, distances = queries[keep], points[keep], distances[keep]
+        # Uma ordenação só: consulta na parte inteira, distância na fração
+        order = np.argsort(queries + distances / (distances.max(initial=0) + 1))
+        queries, points, distances = queries[order], points[order], distances[order]
+        starts = np.flatnonzero(np.r_[True, queries[1:] != queries[:-1]]) if len(queries) else queries
+        rank = np.arange(len(queries)) - np.repeat(starts, np.diff(np.r_[starts, len(queries)]))
+        keep = rank < k
+        return queries[keep], points[keep], distances[keep]
+
+    def _kd_tree(self):
+        """Árvore k-d dos pontos projetados, montada na primeira chamada de nearest.
+
+        Cada nó é uma fatia contígua de `points`, dividida na mediana do eixo
+        mais largo até ter no máximo LEAF_SIZE pontos; `box` é a caixa
+        (x_min, x_max, y_min, y_max) dos pontos do nó e `left`/`right` são -1
+        nas folhas.
+        """
+        if self._tree is None:
+            points = self._points.copy()
+            x, y = project_km(self.lat[points], self.lon[points], self._ref_lat)
+            ranges, children = [(0, len(points))], []
+            for lo, hi in ranges:
+                if hi - lo <= LEAF_SIZE:
+                    children.append((-1, -1))
+                    continue
+                axis = x if np.ptp(x[lo:hi]) >= np.ptp(y[lo:hi]) else y
+                mid = (lo + hi) // 2
+                order = lo + np.argpartition(axis[lo:hi], mid - lo)
+                points[lo:hi], x[lo:hi], y[lo:hi] = points[order], x[order], y[order]
+                children.append((len(ranges), len(ranges) + 1))
+                ranges += [(lo, mid), (mid, hi)]
+            ranges, children = np.array(ranges, dtype=np.int64), np.array(children, dtype=np.int64)
+            box = np.array([(x[lo:hi].min(), x[lo:hi].max(), y[lo:hi].min(), y[lo:hi].max()) for lo, hi in ranges])
+            self._tree = {'points': points, 'lo': ranges[:, 0], 'hi': ranges[:, 1],
+                          'left': children[:, 0], 'right': children[:, 1], 'box': box}
+        return self._tree
+
+    def nearest(self, lat, lon, k=1, max_km=None):
+        """Os k pontos mais próximos de cada consulta: DataFrame (consulta, ponto, distancia_km, ordem).
+
+        Percorre a árvore k-d nível a nível para todas as consultas de uma vez,
+        descartando os nós cuja caixa já fica mais longe que o k-ésimo ponto
+        visto até ali. Com max_km, pontos mais distantes que isso não entram.
+        """
+        lat, lon = np.atleast_1d(np.asarray(lat, dtype=float)), np.atleast_1d(np.asarray(lon, dtype=float))
+        k = min(k, len(self._points))
+        queries = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        points, distances = queries[:0], np.array([], dtype=float)
+        if k and len(queries):
+            tree = self._kd_tree()
+            x, y = project_km(lat, lon, self._ref_lat)
+
+            def box_km(queries, nodes):
+                # Distância projetada da consulta até a caixa do nó (0 dentro dela)
+                box = tree['box'][nodes]
+                dx = np.maximum(np.maximum(box[:, 0] - x[queries], x[queries] - box[:, 1]), 0)
+                dy = np.maximum(np.maximum(box[:, 2] - y[queries], y[queries] - box[:, 3]), 0)
+                return np.hypot(dx, dy)
+
+            # Busca nível a nível: só os nós cuja caixa fica dentro do limite,
+            # que é a k-ésima menor distância até um ponto de cada nó visitado
+            # (ou max_km); a projeção encurta distâncias em no máximo PROJECTION_MARGIN
+            limit = np.full(len(lat), np.inf if max_km is None else float(max_km))
+            pending, nodes, leaves = queries, np.zeros(len(queries), dtype=np.int64), []
+            while len(pending):
+                found, _, found_km = self._top_k(lat, lon, pending, tree['points'][tree['lo'][nodes]], k, max_km)
+                counts = np.bincount(found, minlength=len(lat))
+                full = np.flatnonzero(counts >= k)
+                limit[full] = np.minimum(limit[full], found_km[np.cumsum(counts)[full] - 1])
+                near = np.flatnonzero(box_km(pending, nodes) <= limit[pending] * PROJECTION_MARGIN)
+                pending, nodes = pending[near], nodes[near]
+                leaf = tree['left'][nodes] < 0
+                leaves.append((pending[leaf], nodes[leaf]))
+                # Filhos lado a lado, para os pares seguirem agrupados por consulta
+                pending, nodes = pending[~leaf], nodes[~leaf]
+                pending, nodes = np.repeat(pending, 2), np.column_stack([tree['left'][nodes], tree['right'][nodes]]).ravel()
+            pending, nodes = (np.concatenate(parts) for parts in zip(*leaves))
+            found, positions = _expand_ranges(pending, tree['lo'][nodes], tree['hi'][nodes])
+            queries, points, distances = self._top_k(lat, lon, found, tree['points'][positions], k, max_km)
+        else:
+            queries = points
+        result = pd.DataFrame({'consulta': queries, 'ponto': points, 'distancia_km': distances})
+        result['ordem'] = result.groupby('consulta').cumcount() + 1
+        return result
+
+
+def _expand_ranges(queries, starts, ends):
+    """(consulta, fatia [start, end)) -> (consulta, cada posição da fatia)."""
+    lengths = ends - starts
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(queries, lengths), np.repeat(starts, lengths) + offsets
+
+
+def producer_points(coords_df, df, link_table):
+    """Coordenadas com a chave e as respostas da entrevista vinculada (NaN para quem não casou)."""
+    links = link_table[link_table['fonte'] == 'coordenadas'][['registro', 'chave']]
+    answers = df.set_axis(interview_keys(df).to_numpy())
+    answers = answers[~answers.index.duplicated()].rename_axis('chave').reset_index()
+    points = coords_df.reset_index(drop=True).rename_axis('registro').reset_index()
+    return points.merge(links, on='registro', how='left').merge(answers, on='chave', how='left',
+                                                                suffixes=('', ' (questionário)'))
+
+
+def _yes(series):
+    if pd.api.types.is_bool_dtype(series):
+        return series.fillna(False).astype(bool)
+    return series.astype('string').str.strip().eq(YES).fillna(False).astype(bool)
+
+
+def flour_house_access(points, radius_km=DEFAULT_RADIUS_KM):
+    """Para cada produtor sem casa de farinha: a casa mais próxima e quantas há a até radius_km.
+
+    Só entram produtores com a resposta vinculada (points vem de producer_points).
+    """
+    answered = points[points[FLOUR_HOUSE_COLUMN].notna()]
+    has_house = _yes(answered[FLOUR_HOUSE_COLUMN]).to_numpy()
+    houses, without = answered[has_house], answered[~has_house]
+    index = SpatialIndex(houses['LATITUDE'], houses['LONGITUDE'])
+    nearest = index.nearest(without['LATITUDE'], without['LONGITUDE'], k=1)
+    in_radius = index.within(without['LATITUDE'], without['LONGITUDE'], radius_km)
+    counts = np.bincount(in_radius['consulta'], minlength=len(without))
+    result = pd.DataFrame({
+        'Produtor': without['Produtor'].to_numpy(),
+        'Comunidade': without['Comunidade'].to_numpy(),
+        'Casa de farinha mais próxima': pd.Series(pd.NA, index=range(len(without)), dtype=object),
+        'Distância (km)': np.nan,
+        f'Casas a até {radius_km:g} km': counts,
+    })
+    if OUTFLOW_COLUMN in without.columns:
+        result['Escoamento'] = without[OUTFLOW_COLUMN].astype('string').to_numpy()
+    result.loc[nearest['consulta'], 'Casa de farinha mais próxima'] = houses['Produtor'].to_numpy()[nearest['ponto']]
+    result.loc[nearest['consulta'], 'Distância (km)'] = nearest['distancia_km'].to_numpy()
+    return result.sort_values('Distância (km)', ignore_index=True)
+
+
+def _answer_share(series, answer):
+    """100 para a resposta `answer` (SIM/NÃO), 0 para a outra, NaN sem resposta."""
+    if pd.api.types.is_bool_dtype(series):
+        flags = series.astype('boolean')
+    else:
+        flags = series.astype('string').str.strip().map({YES: True, NO: False}).astype('boolean')
+    if answer == NO:
+        flags = ~flags
+    return flags.astype('Float64').mul(100).astype(float)
+
+
+def metric_values(points, metrics=GRID_METRICS):
+    """Um valor numérico por propriedade e indicador de GRID_METRICS presente em points."""
+    columns = {}
+    for name, (col, kind) in metrics.items():
+        if col not in points.columns:
+            continue
+        if kind == 'media':
+            columns[name] = pd.to_numeric(points[col], errors='coerce').astype(float)
+        else:
+            columns[name] = _answer_share(points[col], YES if kind == 'sim' else NO)
+    return pd.DataFrame(columns, index=points.index)
+
+
+def hex_bins(lat, lon, size_km, ref_lat):
+    """Coordenadas axiais (q, r) do hexágono (lado size_km, vértice para cima) de cada ponto."""
+    x, y = project_km(lat, lon, ref_lat)
+    q = (np.sqrt(3) / 3 * x - y / 3) / size_km
+    r = (2 / 3 * y) / size_km
+    # Arredondamento em coordenadas cúbicas (q + r + s = 0)
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def hex_polygons(q, r, size_km, ref_lat):
+    """Vértices [lat, lon] de cada hexágono: array (n, 6, 2)."""
+    center_x = size_km * np.sqrt(3) * (np.asarray(q) + np.asarray(r) / 2)
+    center_y = size_km * 1.5 * np.asarray(r)
+    angles = np.radians(60 * np.arange(6) - 30)
+    lat, lon = unproject_km(center_x[:, None] + size_km * np.cos(angles),
+                            center_y[:, None] + size_km * np.sin(angles), ref_lat)
+    return np.stack([lat, lon], axis=-1)
+
+
+def grid_aggregates(points, size_km, ref_lat, metrics=GRID_METRICS):
+    """Uma linha por hexágono ocupado: q, r, n (propriedades) e a média de cada indicador."""
+    located = points.dropna(subset=['LATITUDE', 'LONGITUDE'])
+    q, r = hex_bins(located['LATITUDE'], located['LONGITUDE'], size_km, ref_lat)
+    values = metric_values(located, metrics)
+    grouped = values.groupby([q, r])
+    result = grouped.mean().assign(n=grouped.size()).rename_axis(['q', 'r']).reset_index()
+    return result
+
+
+def grid_layers(points, ref_lat=None, resolutions=GRID_RESOLUTIONS, metrics=GRID_METRICS):
+    """Camadas de hexágonos para o mapa, prontas para JSON.
+
+    {'indicadores': [...], 'resolucoes': [{'zoom': z, 'lado_km': s, 'celulas':
+    [{'poligono': [[lat, lon], ...], 'n': n, 'valores': {indicador: valor}}]}]}
+    Só vão as células (polígono e médias), nunca as propriedades.
+    """
+    if ref_lat is None:
+        ref_lat = float(points['LATITUDE'].mean()) if len(points) else 0.0
+    names = list(metric_values(points.head(0), metrics).columns)
+    layers = []
+    for zoom, size_km in sorted(resolutions.items()):
+        cells = grid_aggregates(points, size_km, ref_lat, metrics)
+        polygons = hex_polygons(cells['q'].to_numpy(), cells['r'].to_numpy(), size_km, ref_lat).round(6).tolist()
+        values = cells[names].round(2).astype(object).where(cells[names].notna(), None).to_dict('records')
+        layers.append({
+            'zoom': zoom,
+            'lado_km': size_km,
+            'celulas': [{'poligono': polygon, 'n': int(n), 'valores': cell_values}
+                        for polygon, n, cell_values in zip(polygons, cells['n'], values)],
+        })
+    return {'indicadores': names, 'resolucoes': layers}
+
+
+def main():
+    import ingest
+    import linkage
+    from data_pipeline import DEFAULT_MUNICIPIO, MUNICIPIOS
+
+    parser = argparse.ArgumentParser(description='Acesso dos produtores às casas de farinha (consultas por raio e vizinho mais próximo).')
+    parser.add_argument('--municipio', default=DEFAULT_MUNICIPIO)
+    parser.add_argument('--raio', type=float, default=DEFAULT_RADIUS_KM, help='raio em km')
+    args = parser.parse_args()
+
+    coordinates_path = MUNICIPIOS.get(args.municipio, {}).get('coordenadas')
+    if not coordinates_path:
+        parser.error(f'{args.municipio} não tem arquivo de coordenadas em MUNICIPIOS')
+    df = ingest.load_store(municipios=[args.municipio], ondas=[ingest.municipality_waves(args.municipio)[-1]])
+    coords_df = pd.read_csv(coordinates_path)
+    points = producer_points(coords_df, df, linkage.load_link_table(df, coordinates_path=coordinates_path))
+    access = flour_house_access(points, args.raio)
+    print(f'{len(points)} propriedades, {points["chave"].notna().sum()} vinculadas à entrevista; '
+          f'{len(access)} sem casa de farinha')
+    print(access.to_string(index=False, float_format=lambda v: f'{v:.2f}'))
+
+
+if __name__ == '__main__':
+    main()
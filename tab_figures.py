@@ -0,0 +1,58 @@
+# Gráficos das abas do dashboard, compartilhados com os relatórios.
+#
+# Cada entrada de TAB_FIGURES é um gráfico de barras com a contagem dos itens
+# de uma pergunta de múltipla escolha (variedades, produtos, dificuldades,
+# pragas). app.py os mostra nas abas com o filtered_df e reports.py os grava
+# no relatório de cada comunidade, então os dois sempre desenham o mesmo
+# gráfico a partir do mesmo recorte.
+
+import plotly.express as px
+
+
+TERRACOTA_PALETTE = [
+    "#A52A2A",
+    "#667755",
+    "#8D6E63",  # Marrom terroso
+    "#A1887F",  # Marrom claro
+    "#CCCCAA",  # Bege
+    "#5D4037",  # Marrom escuro
+    "#795548",  # Marrom chocolate
+    "#BCAAA4",  # Rosa terroso
+    "#4E342E",  # Marrom quase preto
+    "#3E2723",  # Terracota escuro
+    "#6D4C41",  # Terracota
+]
+
+# Gráfico -> (coluna, título, rótulo do item, cores, máximo de barras (None: todas),
+#             itens em caixa alta)
+TAB_FIGURES = {
+    'variedades_mandioca': ('Variedades_Mandioca', 'Variedades de Mandioca Mais Cultivadas', 'Variedade',
+                            [TERRACOTA_PALETTE[3]], 10, False),
+    'variedades_macaxeira': ('Qual(s) variedade(s) de MACAXEIRA?', 'Variedades de Macaxeira Mais Cultivadas',
+                             'Variedade', [TERRACOTA_PALETTE[0]], 10, False),
+    'produtos': ('Produtos_Comercializados', 'Produtos Derivados Comercializados', 'Produto',
+                 TERRACOTA_PALETTE, None, False),
+    'dificuldades_cultivo': ('Dificuldades_Cultivo', 'Dificuldades no Cultivo', 'Dificuldade',
+                             [TERRACOTA_PALETTE[1]], None, False),
+    'dificuldades_processamento': ('Dificuldades_Processamento', 'Dificuldades no Processamento', 'Dificuldade',
+                                   [TERRACOTA_PALETTE[5]], None, False),
+    'pragas': ('Se sim, quais pragas?', 'Incidência de Pragas', 'Pragas', TERRACOTA_PALETTE, None, True),
+}
+
+
+def tab_figure(df, name):
+    """Gráfico `name` (TAB_FIGURES) das respostas de df; None sem a coluna ou sem respostas."""
+    column, title, label, colors, top, upper = TAB_FIGURES[name]
+    if column not in df.columns:
+        return None
+    answers = df[column].dropna().astype(str)
+    if upper:
+        answers = answers.str.upper()
+    # Índice 'index', para o rótulo do item valer no eixo
+    counts = answers.str.split(', ').explode().value_counts().rename_axis('index')
+    if counts.empty:
+        return None
+    if top:
+        counts = counts.head(top)
+    return px.bar(counts, title=title, labels={'index': label, 'value': 'Contagem'},
+                  color_discrete_sequence=colors)
@@ -0,0 +1,285 @@
+# Temas das respostas abertas do questionário.
+#
+# Uso:
+#     python themes.py [--municipio Juruti] [--pergunta "Por quê?"] [--temas 5]
+#
+# Perguntas como "O que deseja que melhore no cultivo da mandioca?" têm texto
+# livre que os gráficos não mostram. column_themes agrupa as respostas de uma
+# pergunta por sentido:
+#   1. respostas iguais (sem diferença de caixa, acento ou espaços) viram uma
+#      só, com o número de produtores que a deram;
+#   2. EmbeddingCache codifica em lotes, com o modelo de embeddings do app
+#      (embeddings.get_embeddings), só as respostas que ainda não estão no
+#      cache em disco (chave: hash do modelo + texto normalizado);
+#   3. minibatch_kmeans (k-means esférico em mini-lotes, ponderado pelos
+#      produtores) agrupa os vetores; os centróides ficam gravados por
+#      pergunta, visão (municípios e ondas) e número de temas, e a próxima
+#      rodada parte deles, então respostas novas entram nos temas existentes e
+#      os números dos temas não mudam à toa;
+#   4. label_clusters nomeia cada tema pelos termos mais característicos dele
+#      (c-TF-IDF: frequentes no tema, raros nos outros).
+# O app mostra os temas na aba "Temas"; só respostas novas são codificadas.
+
+import argparse
+import os
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from canonicalization import fold_series
+from column_index import tokenize
+from context_builder import content_hash
+from data_pipeline import COLUNA_MUNICIPIO, COLUNA_ONDA
+
+
+CACHE_DIR = '.cache'
+THEMES_VERSION = 1
+
+OPEN_ENDED_COLUMNS = (
+    'O que deseja que melhore no cultivo da mandioca?',
+    'Por quê (considera boa, ruim ou ótima)?',
+    'Por quê?',
+    'Sim, tem interesse para quais culturas?',
+)
+
+EMBED_BATCH_SIZE = 256
+KMEANS_BATCH_SIZE = 1024
+KMEANS_ITERATIONS = 100
+MAX_THEMES = 12
+LABEL_TERMS = 3
+
+_RE_WORD = re.compile(r'\w+')
+
+
+def _normalize(series):
+    """Texto usado para agrupar respostas iguais e como chave do cache ('N.A.' conta como sem resposta)."""
+    return fold_series(series).replace(['', 'N.A.'], pd.NA)
+
+
+def answer_table(series):
+    """Respostas distintas de uma pergunta: DataFrame (chave, resposta, produtores), da mais comum para a menos."""
+    answers = series.astype('string').str.strip()
+    table = pd.DataFrame({'chave': _normalize(answers), 'resposta': answers}).dropna()
+    grouped = table.groupby('chave', sort=False).agg(resposta=('resposta', lambda s: s.value_counts().index[0]),
+                                                     produtores=('resposta', 'size'))
+    return grouped.sort_values('produtores', ascending=False, kind='stable').reset_index()
+
+
+class EmbeddingCache:
+    """Vetores de textos por hash (modelo + texto), gravados em cache_dir; só textos novos vão ao modelo."""
+
+    def __init__(self, embeddings, model_name, cache_dir=CACHE_DIR, batch_size=EMBED_BATCH_SIZE):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.path = os.path.join(cache_dir, f'embeddings-{content_hash(model_name)}.npz')
+        self._rows = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        if os.path.exists(self.path):
+            with np.load(self.path) as stored:
+                self._vectors = stored['vetores']
+                self._rows = {key: i for i, key in enumerate(stored['chaves'].tolist())}
+
+    def _key(self, text):
+        return content_hash(f'{self.model_name}\n{text}')
+
+    def encode(self, texts):
+        """Matriz (len(texts), d) de vetores normalizados, na ordem de texts."""
+        keys = [self._key(text) for text in texts]
+        missing = list(dict.fromkeys(key_text for key_text in zip(keys, texts) if key_text[0] not in self._rows))
+        if missing:
+            new = []
+            for start in range(0, len(missing), self.batch_size):
+                batch = [text for _, text in missing[start:start + self.batch_size]]
+                new.append(np.asarray(self.embeddings.embed_documents(batch), dtype=np.float32))
+            new = np.vstack(new)
+            new /= np.clip(np.linalg.norm(new, axis=1, keepdims=True), 1e-12, None)
+            first = len(self._rows)
+            self._vectors = new if not self._rows else np.vstack([self._vectors, new])
+            self._rows.update({key: first + i for i, (key, _) in enumerate(missing)})
+            self._save()
+        if not keys:
+            return np.zeros((0, self._vectors.shape[1] if self._rows else 0), dtype=np.float32)
+        return self._vectors[[self._rows[key] for key in keys]]
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp_path, chaves=np.array(list(self._rows)), vetores=self._vectors)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        return len(self._rows)
+
+
+def default_k(n_answers):
+    """Número de temas para n respostas distintas: ~√(n/2), entre 2 e MAX_THEMES."""
+    return int(np.clip(round(np.sqrt(n_answers / 2)), 2, MAX_THEMES))
+
+
+def _kmeans_pp(vectors, weights, k, rng):
+    """Sementes do k-means++ (distância do cosseno, ponderada pelos produtores)."""
+    centers = [vectors[rng.choice(len(vectors), p=weights / weights.sum())]]
+    closest = 1 - vectors @ centers[0]
+    for _ in range(1, k):
+        probabilities = weights * np.maximum(closest, 0)
+        if probabilities.sum() <= 0:
+            break
+        centers.append(vectors[rng.choice(len(vectors), p=probabilities / probabilities.sum())])
+        closest = np.minimum(closest, 1 - vectors @ centers[-1])
+    return np.array(centers, dtype=np.float32)
+
+
+def minibatch_kmeans(vectors, k, weights=None, init=None, init_counts=None, batch_size=KMEANS_BATCH_SIZE,
+                     iterations=KMEANS_ITERATIONS, seed=0):
+    """K-means esférico em mini-lotes: (tema de cada vetor, centróides, peso de cada tema).
+
+    Cada lote puxa os centróides para a média dos seus vetores com taxa
+    1/peso acumulado (Sculley, 2010). `init`/`init_counts` (centróides e pesos
+    de uma rodada anterior) fazem as respostas novas só ajustarem os temas.
+    """
+    rng = np.random.default_rng(seed)
+    weights = np.ones(len(vectors)) if weights is None else np.asarray(weights, dtype=float)
+    k = min(k, len(vectors))
+    if init is not None and len(init) == k and init.shape[1] == vectors.shape[1]:
+        centers = np.array(init, dtype=np.float32)
+        counts = np.array(init_counts, dtype=float) if init_counts is not None else np.zeros(k)
+    else:
+        centers, counts = _kmeans_pp(vectors, weights, k, rng), np.zeros(k)
+        k = len(centers)
+    probabilities = weights / weights.sum()
+    for _ in range(iterations):
+        batch = (rng.choice(len(vectors), size=batch_size, p=probabilities)
+                 if len(vectors) > batch_size else np.arange(len(vectors)))
+        batch_weights = weights[batch] if len(vectors) <= batch_size else np.ones(len(batch))
+        assigned = np.argmax(vectors[batch] @ centers.T, axis=1)
+        batch_counts = np.bincount(assigned, weights=batch_weights, minlength=k)
+        membership = np.zeros((k, len(batch)), dtype=np.float32)
+        membership[assigned, np.arange(len(batch))] = batch_weights
+        sums = membership @ vectors[batch]
+        updated = batch_counts > 0
+        counts[updated] += batch_counts[updated]
+        previous = centers.copy()
+        centers[updated] += ((sums[updated] - batch_counts[updated, None] * centers[updated])
+                             / counts[updated, None]).astype(np.float32)
+        centers /= np.clip(np.linalg.norm(centers, axis=1, keepdims=True), 1e-12, None)
+        if len(vectors) <= batch_size and np.abs(centers - previous).max() < 1e-5:
+            break
+    labels = np.argmax(vectors @ centers.T, axis=1)
+    return labels, centers, np.bincount(labels, weights=weights, minlength=len(centers))
+
+
+def label_clusters(texts, weights, labels, n_terms=LABEL_TERMS):
+    """Rótulo de cada tema: os termos mais característicos (c-TF-IDF), na grafia mais comum."""
+    n_clusters = int(labels.max()) + 1 if len(labels) else 0
+    frequency = [Counter() for _ in range(n_clusters)]
+    surface = {}
+    for text, weight, label in zip(texts, weights, labels):
+        for word in _RE_WORD.findall(str(text).lower()):
+            terms = tokenize(word)
+            if not terms:
+                continue
+            frequency[label][terms[0]] += weight
+            surface.setdefault(terms[0], Counter())[word] += weight
+    totals = Counter()
+    for counter in frequency:
+        totals.update(counter)
+    average = sum(totals.values()) / max(n_clusters, 1)
+    names = []
+    for counter in frequency:
+        size = sum(counter.values()) or 1
+        scores = {term: count / size * np.log(1 + average / totals[term]) for term, count in counter.items()}
+        best = sorted(scores, key=lambda term: (-scores[term], term))[:n_terms]
+        names.append(', '.join(surface[term].most_common(1)[0][0] for term in best) or '(sem termos)')
+    return names
+
+
+def _view(df):
+    """Municípios e ondas presentes em df ('Juruti/2025'), para separar os centróides de cada visão."""
+    values = [','.join(sorted(df[col].dropna().astype(str).unique())) if col in df.columns else ''
+              for col in (COLUNA_MUNICIPIO, COLUNA_ONDA)]
+    return '/'.join(values)
+
+
+def _state_path(cache, column, view, k):
+    key = content_hash('\n'.join([str(THEMES_VERSION), cache.model_name, column, view, str(k)]))
+    return os.path.join(os.path.dirname(cache.path) or '.', f'temas-{key}.npz')
+
+
+def column_themes(df, column, cache, k=None, seed=0):
+    """Temas das respostas de `column`: DataFrame (chave, resposta, produtores, tema, rotulo, similaridade).
+
+    Os centróides são gravados ao lado do cache de embeddings e reaproveitados
+    na próxima chamada com o mesmo número de temas.
+    """
+    table = answer_table(df[column]) if column in df.columns else answer_table(pd.Series(dtype='string'))
+    if table.empty:
+        return table.assign(tema=pd.Series(dtype=int), rotulo=pd.Series(dtype='string'), similaridade=pd.Series(dtype=float))
+    vectors = cache.encode(table['chave'].tolist())
+    k = min(k or default_k(len(table)), len(table))
+    path = _state_path(cache, column, _view(df), k)
+    init = counts = None
+    if os.path.exists(path):
+        with np.load(path) as state:
+            init, counts = state['centroides'], state['pesos']
+    labels, centers, counts = minibatch_kmeans(vectors, k, table['produtores'].to_numpy(float),
+                                               init=init, init_counts=counts, seed=seed)
+    tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(tmp_path, centroides=centers, pesos=counts)
+    os.replace(tmp_path, path)
+
+    names = label_clusters(table['resposta'], table['produtores'], labels)
+    return table.assign(tema=labels, rotulo=[names[label] for label in labels],
+                        similaridade=np.round((vectors * centers[labels]).sum(axis=1), 3))
+
+
+def assign_themes(series, themes):
+    """Tema (rótulo) da resposta de cada produtor; NA para quem não respondeu."""
+    return _normalize(series.astype('string').str.strip()).map(themes.set_index('chave')['rotulo'])
+
+
+def theme_summary(themes, series=None, examples=3):
+    """Um tema por linha: rótulo, produtores, respostas distintas e as respostas mais típicas.
+
+    Com `series` (as respostas dos produtores filtrados), os produtores são
+    contados nela, e não na tabela de temas inteira.
+    """
+    if series is not None:
+        counts = _normalize(series.astype('string').str.strip()).value_counts()
+        themes = themes.assign(produtores=themes['chave'].map(counts).fillna(0).astype(int))
+        themes = themes[themes['produtores'] > 0]
+    typical = themes.sort_values(['tema', 'similaridade'], ascending=[True, False])
+    summary = typical.groupby(['tema', 'rotulo'], sort=False).agg(
+        produtores=('produtores', 'sum'), respostas=('resposta', 'size'),
+        exemplos=('resposta', lambda s: ' | '.join(s.head(examples))))
+    return summary.reset_index().sort_values('produtores', ascending=False, kind='stable', ignore_index=True)
+
+
+def main():
+    import ingest
+    from data_pipeline import DEFAULT_MUNICIPIO
+    from embeddings import embedding_name, get_embeddings
+
+    parser = argparse.ArgumentParser(description='Agrupa as respostas abertas do questionário em temas.')
+    parser.add_argument('--municipio', default=DEFAULT_MUNICIPIO)
+    parser.add_argument('--pergunta', action='append', help=f'padrão: {", ".join(OPEN_ENDED_COLUMNS)}')
+    parser.add_argument('--temas', type=int, default=None, help='número de temas (padrão: pelo número de respostas)')
+    args = parser.parse_args()
+
+    df = ingest.load_store(municipios=[args.municipio])
+    cache = EmbeddingCache(get_embeddings(), embedding_name())
+    before = len(cache)
+    for column in args.pergunta or OPEN_ENDED_COLUMNS:
+        if column not in df.columns:
+            print(f'{column}: coluna ausente')
+            continue
+        themes = column_themes(df, column, cache, k=args.temas)
+        print(f'\n{column} ({themes["produtores"].sum()} respostas, {len(themes)} distintas)')
+        print(theme_summary(themes).to_string(index=False))
+    print(f'\n{len(cache) - before} respostas novas codificadas; {len(cache)} no cache')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+# Aquecimento dos caches do app em segundo plano e retrato (snapshot) em disco.
+#
+# Uso:
+#     python warm_cache.py [--municipio Juruti] [--limpar 30]
+#
+# e depois `streamlit run app.py`: o processo novo encontra tudo pronto.
+#
+# O primeiro usuário depois de um deploy pagava a leitura das exportações, o
+# pré-processamento, as seções do contexto, a carga do modelo de embeddings, o
+# índice FAISS, as associações e o índice de produtores parecidos. Aqui:
+#   - retrato em disco (SNAPSHOT_DIR): os objetos caros dos dados sem filtro de
+#     cada visão (município, onda) são gravados com pickle na primeira
+#     construção e só lidos pelos processos seguintes. A chave inclui a chave
+#     dos dados (shared_store.survey_key), a CONTEXT_VERSION e o hash do
+#     código da construção e de todos os módulos do projeto que ela importa,
+#     direta ou indiretamente, então uma exportação nova ou
+#     um deploy com código novo gera um retrato novo sem apagar nada à mão
+#     (nem mudar SNAPSHOT_VERSION); os arquivos são gravados por este
+#     módulo (não vêm de fora) de forma atômica. O questionário (Arrow), o
+#     índice FAISS (shared_store), os vínculos (linkage) e os vetores das
+#     respostas abertas (themes) já ficavam em disco;
+#   - CacheWarmer: uma thread de fundo que roda as tarefas de aquecimento em
+#     ordem (a visão padrão primeiro). O app a inicia na primeira execução do
+#     processo, com os próprios getters em cache, e o chat não espera o modelo
+#     de embeddings: enquanto a tarefa dele não termina, avisa e segue.
+# Rodar o módulo aquece o disco para todas as visões (ou as do --municipio) e
+# mostra o tempo de cada tarefa; --limpar apaga retratos sem uso há N dias.
+#
+# Configuração: MANIVA_SNAPSHOT_DIR muda o diretório dos retratos.
+
+import argparse
+import ast
+import importlib
+import inspect
+import os
+import pickle
+import threading
+import time
+
+import pandas as pd
+
+import associations
+import data_pipeline
+import ingest
+import retrieval
+import shared_store
+import similarity
+from context_builder import CONTEXT_VERSION, content_hash
+from data_pipeline import DEFAULT_MUNICIPIO, apply_filters
+
+
+SNAPSHOT_DIR = os.environ.get('MANIVA_SNAPSHOT_DIR', os.path.join('.cache', 'snapshots'))
+# Mude quando as classes guardadas mudarem de forma incompatível
+SNAPSHOT_VERSION = 1
+# Módulos do projeto: os .py deste diretório
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Aquecimentos iniciados no processo (ver wait_all)
+_started = []
+
+
+def _snapshot_path(name, parts, snapshot_dir):
+    return os.path.join(snapshot_dir, f'{name}-{content_hash(f"{SNAPSHOT_VERSION}|{name}|{parts!r}")}.pkl')
+
+
+def restore_or_build(name, parts, build, snapshot_dir=None):
+    """O objeto do retrato `name` com a chave `parts`; sem retrato, build() e grava para os próximos processos."""
+    snapshot_dir = snapshot_dir or SNAPSHOT_DIR
+    path = _snapshot_path(name, parts, snapshot_dir)
+    if os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            # Marca o uso (ver prune_snapshots)
+            os.utime(path)
+            return value
+        except Exception:
+            # Retrato truncado ou de outra versão das classes: reconstrói
+            pass
+    value = build()
+    os.makedirs(snapshot_dir, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return value
+
+
+def prune_snapshots(max_age_days, snapshot_dir=None):
+    """Apaga os retratos não usados há mais de max_age_days dias; devolve quantos apagou."""
+    snapshot_dir = snapshot_dir or SNAPSHOT_DIR
+    if not os.path.isdir(snapshot_dir):
+        return 0
+    limit = time.time() - max_age_days * 86400
+    removed = 0
+    for name in os.listdir(snapshot_dir):
+        path = os.path.join(snapshot_dir, name)
+        if name.endswith(('.pkl', '.tmp')) and os.path.getmtime(path) < limit:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def _sections(df, municipio, onda):
+    counts = ingest.load_counts(municipios=[municipio], ondas=[onda])
+    community_counts = {comunidade: ingest.load_counts(municipios=[municipio], ondas=[onda], comunidades=[comunidade])
+                        for comunidade in df['Comunidade'].dropna().astype(str).unique()}
+    return retrieval.retrieval_sections(df, counts=counts, community_counts=community_counts)
+
+
+def _associations(df, municipio, onda):
+    # A mesma matriz que app.get_associations sem filtros
+    return associations.AssociationMatrix(apply_filters(df))
+
+
+def _producers(df, municipio, onda):
+    return similarity.ProducerIndex(df)
+
+
+# Retrato -> (construção a partir dos dados sem filtro de uma visão (df, município, onda),
+#             módulos que a construção usa; os que eles importam entram sozinhos)
+SNAPSHOTS = {
+    'secoes': (_sections, (ingest, retrieval)),
+    'associacoes': (_associations, (associations, data_pipeline)),
+    'produtores': (_producers, (similarity, data_pipeline)),
+}
+
+_code_versions = {}
+
+
+def _project_imports(module):
+    """Nomes dos módulos do projeto importados por `module`, no topo ou dentro de funções."""
+    names = set()
+    for node in ast.walk(ast.parse(inspect.getsource(module))):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module)
+    return {name for name in names if os.path.exists(os.path.join(PROJECT_DIR, f'{name}.py'))}
+
+
+def project_modules(modules):
+    """`modules` e todos os módulos do projeto que eles importam, direta ou indiretamente, por nome."""
+    found, pending = {}, list(modules)
+    while pending:
+        module = pending.pop()
+        if module.__name__ not in found:
+            found[module.__name__] = module
+            pending.extend(importlib.import_module(name) for name in _project_imports(module))
+    return dict(sorted(found.items()))
+
+
+def code_version(name):
+    """Hash do código da construção do retrato `name` e dos módulos que ela usa (uma vez por processo)."""
+    if name not in _code_versions:
+        build, modules = SNAPSHOTS[name]
+        sources = [inspect.getsource(build)] + [inspect.getsource(m) for m in project_modules(modules).values()]
+        _code_versions[name] = content_hash(''.join(sources))
+    return _code_versions[name]
+
+
+def snapshot(name, data_key, municipio, onda, df):
+    """Objeto `name` (SNAPSHOTS) dos dados sem filtro da visão, do retrato em disco ou construído."""
+    build, _ = SNAPSHOTS[name]
+    parts = (data_key, municipio, onda, CONTEXT_VERSION, code_version(name))
+    value = restore_or_build(name, parts, lambda: build(df, municipio, onda))
+    # Objetos que não guardam o DataFrame no pickle (similarity.ProducerIndex)
+    return value.attach(df) if hasattr(value, 'attach') else value
+
+
+def views(catalog=None):
+    """Visões (município, onda mais recente) do armazenamento, a do município padrão primeiro."""
+    catalog = ingest.partition_catalog() if catalog is None else catalog
+    latest = catalog.groupby('municipio')['onda'].max()
+    return sorted(latest.items(), key=lambda view: (view[0] != DEFAULT_MUNICIPIO, view[0]))
+
+
+class CacheWarmer:
+    """Roda as tarefas de aquecimento [(nome, função)] em ordem, em uma thread de fundo."""
+
+    def __init__(self, tasks):
+        self.tasks = list(tasks)
+        self.status = {name: 'pendente' for name, _ in self.tasks}
+        self.seconds = {}
+        self.errors = {}
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='aquecimento-caches', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        _started.append(self)
+        return self
+
+    def _run(self):
+        for name, task in self.tasks:
+            self.status[name] = 'construindo'
+            start = time.perf_counter()
+            try:
+                task()
+                self.status[name] = 'pronto'
+            except Exception as e:
+                self.status[name] = 'erro'
+                self.errors[name] = f'{type(e).__name__}: {e}'
+            self.seconds[name] = time.perf_counter() - start
+        self._done.set()
+
+    def busy(self, name):
+        """Se a tarefa ainda vai rodar ou está rodando (False para nomes que não são tarefas)."""
+        return self.status.get(name) in ('pendente', 'construindo')
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def done(self):
+        return self._done.is_set()
+
+    def report(self):
+        """DataFrame (tarefa, estado, segundos, erro)."""
+        return pd.DataFrame({'tarefa': list(self.status), 'estado': list(self.status.values()),
+                             'segundos': [round(self.seconds.get(name, float('nan')), 2) for name in self.status],
+                             'erro': [self.errors.get(name, '') for name in self.status]})
+
+
+def wait_all(timeout=None):
+    """Espera os aquecimentos iniciados no processo (ex.: o do app, antes de medir); False se o tempo acabar."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for warmer in list(_started):
+        if not warmer.wait(None if deadline is None else max(deadline - time.monotonic(), 0)):
+            return False
+    return True
+
+
+def disk_tasks(municipios=None):
+    """Tarefas que deixam em disco tudo o que um processo novo precisa, por visão."""
+    from embeddings import embedding_name, get_embeddings
+
+    loaded = {}
+
+    def embeddings():
+        if 'modelo' not in loaded:
+            loaded['modelo'] = get_embeddings()
+        return loaded['modelo']
+
+    def view_tasks(municipio, onda):
+        data_key = shared_store.survey_key(municipios=[municipio], ondas=[onda])
+
+        def survey():
+            return shared_store.shared_survey(municipios=[municipio], ondas=[onda])
+
+        def build(name):
+            return lambda: snapshot(name, data_key, municipio, onda, survey())
+
+        def index():
+            sections = snapshot('secoes', data_key, municipio, onda, survey())
+            retrieval.shared_retriever(sections, embeddings(), embedding_name())
+
+        return [(f'questionário {municipio}/{onda}', survey),
+                *[(f'{name} {municipio}/{onda}', build(name)) for name in SNAPSHOTS],
+                (f'índice FAISS {municipio}/{onda}', index)]
+
+    return [task for municipio, onda in views() if not municipios or municipio in municipios
+            for task in view_tasks(municipio, onda)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aquece os caches em disco do app (retratos, questionário, FAISS).')
+    parser.add_argument('--municipio', action='append', help='municípios (padrão: todos)')
+    parser.add_argument('--limpar', type=float, metavar='DIAS', help='apaga antes os retratos sem uso há DIAS dias')
+    args = parser.parse_args()
+
+    if args.limpar is not None:
+        print(f'{prune_snapshots(args.limpar)} retratos apagados')
+    warmer = CacheWarmer(disk_tasks(args.municipio)).start()
+    warmer.wait()
+    print(warmer.report().to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
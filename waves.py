@@ -0,0 +1,219 @@
+# Comparação entre ondas da pesquisa (impacto do projeto ao longo do tempo).
+#
+# Uso:
+#     python waves.py --antes 2025 --depois 2026 [--municipio Juruti]
+#
+# Cada onda (rodada de entrevistas) é ingerida com `ingest.py --onda`.
+# link_waves casa os produtores das duas ondas em duas etapas:
+#   1. chave exata, a mesma da ingestão (Identificador, Comunidade + Família
+#      ou Comunidade + nome do produtor), confirmada pelo nome: a Família é só
+#      o número da entrevista na comunidade e não se repete entre ondas, então
+#      pares com nomes diferentes (cosseno de bigramas abaixo de
+#      linkage.LINK_THRESHOLD) são descartados e contados em link_report;
+#   2. para quem sobrou, nome do produtor aproximado dentro da mesma
+#      comunidade (linkage.link_records: blocagem por comunidade e tokens do
+#      nome, cosseno de bigramas, sem repetir produtor).
+# compare_waves calcula de uma vez, sobre todos os pares, as diferenças
+# antes/depois das medidas (área, renda, preço) e as transições das práticas
+# (calagem, adubação, assistência técnica) e da incidência de pragas;
+# summarize_comparison resume por indicador (e por comunidade). O app guarda o
+# resultado por par de ondas, chaveado pela versão dos dados de cada uma.
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from dtype_optimizer import NO, YES
+from ingest import interview_keys
+from linkage import LINK_THRESHOLD, NAME_COLUMN, link_records, name_scores
+
+# Indicador -> (colunas, tipo). 'medida': diferença depois - antes;
+# 'faixa': diferença e mudança de faixa de renda; 'pratica': transição SIM/NÃO
+# (com mais de uma coluna, vale SIM em qualquer uma).
+WAVE_METRICS = {
+    'Área total (ha)': (('Area_Total_ha',), 'medida'),
+    'Área plantada (ha)': (('Tamanho_Area_Plantada_ha',), 'medida'),
+    'Renda familiar (R$)': (('Renda_Familiar_R$',), 'faixa'),
+    'Preço da farinha (R$/kg)': (('Preco_Farinha',), 'medida'),
+    'Calagem': (('Realiza calagem?',), 'pratica'),
+    'Adubação': (('Adubacao', 'Faz adubação Após plantio?'), 'pratica'),
+    'Assistência técnica': (('Assistencia_Tecnica',), 'pratica'),
+    'Incidência de pragas': (('Atualmente, há incidência de pragas da mandioca/macaxeira?',), 'pratica'),
+}
+
+TRANSITIONS = ('passou a fazer', 'deixou de fazer', 'manteve', 'não faz', 'sem resposta')
+BAND_CHANGES = ('subiu de faixa', 'caiu de faixa', 'mesma faixa', 'sem resposta')
+
+
+def _key_pairs(before, after):
+    """Pares (antes, depois, score) com a mesma chave de entrevista; score é a similaridade dos nomes (NaN sem nome)."""
+    before_keys = interview_keys(before).drop_duplicates()
+    after_keys = interview_keys(after).drop_duplicates()
+    exact = pd.merge(before_keys.rename_axis('antes').reset_index(name='chave'),
+                     after_keys.rename_axis('depois').reset_index(name='chave'), on='chave')
+    names = [frame[NAME_COLUMN].loc[exact[side]] if NAME_COLUMN in frame.columns else [pd.NA] * len(exact)
+             for frame, side in ((before, 'antes'), (after, 'depois'))]
+    return exact.assign(score=name_scores(*names))
+
+
+def _disagrees(exact):
+    return exact['score'] < LINK_THRESHOLD
+
+
+def link_waves(before, after):
+    """Pares de produtores entre duas ondas: DataFrame (antes, depois, metodo, score) com os rótulos do índice.
+
+    No par pela chave, score é a similaridade dos nomes (1 quando falta um dos nomes).
+    """
+    exact = _key_pairs(before, after)
+    # A mesma chave com outro nome é outra pessoa: os dois lados vão para a etapa do nome
+    exact = exact[~_disagrees(exact)]
+
+    # Sobras: nome aproximado dentro da mesma comunidade
+    rest_before, rest_after = before.drop(index=exact['antes']), after.drop(index=exact['depois'])
+    fuzzy = link_records(pd.DataFrame({'comunidade': rest_before['Comunidade'], 'nome': rest_before[NAME_COLUMN]}),
+                         pd.DataFrame({'comunidade': rest_after['Comunidade'], 'nome': rest_after[NAME_COLUMN]}))
+    fuzzy = fuzzy.rename(columns={'esquerda': 'antes', 'direita': 'depois'}).assign(metodo='nome')
+    exact = exact[['antes', 'depois']].assign(metodo='chave', score=exact['score'].fillna(1.0))
+    if fuzzy.empty or exact.empty:
+        return fuzzy if exact.empty else exact
+    return pd.concat([exact, fuzzy], ignore_index=True)
+
+
+def _flag(frame, columns):
+    """SIM/NÃO (booleano anulável) de uma prática; com várias colunas, SIM em qualquer uma."""
+    flags = []
+    for col in columns:
+        if col not in frame.columns:
+            continue
+        series = frame[col]
+        if pd.api.types.is_bool_dtype(series):
+            flags.append(series.astype('boolean'))
+        else:
+            flags.append(series.astype('string').str.strip().map({YES: True, NO: False}).astype('boolean'))
+    if not flags:
+        return None
+    result = flags[0]
+    for other in flags[1:]:
+        result = result | other
+    return result
+
+
+def _transitions(before, after):
+    known = (before.notna() & after.notna()).to_numpy(bool)
+    b, a = before.fillna(False).to_numpy(bool), after.fillna(False).to_numpy(bool)
+    labels = np.select([~known, ~b & a, b & ~a, b & a], TRANSITIONS[4:] + TRANSITIONS[:3], TRANSITIONS[3])
+    return pd.Categorical(labels, categories=TRANSITIONS)
+
+
+def compare_waves(before, after, links=None):
+    """Uma linha por produtor casado, com antes/depois/delta de cada indicador de WAVE_METRICS."""
+    links = link_waves(before, after) if links is None else links
+    b = before.loc[links['antes']].reset_index(drop=True)
+    a = after.loc[links['depois']].reset_index(drop=True)
+    columns = {
+        'Comunidade': a['Comunidade'].astype('string').fillna(b['Comunidade'].astype('string')),
+        'Produtor': a[NAME_COLUMN].astype('string').fillna(b[NAME_COLUMN].astype('string')),
+        'metodo': links['metodo'].to_numpy(),
+        'score': links['score'].to_numpy(),
+    }
+    for name, (cols, kind) in WAVE_METRICS.items():
+        if kind == 'pratica':
+            flag_before, flag_after = _flag(b, cols), _flag(a, cols)
+            if flag_before is None or flag_after is None:
+                continue
+            columns[f'{name} | antes'] = flag_before
+            columns[f'{name} | depois'] = flag_after
+            columns[f'{name} | transicao'] = _transitions(flag_before, flag_after)
+            continue
+        col = cols[0]
+        if col not in b.columns or col not in a.columns:
+            continue
+        value_before = pd.to_numeric(b[col], errors='coerce').astype(float)
+        value_after = pd.to_numeric(a[col], errors='coerce').astype(float)
+        columns[f'{name} | antes'] = value_before
+        columns[f'{name} | depois'] = value_after
+        columns[f'{name} | delta'] = value_after - value_before
+        if kind == 'faixa':
+            # Renda_Familiar_R$ é o valor representativo de cada faixa
+            delta = (value_after - value_before).to_numpy()
+            known = ~np.isnan(delta)
+            labels = np.select([~known, delta > 0, delta < 0], BAND_CHANGES[3:] + BAND_CHANGES[:2], BAND_CHANGES[2])
+            columns[f'{name} | faixa'] = pd.Categorical(labels, categories=BAND_CHANGES)
+    return pd.DataFrame(columns)
+
+
+def summarize_comparison(pairs, by=None):
+    """Resumo por indicador (e por `by`, ex.: 'Comunidade'): médias antes/depois e transições."""
+    groups = pairs[by] if by else pd.Series(0, index=pairs.index)
+    frames = []
+    for name, (_, kind) in WAVE_METRICS.items():
+        if f'{name} | antes' not in pairs.columns:
+            continue
+        before = pairs[f'{name} | antes'].astype('Float64')
+        after = pairs[f'{name} | depois'].astype('Float64')
+        if kind == 'pratica':
+            # Booleanos viram % de produtores que fazem a prática
+            before, after = before * 100, after * 100
+        columns = {'n': before.notna() & after.notna(), 'antes': before, 'depois': after}
+        aggregations = {'n': 'sum', 'antes': 'mean', 'depois': 'mean'}
+        if kind == 'pratica':
+            transition = pairs[f'{name} | transicao']
+            columns.update({label: transition == label for label in TRANSITIONS[:2]})
+            aggregations.update({label: 'sum' for label in TRANSITIONS[:2]})
+        else:
+            delta = pairs[f'{name} | delta']
+            columns.update(delta_medio=delta, delta_mediano=delta)
+            aggregations.update(delta_medio='mean', delta_mediano='median')
+            if kind == 'faixa':
+                band = pairs[f'{name} | faixa']
+                columns.update({label: band == label for label in BAND_CHANGES[:2]})
+                aggregations.update({label: 'sum' for label in BAND_CHANGES[:2]})
+        summary = pd.DataFrame(columns).groupby(groups, observed=True, sort=True).agg(aggregations)
+        frames.append(summary.assign(indicador=name, tipo=kind))
+
+    summary = pd.concat(frames)
+    summary['variacao'] = summary['depois'] - summary['antes']
+    leading = ['indicador', 'tipo', 'n', 'antes', 'depois', 'variacao']
+    summary = summary[leading + [c for c in summary.columns if c not in leading]]
+    if not by:
+        return summary.reset_index(drop=True)
+    # Agrupado pela coluna, mantendo a ordem dos indicadores de WAVE_METRICS
+    return summary.rename_axis(by).reset_index().sort_values(by, kind='stable', ignore_index=True)
+
+
+def link_report(links, before, after):
+    """Casados por chave e por nome, pares de chave igual com nomes diferentes (descartados) e sem par em cada onda."""
+    methods = links['metodo'].value_counts()
+    return {
+        'por_chave': int(methods.get('chave', 0)),
+        'por_nome': int(methods.get('nome', 0)),
+        'chave_divergente': int(_disagrees(_key_pairs(before, after)).sum()),
+        'so_antes': len(before) - len(links),
+        'so_depois': len(after) - len(links),
+    }
+
+
+def main():
+    import ingest
+    from data_pipeline import DEFAULT_MUNICIPIO
+
+    parser = argparse.ArgumentParser(description='Compara duas ondas da pesquisa (antes/depois por produtor).')
+    parser.add_argument('--municipio', default=DEFAULT_MUNICIPIO)
+    parser.add_argument('--antes', required=True)
+    parser.add_argument('--depois', required=True)
+    parser.add_argument('--por-comunidade', action='store_true')
+    args = parser.parse_args()
+
+    before = ingest.load_store(municipios=[args.municipio], ondas=[args.antes])
+    after = ingest.load_store(municipios=[args.municipio], ondas=[args.depois])
+    links = link_waves(before, after)
+    pairs = compare_waves(before, after, links)
+    print(link_report(links, before, after))
+    summary = summarize_comparison(pairs, by='Comunidade' if args.por_comunidade else None)
+    print(summary.to_string(index=False, float_format=lambda v: f'{v:.2f}'))
+
+
+if __name__ == '__main__':
+    main()